@@ -0,0 +1,72 @@
+"""add extraction runs and column checkpoints
+
+Revision ID: 2d8f6a4c0b91
+Revises: e7a3b9d15c62
+Create Date: 2026-10-16 20:41:12.907355
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '2d8f6a4c0b91'
+down_revision = 'e7a3b9d15c62'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Record extraction runs and the column profiles they completed.'''
+
+    op.create_table(
+        'extraction_run',
+        sa.Column('run_id', sa.Text, primary_key=True),
+        sa.Column('data_table_id', sa.Integer, nullable=False),
+        sa.Column('options', postgresql.JSONB),
+        sa.Column('created_by', sa.Text),
+        sa.Column('date_created', sa.TIMESTAMP),
+        sa.Column('date_completed', sa.TIMESTAMP),
+        schema=SCHEMA_NAME
+    )
+
+    op.create_foreign_key(
+        'extraction_run_data_table_fk',
+        'extraction_run',
+        'data_table',
+        ['data_table_id'],
+        ['data_table_id'],
+        source_schema=SCHEMA_NAME,
+        referent_schema=SCHEMA_NAME,
+    )
+
+    op.create_table(
+        'column_checkpoint',
+        sa.Column('run_id', sa.Text, primary_key=True),
+        sa.Column('column_name', sa.Text, primary_key=True),
+        sa.Column('data_type', sa.Text),
+        sa.Column('column_type', sa.Text),
+        sa.Column('stats', postgresql.JSONB),
+        sa.Column('date_created', sa.TIMESTAMP),
+        schema=SCHEMA_NAME
+    )
+
+    op.create_foreign_key(
+        'column_checkpoint_extraction_run_fk',
+        'column_checkpoint',
+        'extraction_run',
+        ['run_id'],
+        ['run_id'],
+        source_schema=SCHEMA_NAME,
+        referent_schema=SCHEMA_NAME,
+    )
+
+
+def downgrade():
+    '''Drop extraction runs and column checkpoints.'''
+
+    op.drop_table('column_checkpoint', schema=SCHEMA_NAME)
+    op.drop_table('extraction_run', schema=SCHEMA_NAME)
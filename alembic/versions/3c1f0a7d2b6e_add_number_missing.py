@@ -0,0 +1,34 @@
+"""add number_missing to column_info
+
+Revision ID: 3c1f0a7d2b6e
+Revises: 0fbe9f4e9934
+Create Date: 2026-10-16 09:12:31.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f0a7d2b6e'
+down_revision = '0fbe9f4e9934'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Add the count of null values to column_info.'''
+
+    op.add_column(
+        'column_info',
+        sa.Column('number_missing', sa.BigInteger),
+        schema=SCHEMA_NAME,
+    )
+
+
+def downgrade():
+    '''Drop the count of null values from column_info.'''
+
+    op.drop_column('column_info', 'number_missing', schema=SCHEMA_NAME)
@@ -0,0 +1,39 @@
+"""add other code bucket to code frequency
+
+Revision ID: 5b7e3f2a9c14
+Revises: 8e2d4b9c51fa
+Create Date: 2026-10-16 14:05:37.918204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e3f2a9c14'
+down_revision = '8e2d4b9c51fa'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Flag the row counting the codes left out of the top codes.'''
+
+    op.add_column(
+        'code_frequency',
+        sa.Column(
+            'is_other',
+            sa.Boolean,
+            nullable=False,
+            server_default=sa.false(),
+        ),
+        schema=SCHEMA_NAME,
+    )
+
+
+def downgrade():
+    '''Drop the other code flag.'''
+
+    op.drop_column('code_frequency', 'is_other', schema=SCHEMA_NAME)
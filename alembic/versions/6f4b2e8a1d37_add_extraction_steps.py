@@ -0,0 +1,61 @@
+"""add extraction steps
+
+Revision ID: 6f4b2e8a1d37
+Revises: 2d8f6a4c0b91
+Create Date: 2026-10-16 22:05:48.311920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f4b2e8a1d37'
+down_revision = '2d8f6a4c0b91'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Record the wall time of runs and of the steps of their extraction.'''
+
+    op.add_column(
+        'extraction_run',
+        sa.Column('seconds', sa.Float),
+        schema=SCHEMA_NAME
+    )
+
+    op.create_table(
+        'extraction_step',
+        sa.Column('step_id', sa.BigInteger, primary_key=True),
+        sa.Column('run_id', sa.Text, nullable=False),
+        sa.Column('column_name', sa.Text),
+        sa.Column('phase', sa.Text, nullable=False),
+        sa.Column('depth', sa.Integer),
+        sa.Column('start_seconds', sa.Float),
+        sa.Column('seconds', sa.Float),
+        sa.Column('rows_fetched', sa.BigInteger),
+        sa.Column('bytes_fetched', sa.BigInteger),
+        sa.Column('query_count', sa.Integer),
+        sa.Column('date_created', sa.TIMESTAMP),
+        schema=SCHEMA_NAME
+    )
+
+    op.create_foreign_key(
+        'extraction_step_extraction_run_fk',
+        'extraction_step',
+        'extraction_run',
+        ['run_id'],
+        ['run_id'],
+        source_schema=SCHEMA_NAME,
+        referent_schema=SCHEMA_NAME,
+    )
+
+
+def downgrade():
+    '''Drop extraction steps and the wall time of runs.'''
+
+    op.drop_table('extraction_step', schema=SCHEMA_NAME)
+    op.drop_column('extraction_run', 'seconds', schema=SCHEMA_NAME)
@@ -0,0 +1,51 @@
+"""add estimated flags to extracted metadata
+
+Revision ID: 8e2d4b9c51fa
+Revises: 3c1f0a7d2b6e
+Create Date: 2026-10-16 11:40:02.524117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2d4b9c51fa'
+down_revision = '3c1f0a7d2b6e'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+# Tables holding metadata which can be estimated from planner statistics.
+TABLE_NAMES = [
+    'data_table',
+    'column_info',
+    'numeric_column',
+    'text_column',
+    'date_column',
+    'code_frequency',
+]
+
+
+def upgrade():
+    '''Flag metadata estimated from planner statistics.'''
+
+    for table_name in TABLE_NAMES:
+        op.add_column(
+            table_name,
+            sa.Column(
+                'estimated',
+                sa.Boolean,
+                nullable=False,
+                server_default=sa.false(),
+            ),
+            schema=SCHEMA_NAME,
+        )
+
+
+def downgrade():
+    '''Drop the estimated flags.'''
+
+    for table_name in TABLE_NAMES:
+        op.drop_column(table_name, 'estimated', schema=SCHEMA_NAME)
@@ -0,0 +1,34 @@
+"""add change fingerprint to data table
+
+Revision ID: a41c6d8e7b23
+Revises: 5b7e3f2a9c14
+Create Date: 2026-10-16 16:22:08.451907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41c6d8e7b23'
+down_revision = '5b7e3f2a9c14'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Record the state of a data table when its metadata was extracted.'''
+
+    op.add_column(
+        'data_table',
+        sa.Column('fingerprint', sa.Text),
+        schema=SCHEMA_NAME,
+    )
+
+
+def downgrade():
+    '''Drop the change fingerprint.'''
+
+    op.drop_column('data_table', 'fingerprint', schema=SCHEMA_NAME)
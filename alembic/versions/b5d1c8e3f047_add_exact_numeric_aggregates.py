@@ -0,0 +1,47 @@
+"""add exact numeric flags of aggregates
+
+Revision ID: b5d1c8e3f047
+Revises: 6f4b2e8a1d37
+Create Date: 2026-10-17 10:12:31.540218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d1c8e3f047'
+down_revision = '6f4b2e8a1d37'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Record whether stored aggregates sum numeric values exactly.'''
+
+    op.add_column(
+        'data_table',
+        sa.Column('exact_numeric', sa.Boolean),
+        schema=SCHEMA_NAME
+    )
+    op.add_column(
+        'data_partition',
+        sa.Column('exact_numeric', sa.Boolean),
+        schema=SCHEMA_NAME
+    )
+
+    # Aggregates stored so far were summed as NUMERIC.
+    op.execute("""
+        UPDATE metabase.data_table SET exact_numeric = TRUE
+        WHERE watermark_column IS NOT NULL;
+        UPDATE metabase.data_partition SET exact_numeric = TRUE;
+    """)
+
+
+def downgrade():
+    '''Drop the exact numeric flags of aggregates.'''
+
+    op.drop_column('data_partition', 'exact_numeric', schema=SCHEMA_NAME)
+    op.drop_column('data_table', 'exact_numeric', schema=SCHEMA_NAME)
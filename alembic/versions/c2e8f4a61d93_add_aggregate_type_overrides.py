@@ -0,0 +1,36 @@
+"""add type overrides of stored aggregates
+
+Revision ID: c2e8f4a61d93
+Revises: b5d1c8e3f047
+Create Date: 2026-10-17 14:03:12.417583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e8f4a61d93'
+down_revision = 'b5d1c8e3f047'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Record the type overrides the stored aggregates were profiled with.'''
+
+    # Null for aggregates stored so far, which are aggregated again.
+    op.add_column(
+        'data_table',
+        sa.Column('type_overrides', postgresql.JSONB),
+        schema=SCHEMA_NAME
+    )
+
+
+def downgrade():
+    '''Drop the type overrides of stored aggregates.'''
+
+    op.drop_column('data_table', 'type_overrides', schema=SCHEMA_NAME)
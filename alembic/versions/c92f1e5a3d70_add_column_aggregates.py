@@ -0,0 +1,72 @@
+"""add mergeable column aggregates and watermarks
+
+Revision ID: c92f1e5a3d70
+Revises: a41c6d8e7b23
+Create Date: 2026-10-16 17:48:51.206334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c92f1e5a3d70'
+down_revision = 'a41c6d8e7b23'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Store partial aggregates to extract appended rows incrementally.'''
+
+    op.add_column(
+        'data_table',
+        sa.Column('watermark_column', sa.Text),
+        schema=SCHEMA_NAME,
+    )
+    op.add_column(
+        'data_table',
+        sa.Column('watermark_value', sa.Text),
+        schema=SCHEMA_NAME,
+    )
+
+    op.create_table(
+        'column_aggregate',
+        sa.Column('data_table_id', sa.Integer, primary_key=True),
+        sa.Column('column_name', sa.Text, primary_key=True),
+        sa.Column('data_type', sa.Text),
+        sa.Column('row_count', sa.BigInteger),
+        sa.Column('null_count', sa.BigInteger),
+        sa.Column('value_sum', sa.Numeric),
+        sa.Column('value_sum_squares', sa.Numeric),
+        sa.Column('min_value', sa.Text),
+        sa.Column('max_value', sa.Text),
+        sa.Column('min_length', sa.Integer),
+        sa.Column('max_length', sa.Integer),
+        sa.Column('quantile_sketch', postgresql.JSONB),
+        sa.Column('code_frequencies', postgresql.JSONB),
+        sa.Column('updated_by', sa.Text),
+        sa.Column('date_last_updated', sa.TIMESTAMP),
+        schema=SCHEMA_NAME
+    )
+
+    op.create_foreign_key(
+        'column_aggregate_data_table_fk',
+        'column_aggregate',
+        'data_table',
+        ['data_table_id'],
+        ['data_table_id'],
+        source_schema=SCHEMA_NAME,
+        referent_schema=SCHEMA_NAME,
+    )
+
+
+def downgrade():
+    '''Drop the partial aggregates and watermarks.'''
+
+    op.drop_table('column_aggregate', schema=SCHEMA_NAME)
+    op.drop_column('data_table', 'watermark_value', schema=SCHEMA_NAME)
+    op.drop_column('data_table', 'watermark_column', schema=SCHEMA_NAME)
@@ -0,0 +1,36 @@
+"""add profiling options of table fingerprints
+
+Revision ID: d9a4f1c7e285
+Revises: c2e8f4a61d93
+Create Date: 2026-10-17 15:41:08.236914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a4f1c7e285'
+down_revision = 'c2e8f4a61d93'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Record the profiling options the fingerprinted metadata used.'''
+
+    # Null for tables extracted so far, which are not skipped once.
+    op.add_column(
+        'data_table',
+        sa.Column('fingerprint_options', postgresql.JSONB),
+        schema=SCHEMA_NAME
+    )
+
+
+def downgrade():
+    '''Drop the profiling options of table fingerprints.'''
+
+    op.drop_column('data_table', 'fingerprint_options', schema=SCHEMA_NAME)
@@ -0,0 +1,84 @@
+"""add per-partition aggregates
+
+Revision ID: e7a3b9d15c62
+Revises: c92f1e5a3d70
+Create Date: 2026-10-16 19:05:37.284610
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3b9d15c62'
+down_revision = 'c92f1e5a3d70'
+branch_labels = None
+depends_on = None
+
+SCHEMA_NAME = 'metabase'
+
+
+def upgrade():
+    '''Cache the aggregates of every partition of a partitioned table.'''
+
+    # Aggregates of the whole table have an empty partition name.
+    op.add_column(
+        'column_aggregate',
+        sa.Column('partition_name', sa.Text, nullable=False,
+                  server_default=''),
+        schema=SCHEMA_NAME,
+    )
+    op.drop_constraint(
+        'column_aggregate_pkey',
+        'column_aggregate',
+        schema=SCHEMA_NAME,
+    )
+    op.create_primary_key(
+        'column_aggregate_pkey',
+        'column_aggregate',
+        ['data_table_id', 'partition_name', 'column_name'],
+        schema=SCHEMA_NAME,
+    )
+
+    op.create_table(
+        'data_partition',
+        sa.Column('data_table_id', sa.Integer, primary_key=True),
+        sa.Column('partition_name', sa.Text, primary_key=True),
+        sa.Column('fingerprint', sa.Text),
+        sa.Column('categorical_threshold', sa.Integer),
+        sa.Column('type_overrides', postgresql.JSONB),
+        sa.Column('updated_by', sa.Text),
+        sa.Column('date_last_updated', sa.TIMESTAMP),
+        schema=SCHEMA_NAME
+    )
+
+    op.create_foreign_key(
+        'data_partition_data_table_fk',
+        'data_partition',
+        'data_table',
+        ['data_table_id'],
+        ['data_table_id'],
+        source_schema=SCHEMA_NAME,
+        referent_schema=SCHEMA_NAME,
+    )
+
+
+def downgrade():
+    '''Drop the per-partition aggregates.'''
+
+    op.drop_table('data_partition', schema=SCHEMA_NAME)
+    op.execute(
+        "DELETE FROM metabase.column_aggregate WHERE partition_name <> ''")
+    op.drop_constraint(
+        'column_aggregate_pkey',
+        'column_aggregate',
+        schema=SCHEMA_NAME,
+    )
+    op.create_primary_key(
+        'column_aggregate_pkey',
+        'column_aggregate',
+        ['data_table_id', 'column_name'],
+        schema=SCHEMA_NAME,
+    )
+    op.drop_column('column_aggregate', 'partition_name', schema=SCHEMA_NAME)
@@ -0,0 +1,177 @@
+"""Script benchmarking metadata extraction on synthetic tables.
+
+A throwaway PostgreSQL server is started with testing.postgresql and the
+metabase tables are created in it with the alembic migrations. For every
+combination of the given row counts, column counts, type mixes, null ratios
+and cardinalities, a synthetic table is generated (see
+`metabase.benchmark_helper`), then extracted with
+`ExtractMetadata.process_table` and exported with `export_table_metadata`
+--repeat times, each time in a fresh Python process:
+
+python benchmark.py --rows 1000 1000000 --columns 4 16 --mixes mixed text
+
+One JSON object is written per extraction and line, with the commit, the
+case and the options of the extraction, wall times in seconds, rows per
+second of `process_table`, peak RSS of the extracting process in kilobytes
+(not counting the server) and the queries, rows and bytes executed and
+fetched by `process_table`. Tables are generated from a fixed seed, so
+results of the same case can be compared across commits.
+
+"""
+
+import datetime
+import itertools
+import json
+import multiprocessing
+import platform
+import sys
+
+import alembic.command
+from alembic.config import Config
+import psycopg2
+import testing.postgresql
+
+from metabase import benchmark_helper
+from metabase import parse_input
+
+
+SCHEMA_NAME = 'data'
+TABLE_NAME = 'benchmark'
+
+
+def create_metabase(connection_string):
+    """Create the metabase tables and the schema of synthetic tables."""
+
+    conn = psycopg2.connect(connection_string)
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute('CREATE SCHEMA metabase; CREATE SCHEMA data;')
+    finally:
+        conn.close()
+
+    alembic_cfg = Config()
+    alembic_cfg.set_main_option('script_location', 'alembic')
+    alembic_cfg.set_main_option('sqlalchemy.url', connection_string)
+    alembic.command.upgrade(alembic_cfg, 'head')
+
+
+def run_case(connection_string, case, process_table_kwargs, repeat):
+    """Generate the synthetic table of a case and extract it.
+
+    Returns:
+        ([dict]): Measures of every extraction, see
+            `benchmark_helper.run_extraction`.
+
+    """
+    conn = psycopg2.connect(connection_string)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            benchmark_helper.create_synthetic_table(
+                cursor,
+                SCHEMA_NAME,
+                TABLE_NAME,
+                **case
+            )
+            cursor.execute(
+                """
+                INSERT INTO metabase.data_table
+                    (data_table_id, file_table_name)
+                VALUES (1, %(file_table_name)s)
+                """,
+                {'file_table_name': SCHEMA_NAME + '.' + TABLE_NAME},
+            )
+
+        # A fresh process per extraction, so that its peak RSS is measured
+        # on its own.
+        context = multiprocessing.get_context('spawn')
+        measures = []
+        for _ in range(repeat):
+            with context.Pool(1) as pool:
+                measures.append(pool.apply(
+                    benchmark_helper.run_extraction,
+                    (connection_string, 1, process_table_kwargs),
+                ))
+
+        return measures
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                TRUNCATE TABLE metabase.data_table CASCADE;
+                DROP TABLE IF EXISTS data.benchmark;
+                """
+            )
+        conn.close()
+
+
+def run_benchmarks(args, output):
+    """Run every case of the benchmark, writing results to output."""
+
+    process_table_kwargs = {
+        'categorical_threshold': args.categorical,
+        'single_scan': args.single_scan,
+        'estimate': args.estimate,
+        'quantile_method': args.quantile_method,
+        'workers': args.workers,
+        'block_ranges': args.block_ranges,
+        'max_memory': parse_input.get_max_memory(args),
+        'exact_numeric': args.exact_numeric,
+    }
+    commit = benchmark_helper.get_commit()
+
+    with testing.postgresql.Postgresql() as postgresql:
+        connection_string = postgresql.url()
+        create_metabase(connection_string)
+
+        conn = psycopg2.connect(connection_string)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SHOW server_version')
+                server_version = cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+        for n_rows, n_columns, mix, null_ratio, cardinality in \
+                itertools.product(args.rows, args.columns, args.mixes,
+                                  args.null_ratios, args.cardinalities):
+            case = {
+                'n_rows': n_rows,
+                'n_columns': n_columns,
+                'mix': mix,
+                'null_ratio': null_ratio,
+                'cardinality': cardinality,
+            }
+            measures = run_case(
+                connection_string,
+                case,
+                process_table_kwargs,
+                args.repeat,
+            )
+            for repetition, measure in enumerate(measures):
+                result = {
+                    'commit': commit,
+                    'date': datetime.datetime.now().isoformat(),
+                    'python_version': platform.python_version(),
+                    'server_version': server_version,
+                    'repetition': repetition,
+                    'options': process_table_kwargs,
+                }
+                result.update(case)
+                result.update(measure)
+                result['rows_per_second'] = \
+                    n_rows / measure['process_seconds']
+                output.write(json.dumps(result, sort_keys=True) + '\n')
+                output.flush()
+
+
+if __name__ == "__main__":
+
+    args = parse_input.parse_benchmark_args(sys.argv[1:])
+
+    if args.output is None:
+        run_benchmarks(args, sys.stdout)
+    else:
+        with open(args.output, 'a') as output:
+            run_benchmarks(args, output)
@@ -16,27 +16,78 @@ select * from metabase.text_column where data_table_id =  <data_table_id>;
 select * from metabase.date_column where data_table_id = <data_table_id>;
 select * from metabase.code_frequency where data_table_id = <data_table_id>;
 
+In batch mode (--schema_all <schema> or --manifest <file>), every table of the
+schema or the manifest is registered and extracted, --table_workers tables at
+a time, and a per-table summary is printed. The exit status is 1 if any table
+failed.
+
+With --watermark_column <column>, the table keeps its data_table_id across runs
+and, when it only had rows appended since the last run, only the rows past the
+largest value of the column then are aggregated.
+
+With --checkpoint, a single table extraction is a run whose ID is displayed.
+Columns profiled one by one are checkpointed as they complete, so an
+interrupted run continues from its first unfinished column with
+--resume <run_id>, using the options it was started with. Checkpoints are
+deleted when the run completes.
+
+With --timing, the wall time of every phase of the extraction, with the
+queries, rows and bytes it executed and fetched, is stored per column in
+metabase.extraction_step, under the ID of the run, or of a new run without
+--checkpoint:
+
+select * from metabase.extraction_step where run_id in (
+    select run_id from metabase.extraction_run
+    where data_table_id = <data_table_id>);
+
+With --max_memory_mb, rows streamed out of the database, e.g. to compute
+medians with --quantile_method kll, are fetched in batches taking at most that
+many megabytes, so that tables of any size are extracted in bounded memory.
+
+Means and medians of numeric columns are aggregated as double precision
+floats, keeping 15 significant digits, and minimums and maximums as exact
+decimals. With --exact_numeric, means, and medians with --quantile_method
+exact, are aggregated as exact decimals too, more slowly, e.g. for currency
+amounts. Incremental, partitioned and block range extractions then sum values
+exactly, but still compute medians with quantile sketches.
+
 """
 
 import sys
+import uuid
 
 import sqlalchemy
 
+from metabase import batch_extract
+from metabase import estimate_metadata_helper
 from metabase import extract_metadata
 from metabase import parse_input
 
 
-def update_data_table(full_table_name):
+def update_data_table(full_table_name, reuse_existing=False):
     """Update meatabase.data_table with this new table.
 
     This function is not intended to be part of the final metabase design but
     it is useful for testing in this stage.
 
+    With `reuse_existing`, the latest data_table_id of a table already in
+    metabase.data_table is returned instead.
 
     """
 
     engine = sqlalchemy.create_engine(
         'postgres://metaadmin@localhost/postgres')
+
+    if reuse_existing:
+        existing_id = engine.execute(
+            """
+            SELECT MAX(data_table_id) FROM metabase.data_table
+            WHERE file_table_name = %(file_table_name)s
+            """,
+            {'file_table_name': full_table_name},
+        ).fetchall()[0][0]
+        if existing_id is not None:
+            return existing_id
     max_id = engine.execute(
         'SELECT MAX(data_table_id) FROM metabase.data_table'
     ).fetchall()[0][0]
@@ -69,32 +120,182 @@ def update_data_table(full_table_name):
     return new_id
 
 
+def select_run(run_id):
+    """Return the data_table_id and options of an extraction run."""
+
+    engine = sqlalchemy.create_engine(
+        'postgres://metaadmin@localhost/postgres')
+
+    result = engine.execute(
+        """
+        SELECT data_table_id, options
+        FROM metabase.extraction_run
+        WHERE run_id = %(run_id)s
+        """,
+        {'run_id': run_id},
+    ).fetchall()
+    if not result:
+        raise ValueError('Run {} not found in metabase.extraction_run'.format(
+            run_id))
+
+    return tuple(result[0])
+
+
+def extract_batch(args):
+    """Register and extract all the tables of a schema or a manifest.
+
+    Tables are processed by `args.table_workers` workers sharing connection
+    pools, largest tables first. A summary of every table is printed at the
+    end.
+
+    Returns:
+        (bool): True if every table succeeded.
+
+    """
+    data_pool, metabase_pool = batch_extract.create_connection_pools(
+        args.table_workers, args.workers)
+    try:
+        data_conn = data_pool.getconn()
+        try:
+            with data_conn.cursor() as data_cur:
+                if args.manifest is not None:
+                    full_table_names = parse_input.parse_manifest(
+                        args.manifest)
+                else:
+                    full_table_names = batch_extract.list_schema_tables(
+                        data_cur, args.schema_all)
+                table_costs = estimate_metadata_helper.get_table_costs(
+                    data_cur, full_table_names)
+        finally:
+            data_conn.rollback()
+            data_pool.putconn(data_conn)
+
+        metabase_conn = metabase_pool.getconn()
+        try:
+            with metabase_conn:
+                with metabase_conn.cursor() as metabase_cur:
+                    data_table_ids = batch_extract.register_tables(
+                        metabase_cur,
+                        full_table_names,
+                        reuse_existing=(args.skip_unchanged
+                                        or args.watermark_column is not None),
+                    )
+        finally:
+            metabase_pool.putconn(metabase_conn)
+
+        table_results = batch_extract.extract_tables(
+            data_table_ids,
+            table_workers=args.table_workers,
+            data_pool=data_pool,
+            metabase_pool=metabase_pool,
+            table_costs=table_costs,
+            categorical_threshold=args.categorical,
+            single_scan=args.single_scan,
+            estimate=args.estimate,
+            analyze=args.analyze,
+            quantile_method=args.quantile_method,
+            workers=args.workers,
+            max_codes=args.max_codes,
+            skip_unchanged=args.skip_unchanged,
+            watermark_column=args.watermark_column,
+            block_ranges=args.block_ranges,
+            instrument=args.timing,
+            max_memory=parse_input.get_max_memory(args),
+            exact_numeric=args.exact_numeric,
+        )
+    finally:
+        data_pool.closeall()
+        metabase_pool.closeall()
+
+    print(batch_extract.format_summary(table_results))
+
+    return all(result.error is None for result in table_results)
+
+
 if __name__ == "__main__":
 
     args = parse_input.parse_command_line_args(sys.argv[1:])
-    full_table_name = parse_input.derive_full_table_name(args)
+
+    if args.schema_all is not None or args.manifest is not None:
+        sys.exit(0 if extract_batch(args) else 1)
+
     categorical_threshold = args.categorical
     input_file = args.input_file
     type_overrides = {}
+    categ_threshold_config = None
+    gmeta_output = None
+    quantile_method = args.quantile_method
+    max_codes = args.max_codes
+    exact_numeric = args.exact_numeric
 
-    if input_file is not None:
-        file_parser = parse_input.ParseInput()
-        file_parser.parse(input_file)
-        type_overrides = file_parser.type_overrides
-        categ_threshold_config = file_parser.categorical_threshold
-        gmeta_output = file_parser.gmeta_output
+    if args.resume is not None:
+        run_id = args.resume
+        new_id, run_options = select_run(run_id)
+        # Not recorded by runs started before they were.
+        table_options = {key: run_options[key]
+                         for key in ['full_table_name', 'gmeta_output']
+                         if key in run_options}
+        full_table_name = table_options.get(
+            'full_table_name', 'data_table_id {}'.format(new_id))
+        gmeta_output = table_options.get('gmeta_output')
+        categorical_threshold = run_options['categorical_threshold']
+        type_overrides = run_options['type_overrides']
+        quantile_method = run_options['quantile_method']
+        max_codes = run_options['max_codes']
+        exact_numeric = run_options.get('exact_numeric', False)
+    else:
+        full_table_name = parse_input.derive_full_table_name(args)
 
-    new_id = update_data_table(full_table_name)
+        if input_file is not None:
+            file_parser = parse_input.ParseInput()
+            file_parser.parse(input_file)
+            type_overrides = file_parser.type_overrides
+            categ_threshold_config = file_parser.categorical_threshold
+            gmeta_output = file_parser.gmeta_output
 
-    # Extract metadata from data.
-    if categ_threshold_config:
-        categorical_threshold = categ_threshold_config
+        new_id = update_data_table(
+            full_table_name,
+            args.skip_unchanged or args.watermark_column is not None,
+        )
+
+        # Extract metadata from data.
+        if categ_threshold_config:
+            categorical_threshold = categ_threshold_config
+
+        # Recorded with the run, to be restored when resuming it.
+        table_options = {
+            'full_table_name': full_table_name,
+            'gmeta_output': gmeta_output,
+        }
+        run_id = None
+        if args.checkpoint:
+            run_id = uuid.uuid4().hex
+            print('Run ID is {}. Resume it if interrupted with --resume {}'
+                  .format(run_id, run_id))
 
     extract = extract_metadata.ExtractMetadata(data_table_id=new_id)
 
-    extract.process_table(
+    processed = extract.process_table(
         categorical_threshold=categorical_threshold,
-        type_overrides=type_overrides)
+        type_overrides=type_overrides,
+        single_scan=args.single_scan,
+        estimate=args.estimate,
+        analyze=args.analyze,
+        quantile_method=quantile_method,
+        workers=args.workers,
+        max_codes=max_codes,
+        skip_unchanged=args.skip_unchanged,
+        watermark_column=args.watermark_column,
+        block_ranges=args.block_ranges,
+        run_id=run_id,
+        instrument=args.timing,
+        max_memory=parse_input.get_max_memory(args),
+        exact_numeric=exact_numeric,
+        run_options=table_options)
+
+    if not processed:
+        print('{} is unchanged since its last extraction.'.format(
+            full_table_name))
 
     # Export metadata as Gmeta in JSON.
     if gmeta_output:
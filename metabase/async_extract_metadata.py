@@ -0,0 +1,135 @@
+"""Class to extract metadata from a Data Table within an asyncio event loop.
+
+`AsyncExtractMetadata` runs the blocking psycopg2 work of `ExtractMetadata`
+in an executor, so awaiting it never blocks the event loop, and profiles the
+columns of a table concurrently over a pool of data connections with the
+`workers` argument. Since the same queries are issued, the stored metadata
+is identical to the one of `ExtractMetadata`.
+"""
+
+import asyncio
+import functools
+
+from . import extract_metadata
+
+
+class AsyncExtractMetadata():
+    """Class to extract metadata from a Data Table with asyncio.
+
+    Used as an asynchronous context manager, the data connection is kept
+    for every call within the block and only released on exit:
+
+        async with AsyncExtractMetadata(data_table_id) as extract:
+            await extract.process_table()
+            await extract.export_table_metadata(output_filepath)
+
+    Calls within the block share the data connection, so they run one at
+    a time, in the order they were awaited. Otherwise every call borrows
+    connections for itself only, and calls run concurrently.
+
+    """
+
+    def __init__(self, data_table_id, data_pool=None, metabase_pool=None,
+                 executor=None):
+        """Set Data Table ID.
+
+        Connections are only opened by awaited calls.
+
+        Args:
+           data_table_id (int): ID associated with this Data Table.
+           data_pool (psycopg2.pool.AbstractConnectionPool): Pool to borrow
+               the data connection from instead of connecting.
+           metabase_pool (psycopg2.pool.AbstractConnectionPool): Pool to
+               borrow metabase connections from instead of connecting.
+           executor (concurrent.futures.Executor): Executor running the
+               blocking calls. The default executor of the loop if None.
+
+        """
+        self.data_table_id = data_table_id
+        self.data_pool = data_pool
+        self.metabase_pool = metabase_pool
+        self.executor = executor
+
+        # ExtractMetadata of the `async with` block, if any, and the lock
+        # serializing the calls sharing it.
+        self._extract = None
+        self._lock = None
+
+    async def __aenter__(self):
+        self._lock = asyncio.Lock()
+        self._extract = self._create_extract()
+        self._extract.__enter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        """Release the data connection kept within the block, if any."""
+
+        if self._extract is None:
+            return
+
+        async with self._lock:
+            extract, self._extract = self._extract, None
+            await self._run_in_executor(extract.__exit__, None, None, None)
+
+    def _create_extract(self):
+        """Return an ExtractMetadata of this Data Table.
+
+        It only connects when its methods are called.
+
+        """
+        return extract_metadata.ExtractMetadata(
+            self.data_table_id,
+            data_pool=self.data_pool,
+            metabase_pool=self.metabase_pool,
+        )
+
+    async def _run_in_executor(self, func, *args, **kwargs):
+        """Await a blocking call run in the executor."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(func, *args, **kwargs),
+        )
+
+    async def _call(self, method_name, *args, **kwargs):
+        """Await a method of ExtractMetadata.
+
+        The ExtractMetadata of the `async with` block is used if any, by
+        one call at a time. Otherwise one is created for the call and closed
+        after it.
+
+        """
+        if self._extract is not None:
+            async with self._lock:
+                # Unless the block was closed meanwhile.
+                if self._extract is not None:
+                    return await self._run_in_executor(
+                        getattr(self._extract, method_name), *args,
+                        **kwargs)
+
+        def call():
+            with self._create_extract() as extract:
+                return getattr(extract, method_name)(*args, **kwargs)
+
+        return await self._run_in_executor(call)
+
+    async def process_table(self, *args, **kwargs):
+        """Update the metabase with metadata from this Data Table.
+
+        Takes the arguments of `ExtractMetadata.process_table`. Use
+        `workers` to profile several columns at once.
+
+        Returns:
+            (bool): False if the table was skipped as unchanged.
+
+        """
+        return await self._call('process_table', *args, **kwargs)
+
+    async def export_table_metadata(self, output_filepath):
+        """Export GMETA (metadata in JSON format) for a processed table."""
+
+        await self._call('export_table_metadata', output_filepath)
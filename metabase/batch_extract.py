@@ -0,0 +1,216 @@
+"""Functions to extract metadata from many Data Tables in one process.
+
+Tables are registered in the metabase at once, then processed by a pool of
+worker threads, each table by its own `ExtractMetadata`. Data and metabase
+connections are borrowed from pools shared by all the workers instead of
+being opened for every table.
+"""
+
+from collections import namedtuple
+from concurrent import futures
+import time
+
+from . import connection_pools
+from . import estimate_metadata_helper
+from . import extract_metadata
+from . import settings
+
+
+TableResult = namedtuple(
+    'table_result',
+    ['data_table_id', 'full_table_name', 'error', 'seconds', 'skipped'],
+)
+
+
+def list_schema_tables(data_cursor, schema_name):
+    """Return the full names of the tables of a schema, in name order."""
+
+    data_cursor.execute(
+        """
+        SELECT table_schema || '.' || table_name
+        FROM INFORMATION_SCHEMA.TABLES
+        WHERE
+            table_schema = %(schema)s
+            AND table_type = 'BASE TABLE'
+        ORDER BY table_name;
+        """,
+        {'schema': schema_name},
+    )
+
+    return [full_table_name for (full_table_name,) in data_cursor.fetchall()]
+
+
+def register_tables(metabase_cursor, full_table_names, reuse_existing=False):
+    """Add tables to metabase.data_table with new, consecutive IDs.
+
+    Args:
+        reuse_existing (bool): Return the latest ID of tables already in
+            metabase.data_table instead of adding them again.
+
+    Returns:
+        (dict): Full table name to data_table_id, in the given order.
+
+    """
+    # Prevent concurrent registrations from taking the same IDs.
+    metabase_cursor.execute(
+        'LOCK TABLE metabase.data_table IN SHARE ROW EXCLUSIVE MODE')
+
+    data_table_ids = {}
+    if reuse_existing:
+        metabase_cursor.execute(
+            """
+            SELECT file_table_name, MAX(data_table_id)
+            FROM metabase.data_table
+            WHERE file_table_name = ANY(%(file_table_names)s)
+            GROUP BY file_table_name
+            """,
+            {'file_table_names': list(full_table_names)},
+        )
+        data_table_ids.update(metabase_cursor.fetchall())
+
+    new_table_names = [full_table_name
+                       for full_table_name in full_table_names
+                       if full_table_name not in data_table_ids]
+    metabase_cursor.execute(
+        """
+        INSERT INTO metabase.data_table (data_table_id, file_table_name)
+        SELECT
+            (SELECT COALESCE(MAX(data_table_id), 0)
+             FROM metabase.data_table) + new_table.position,
+            new_table.file_table_name
+        FROM UNNEST(%(file_table_names)s::TEXT[])
+            WITH ORDINALITY AS new_table (file_table_name, position)
+        RETURNING file_table_name, data_table_id
+        """,
+        {'file_table_names': new_table_names},
+    )
+    data_table_ids.update(metabase_cursor.fetchall())
+
+    return {
+        full_table_name: data_table_ids[full_table_name]
+        for full_table_name in full_table_names
+    }
+
+
+def create_connection_pools(max_connections, workers=1):
+    """Return pools of data and metabase connections.
+
+    The data pool has room for `workers` more connections per table when
+    the columns of a table are profiled by several workers (see
+    `extract_tables`).
+
+    Returns:
+        (connection_pools.BlockingConnectionPool,
+         connection_pools.BlockingConnectionPool): (data pool, metabase pool)
+
+    """
+    data_pool = connection_pools.BlockingConnectionPool(
+        max_connections * (workers + 1 if workers > 1 else 1),
+        settings.data_connection_string,
+    )
+    metabase_pool = connection_pools.BlockingConnectionPool(
+        max_connections,
+        settings.metabase_connection_string,
+    )
+
+    return data_pool, metabase_pool
+
+
+def extract_tables(data_table_ids, table_workers=1, data_pool=None,
+                   metabase_pool=None, table_costs=None,
+                   **process_table_kwargs):
+    """Process several Data Tables concurrently.
+
+    A failing table does not stop the others. Pools must allow at least
+    `table_workers` connections, and the data pool `workers` more per table
+    when columns are profiled by several workers. Tables are handed out to
+    the workers most costly first (see
+    `estimate_metadata_helper.get_table_costs`).
+
+    Args:
+        data_table_ids (dict): Full table name to data_table_id.
+        table_workers (int): Number of tables processed at once.
+        data_pool (psycopg2.pool.AbstractConnectionPool): Pool of data
+            connections.
+        metabase_pool (psycopg2.pool.AbstractConnectionPool): Pool of
+            metabase connections.
+        table_costs (dict): Full table name to estimated cost. Tables are
+            processed in the given order if None.
+        **process_table_kwargs: Arguments of `ExtractMetadata.process_table`.
+
+    Returns:
+        ([TableResult]): Results in the order of `data_table_ids`.
+
+    """
+
+    def extract_table(full_table_name):
+        start_time = time.monotonic()
+        error = None
+        processed = False
+        try:
+            extract = extract_metadata.ExtractMetadata(
+                data_table_ids[full_table_name],
+                data_pool=data_pool,
+                metabase_pool=metabase_pool,
+            )
+            processed = extract.process_table(**process_table_kwargs)
+        except Exception as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+
+        return TableResult(
+            data_table_ids[full_table_name],
+            full_table_name,
+            error,
+            time.monotonic() - start_time,
+            error is None and not processed,
+        )
+
+    ordered_table_names = list(data_table_ids)
+    if table_costs is not None:
+        ordered_table_names = estimate_metadata_helper.order_by_cost(
+            ordered_table_names, table_costs)
+
+    with futures.ThreadPoolExecutor(max_workers=table_workers) as executor:
+        table_results = dict(zip(
+            ordered_table_names,
+            executor.map(extract_table, ordered_table_names),
+        ))
+
+    return [table_results[full_table_name]
+            for full_table_name in data_table_ids]
+
+
+def format_summary(table_results):
+    """Return a per-table summary of a batch extraction as text."""
+
+    lines = []
+    for result in table_results:
+        if result.error is not None:
+            status = 'FAILED'
+        elif result.skipped:
+            status = 'SKIPPED'
+        else:
+            status = 'OK'
+        line = '{:<6} {:>8} {} ({:.1f}s)'.format(
+            status,
+            result.data_table_id,
+            result.full_table_name,
+            result.seconds,
+        )
+        if result.error is not None:
+            line += ' ' + result.error
+        lines.append(line)
+
+    n_failed = sum(result.error is not None for result in table_results)
+    n_skipped = sum(result.skipped for result in table_results)
+    lines.append(
+        '{} tables processed, {} succeeded, {} skipped as unchanged, '
+        '{} failed.'.format(
+            len(table_results),
+            len(table_results) - n_failed - n_skipped,
+            n_skipped,
+            n_failed,
+        )
+    )
+
+    return '\n'.join(lines)
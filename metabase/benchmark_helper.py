@@ -0,0 +1,146 @@
+"""Helper functions to benchmark metadata extraction on synthetic tables.
+
+Synthetic tables are generated by the database from a fixed seed, so the
+same case is the same table on every run and results of several commits
+can be compared. Every column draws its values out of `cardinality`
+distinct ones and is null with probability `null_ratio`.
+"""
+
+import contextlib
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+from psycopg2 import sql
+
+from . import extract_metadata
+from . import instrumentation
+from . import settings
+from .benchmark_mixes import MIXES
+
+
+# Column kind to expression of a value out of {cardinality} distinct ones.
+COLUMN_KINDS = {
+    'numeric': 'FLOOR(RANDOM() * {cardinality})::TEXT',
+    'date': "(DATE '2000-01-01' + FLOOR(RANDOM() * {cardinality})::INTEGER)"
+            "::TEXT",
+    'code': "'code_' || FLOOR(RANDOM() * {cardinality})::TEXT",
+    'text': 'MD5(FLOOR(RANDOM() * {cardinality})::TEXT)',
+    'integer': 'FLOOR(RANDOM() * {cardinality})::INTEGER',
+    'timestamp': "TIMESTAMP '2000-01-01' "
+                 "+ FLOOR(RANDOM() * {cardinality}) * INTERVAL '1 hour'",
+}
+
+SEED = 0.5
+
+
+def get_column_kinds(n_columns, mix):
+    """Return the names and kinds of the columns of a synthetic table.
+
+    Returns:
+        ([(str, str)]): (column name, column kind) of every column.
+
+    """
+    kinds = MIXES[mix]
+
+    return [
+        ('c_{}_{}'.format(i, kinds[i % len(kinds)]), kinds[i % len(kinds)])
+        for i in range(n_columns)
+    ]
+
+
+def create_synthetic_table(data_cursor, schema_name, table_name, n_rows,
+                           n_columns, mix, null_ratio, cardinality):
+    """Create and analyze a synthetic table.
+
+    Args:
+        mix (str): Name of the mix of column kinds, see `MIXES`.
+        null_ratio (float): Probability of a value to be null.
+        cardinality (int): Max number of distinct values per column.
+
+    """
+    columns = []
+    for col_name, kind in get_column_kinds(n_columns, mix):
+        columns.append(
+            sql.SQL('CASE WHEN RANDOM() < {} THEN NULL ELSE {} END AS {}')
+            .format(
+                sql.Literal(null_ratio),
+                sql.SQL(COLUMN_KINDS[kind]).format(
+                    cardinality=sql.Literal(cardinality)),
+                sql.Identifier(col_name),
+            )
+        )
+
+    # In one statement, so that every value is drawn from the seed.
+    data_cursor.execute(
+        sql.SQL("""
+        SELECT SETSEED({seed});
+        CREATE TABLE {schema}.{table} AS
+        SELECT {columns}
+        FROM GENERATE_SERIES(1, {n_rows});
+        ANALYZE {schema}.{table};
+        """).format(
+            seed=sql.Literal(SEED),
+            schema=sql.Identifier(schema_name),
+            table=sql.Identifier(table_name),
+            columns=sql.SQL(',').join(columns),
+            n_rows=sql.Literal(n_rows),
+        )
+    )
+
+
+def get_commit():
+    """Return the git commit of the working directory, or None."""
+
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_extraction(connection_string, data_table_id, process_table_kwargs):
+    """Extract and export the metadata of a table, measuring them.
+
+    Meant to run in a fresh process, whose peak RSS is that of the
+    extraction. The metabase and the data are read with
+    `connection_string`, without shared pools.
+
+    Returns:
+        (dict): Wall times of `process_table` and `export_table_metadata` in
+            seconds, peak RSS of the process in kilobytes, and queries, rows
+            and bytes executed and fetched by `process_table`.
+
+    """
+    settings.metabase_connection_string = connection_string
+    settings.data_connection_string = connection_string
+    settings.connection_pool_size = 0
+
+    recorder = instrumentation.StepRecorder()
+    with extract_metadata.ExtractMetadata(data_table_id) as extract:
+        start = time.perf_counter()
+        with instrumentation.recording(recorder):
+            extract.process_table(**process_table_kwargs)
+        process_seconds = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull:
+                # Leaves the output to the results.
+                with contextlib.redirect_stdout(devnull):
+                    extract.export_table_metadata(
+                        os.path.join(directory, 'gmeta.json'))
+            export_seconds = time.perf_counter() - start
+
+    return {
+        'process_seconds': process_seconds,
+        'export_seconds': export_seconds,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'query_count': recorder.query_count,
+        'rows_fetched': recorder.rows_fetched,
+        'bytes_fetched': recorder.bytes_fetched,
+    }
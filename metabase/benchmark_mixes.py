@@ -0,0 +1,14 @@
+"""Mixes of column kinds of the synthetic tables of benchmarks.
+
+Kept apart from `benchmark_helper`, so that the command line parser can
+list them without importing the benchmark harness.
+"""
+
+
+# Mix name to the kinds of successive columns, repeated over the columns.
+MIXES = {
+    'mixed': ['numeric', 'date', 'code', 'text'],
+    'numeric': ['numeric'],
+    'text': ['text'],
+    'native': ['integer', 'timestamp', 'code'],
+}
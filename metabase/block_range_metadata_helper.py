@@ -0,0 +1,213 @@
+"""Helper functions to profile a table split into ranges of blocks.
+
+A table is split into contiguous ranges of blocks, selected by their `ctid`,
+so that every range can be scanned on its own connection. Column types are
+inferred from castability counts and bounded sets of distinct values
+gathered per range, then every range is aggregated into mergeable partial
+aggregates (see `incremental_metadata_helper.get_column_aggregates`), which
+are merged into the statistics of the table.
+
+PostgreSQL 14 and later read only the blocks of a range (TID range scan);
+older servers scan the whole table for every range.
+
+Ranges run on threads, so that only the work done by the database is
+parallel. The distinct values of every textual column are collected by a
+scan of the range per column, in one statement per range. Numeric values
+are streamed to KLL sketches in Python to compute medians, which holds the
+GIL, so that ranges stream their values one at a time.
+"""
+
+from psycopg2 import sql
+
+from . import extract_metadata_helper
+from . import instrumentation
+from .extract_metadata_helper import CastCounts
+
+
+def get_block_ranges(data_cursor, schema_name, table_name, n_ranges):
+    """Split the blocks of a table into contiguous ranges.
+
+    Returns:
+        ([(int, int)]): (first block, block after the last one) of every
+            range, at most `n_ranges` of them. The first block of the first
+            range and the end of the last range are None, so that every row
+            is in a range.
+
+    """
+
+    data_cursor.execute(
+        """
+        SELECT PG_RELATION_SIZE(%(table)s)
+            / CURRENT_SETTING('block_size')::BIGINT
+        """,
+        {'table': schema_name + '.' + table_name},
+    )
+    n_blocks = data_cursor.fetchone()[0]
+
+    n_ranges = max(1, min(n_ranges, n_blocks))
+    starts = [None] + [i * n_blocks // n_ranges for i in range(1, n_ranges)]
+
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def get_block_range_condition(block_range):
+    """Return a condition selecting the rows of a range of blocks.
+
+    Returns:
+        (sql.Composable): Boolean expression, or None for all rows.
+
+    """
+    start, end = block_range
+    conditions = []
+    if start is not None:
+        conditions.append(
+            sql.SQL('ctid >= {}::TID').format(sql.Literal('({},0)'.format(
+                start))))
+    if end is not None:
+        conditions.append(
+            sql.SQL('ctid < {}::TID').format(sql.Literal('({},0)'.format(
+                end))))
+
+    return sql.SQL(' AND ').join(conditions) if conditions else None
+
+
+def _get_where(condition):
+    """Return a WHERE clause from a condition, which may be None."""
+
+    if condition is None:
+        return sql.SQL('')
+    return sql.SQL('WHERE {}').format(condition)
+
+
+@instrumentation.step
+def count_castable_values(data_cursor, column_names, schema_name, table_name,
+                          condition=None):
+    """Count the values of columns which can be cast to numeric and date.
+
+    All columns are counted by one query. Counts of several ranges are
+    summed by `merge_cast_counts`.
+
+    Args:
+        condition (sql.Composable): Boolean expression selecting the rows,
+            or None for all rows.
+
+    Returns:
+        (dict): Column name to 'numeric' and 'date' to CastCounts.
+
+    """
+    valid_numeric = extract_metadata_helper.get_valid_input_check(
+        data_cursor, 'numeric')
+    valid_date = extract_metadata_helper.get_valid_input_check(
+        data_cursor, 'date')
+
+    count_ls = []
+    for col in column_names:
+        value = sql.SQL('{}::TEXT').format(sql.Identifier(col))
+        count_ls.append(
+            sql.SQL("""
+                COUNT(*) FILTER (WHERE {value} IS NULL),
+                COUNT(*) FILTER (WHERE {valid_numeric}),
+                COUNT(*) FILTER (WHERE NOT {valid_numeric}),
+                COUNT(*) FILTER (WHERE {valid_date}),
+                COUNT(*) FILTER (WHERE NOT {valid_date})
+            """).format(
+                value=value,
+                valid_numeric=valid_numeric(value),
+                valid_date=valid_date(value),
+            )
+        )
+
+    data_cursor.execute(
+        sql.SQL('SELECT {} FROM {}.{} {}').format(
+            sql.SQL(',').join(count_ls),
+            sql.Identifier(schema_name),
+            sql.Identifier(table_name),
+            _get_where(condition),
+        )
+    )
+    result = data_cursor.fetchone()
+
+    cast_counts = {}
+    for i, col in enumerate(column_names):
+        (missing, numeric, not_numeric, date,
+         not_date) = result[5 * i:5 * (i + 1)]
+        cast_counts[col] = {
+            'numeric': CastCounts(numeric, not_numeric, missing),
+            'date': CastCounts(date, not_date, missing),
+        }
+
+    return cast_counts
+
+
+def merge_cast_counts(cast_counts, other):
+    """Return the sum of the cast counts of two ranges."""
+
+    return {
+        col: {
+            type_name: CastCounts(*[
+                count + other_count
+                for count, other_count
+                in zip(counts, other[col][type_name])
+            ])
+            for type_name, counts in type_counts.items()
+        }
+        for col, type_counts in cast_counts.items()
+    }
+
+
+@instrumentation.step
+def get_distinct_values_bounded(data_cursor, column_names, schema_name,
+                                table_name, max_distinct, condition=None):
+    """Return distinct non-null values of columns, up to max_distinct each.
+
+    As `extract_metadata_helper.count_distinct_bounded`, values are streamed
+    through a temporary PL/pgSQL function returning once `max_distinct`
+    distinct values have been seen, called once per column by one
+    statement. The values of several ranges can be united: a column has at
+    most `max_distinct - 1` distinct values if and only if the union of its
+    values in every range is that small.
+
+    Returns:
+        (dict): Column name to set of distinct values, as text.
+
+    """
+
+    data_cursor.execute(
+        sql.SQL("""
+        CREATE OR REPLACE FUNCTION pg_temp.metabase_distinct_bounded(
+            query TEXT, max_distinct INTEGER
+        ) RETURNS TEXT[] AS $$
+        DECLARE
+            seen TEXT[] := ARRAY[]::TEXT[];
+            value TEXT;
+        BEGIN
+            FOR value IN EXECUTE query LOOP
+                IF value IS NOT NULL AND NOT value = ANY(seen) THEN
+                    seen := seen || value;
+                    EXIT WHEN CARDINALITY(seen) >= max_distinct;
+                END IF;
+            END LOOP;
+            RETURN seen;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        SELECT {};
+        """).format(
+            sql.SQL(', ').join(
+                sql.SQL('pg_temp.metabase_distinct_bounded({}, {})').format(
+                    sql.Literal(
+                        sql.SQL('SELECT {}::TEXT FROM {}.{} {}').format(
+                            sql.Identifier(col),
+                            sql.Identifier(schema_name),
+                            sql.Identifier(table_name),
+                            _get_where(condition),
+                        ).as_string(data_cursor)
+                    ),
+                    sql.Literal(max_distinct),
+                )
+                for col in column_names
+            ),
+        )
+    )
+
+    return dict(zip(column_names, map(set, data_cursor.fetchone())))
@@ -0,0 +1,229 @@
+"""Helper functions to checkpoint extraction runs column by column.
+
+An extraction run is identified by a run id recorded in
+`metabase.extraction_run` with the options affecting column profiles. Every
+column profiled by the run is committed to `metabase.column_checkpoint` as
+soon as it is done, independently of the transaction updating the metabase,
+so that a run interrupted by an error or a restart can be resumed without
+profiling these columns again. The checkpoints of a run are deleted when it
+completes.
+"""
+
+from collections import Counter
+import datetime
+import decimal
+import getpass
+
+import psycopg2.extras
+
+from . import instrumentation
+from .extract_metadata_helper import (
+    CodeStats,
+    ColumnProfile,
+    DateStats,
+    NumericStats,
+    TextStats,
+)
+
+
+def begin_run(metabase_cursor, run_id, data_table_id, options):
+    """Record a new run, or check the options of the run to resume.
+
+    Args:
+        options (dict): Options of the run affecting column profiles.
+
+    Raises:
+        ValueError: If the run was started on another table or with other
+            options.
+
+    """
+
+    metabase_cursor.execute(
+        """
+        INSERT INTO metabase.extraction_run (
+            run_id,
+            data_table_id,
+            options,
+            created_by,
+            date_created
+        )
+        VALUES (
+            %(run_id)s,
+            %(data_table_id)s,
+            %(options)s,
+            %(created_by)s,
+            CURRENT_TIMESTAMP
+        )
+        ON CONFLICT (run_id) DO NOTHING
+        """,
+        {
+            'run_id': run_id,
+            'data_table_id': data_table_id,
+            'options': psycopg2.extras.Json(options),
+            'created_by': getpass.getuser(),
+        },
+    )
+
+    run_data_table_id, run_options = select_run(metabase_cursor, run_id)
+    if run_data_table_id != data_table_id:
+        raise ValueError('Run {} extracts data_table_id {}.'.format(
+            run_id, run_data_table_id))
+    if run_options != options:
+        raise ValueError('Run {} was started with options {}.'.format(
+            run_id, run_options))
+
+
+def select_run(metabase_cursor, run_id):
+    """Return the table and options of a run.
+
+    Returns:
+        (int, dict): (data_table_id, options)
+
+    Raises:
+        ValueError: If the run does not exist.
+
+    """
+
+    metabase_cursor.execute(
+        """
+        SELECT data_table_id, options
+        FROM metabase.extraction_run
+        WHERE run_id = %(run_id)s
+        """,
+        {'run_id': run_id},
+    )
+    result = metabase_cursor.fetchone()
+
+    if result is None:
+        raise ValueError('Run {} not found in metabase.extraction_run'.format(
+            run_id))
+
+    return tuple(result)
+
+
+def complete_run(metabase_cursor, run_id):
+    """Record the completion of a run and delete its checkpoints."""
+
+    metabase_cursor.execute(
+        """
+        UPDATE metabase.extraction_run
+        SET date_completed = CURRENT_TIMESTAMP
+        WHERE run_id = %(run_id)s;
+
+        DELETE FROM metabase.column_checkpoint
+        WHERE run_id = %(run_id)s;
+        """,
+        {'run_id': run_id},
+    )
+
+
+@instrumentation.step
+def insert_column_checkpoint(metabase_cursor, run_id, col_name, data_type,
+                             column_profile):
+    """Record the profile of a column completed by a run."""
+
+    metabase_cursor.execute(
+        """
+        INSERT INTO metabase.column_checkpoint (
+            run_id,
+            column_name,
+            data_type,
+            column_type,
+            stats,
+            date_created
+        )
+        VALUES (
+            %(run_id)s,
+            %(column_name)s,
+            %(data_type)s,
+            %(column_type)s,
+            %(stats)s,
+            CURRENT_TIMESTAMP
+        )
+        ON CONFLICT (run_id, column_name) DO UPDATE
+        SET
+            data_type = EXCLUDED.data_type,
+            column_type = EXCLUDED.column_type,
+            stats = EXCLUDED.stats,
+            date_created = EXCLUDED.date_created
+        """,
+        {
+            'run_id': run_id,
+            'column_name': col_name,
+            'data_type': data_type,
+            'column_type': column_profile.type,
+            'stats': psycopg2.extras.Json(_stats_to_json(column_profile)),
+        },
+    )
+
+
+def select_column_checkpoints(metabase_cursor, run_id):
+    """Return the column profiles completed by a run.
+
+    Returns:
+        (dict): Column name to (declared type, ColumnProfile).
+
+    """
+
+    metabase_cursor.execute(
+        """
+        SELECT column_name, data_type, column_type, stats
+        FROM metabase.column_checkpoint
+        WHERE run_id = %(run_id)s
+        """,
+        {'run_id': run_id},
+    )
+
+    return {
+        col_name: (
+            data_type,
+            ColumnProfile(column_type, _stats_from_json(column_type, stats)),
+        )
+        for col_name, data_type, column_type, stats
+        in metabase_cursor.fetchall()
+    }
+
+
+def _stats_to_json(column_profile):
+    """Return the statistics of a column profile as JSON values."""
+
+    stats = column_profile.stats
+    if column_profile.type == 'numeric':
+        return [
+            None if value is None else str(value)
+            for value in [stats.min, stats.max, stats.mean, stats.median]
+        ] + [stats.missing]
+    elif column_profile.type == 'date':
+        return [
+            None if value is None else value.isoformat()
+            for value in [stats.min, stats.max]
+        ] + [stats.missing]
+    elif column_profile.type == 'code':
+        return [list(stats.frequencies.items()), stats.missing, stats.other]
+    else:
+        return [
+            float(value) if isinstance(value, decimal.Decimal) else value
+            for value in stats
+        ]
+
+
+def _stats_from_json(column_type, values):
+    """Return the statistics of a column profile from JSON values."""
+
+    if column_type == 'numeric':
+        return NumericStats(*[
+            None if value is None else decimal.Decimal(value)
+            for value in values[:4]
+        ], values[4])
+    elif column_type == 'date':
+        return DateStats(*[
+            None if value is None
+            else datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+            for value in values[:2]
+        ], values[2])
+    elif column_type == 'code':
+        frequencies, missing, other = values
+        return CodeStats(Counter(dict(map(tuple, frequencies))), missing,
+                         other)
+    else:
+        return TextStats(*values)
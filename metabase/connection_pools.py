@@ -0,0 +1,91 @@
+"""Connection pools shared by the ExtractMetadata instances of a process.
+
+One pool is kept per role (data or metabase) and connection string, so
+that data and metabase connections are opened once and reused instead of
+being opened and closed for every table. Roles have their own pools even
+when they share a connection string, so that data connections held by
+extractions cannot starve them of metabase connections.
+"""
+
+import threading
+
+import psycopg2.pool
+
+
+# Seconds waited for a connection before raising PoolError.
+GETCONN_TIMEOUT = 60
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """Thread safe connection pool waiting for a free connection.
+
+    `psycopg2.pool.ThreadedConnectionPool` raises PoolError when all its
+    connections are in use. This pool waits for one to be returned instead,
+    up to `timeout` seconds (forever if None) before raising PoolError.
+    Connections are opened when first needed and kept once returned.
+
+    """
+
+    def __init__(self, maxconn, *args, timeout=GETCONN_TIMEOUT, **kwargs):
+        super().__init__(0, maxconn, *args, **kwargs)
+        # psycopg2 pools close returned connections beyond minconn.
+        self.minconn = maxconn
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self._semaphore.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError(
+                'No connection returned to the pool within {} seconds'.format(
+                    self.timeout))
+        try:
+            conn = super().getconn(key)
+            if conn.closed:
+                # Dropped by the server while idle in the pool.
+                super().putconn(conn, key, close=True)
+                conn = super().getconn(key)
+            return conn
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        super().putconn(conn, key, close)
+        self._semaphore.release()
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_shared_pool(connection_string, pool_size, role):
+    """Return the shared pool of a role, creating it if needed.
+
+    Args:
+        connection_string (str): Connection string of the database.
+        pool_size (int): Max number of connections of a new pool.
+        role (str): 'data' or 'metabase'.
+
+    Returns:
+        (BlockingConnectionPool): None if pool_size is 0 or None.
+
+    """
+    if not pool_size:
+        return None
+
+    with _shared_pools_lock:
+        if (role, connection_string) not in _shared_pools:
+            _shared_pools[role, connection_string] = BlockingConnectionPool(
+                pool_size,
+                connection_string,
+            )
+        return _shared_pools[role, connection_string]
+
+
+def close_shared_pools():
+    """Close every connection of the shared pools and forget the pools."""
+
+    with _shared_pools_lock:
+        for pool in _shared_pools.values():
+            pool.closeall()
+        _shared_pools.clear()
@@ -0,0 +1,436 @@
+"""Helper functions to estimate metadata from PostgreSQL planner statistics.
+
+Planner statistics (`pg_class.reltuples` and the `pg_stats` view) are kept up
+to date by ANALYZE and autovacuum. They hold the fraction of nulls, the
+number of distinct values, the most common values with their frequencies and
+a histogram of the other values of every column, from which the metadata
+stored by `extract_metadata_helper` can be estimated without scanning the
+table.
+"""
+
+from collections import Counter
+
+from psycopg2 import sql
+
+from . import extract_metadata_helper
+from . import instrumentation
+from .extract_metadata_helper import (
+    CodeStats,
+    ColumnProfile,
+    DateStats,
+    NumericStats,
+    TextStats,
+)
+
+
+def analyze_table(data_cursor, schema_name, table_name):
+    """Refresh the planner statistics of a table."""
+
+    data_cursor.execute(
+        sql.SQL('ANALYZE {}.{}').format(
+            sql.Identifier(schema_name),
+            sql.Identifier(table_name),
+        )
+    )
+
+
+@instrumentation.step
+def get_table_estimates(data_cursor, schema_name, table_name):
+    """Return the estimated number of rows and size of a table.
+
+    Returns:
+        (int, int): (number of rows, size in bytes)
+
+    """
+
+    data_cursor.execute(
+        """
+        SELECT
+            pg_class.reltuples,
+            PG_RELATION_SIZE(pg_class.oid)
+        FROM pg_class
+            JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+        WHERE
+            pg_namespace.nspname = %(schema)s
+            AND pg_class.relname = %(table)s
+        """,
+        {
+            'schema': schema_name,
+            'table': table_name,
+        },
+    )
+    n_rows, table_size = data_cursor.fetchone()
+
+    if n_rows < 0:
+        # PostgreSQL 14 and later use -1 for tables never analyzed.
+        raise ValueError('Selected data table has no planner statistics. '
+                         'Run ANALYZE first.')
+
+    return int(n_rows), table_size
+
+
+def get_table_costs(data_cursor, full_table_names):
+    """Estimate the cost of profiling tables from planner statistics.
+
+    The cost of a table is the number of bytes scanned, its pages, plus
+    the number of bytes aggregated, its rows times the sum of the average
+    widths of its columns. Tables never analyzed only count their pages.
+
+    Args:
+        full_table_names ([str]): Table names including schemas.
+
+    Returns:
+        (dict): Full table name to cost.
+
+    """
+
+    data_cursor.execute(
+        """
+        SELECT
+            pg_namespace.nspname || '.' || pg_class.relname,
+            pg_class.relpages::BIGINT
+                * CURRENT_SETTING('block_size')::BIGINT
+            + GREATEST(pg_class.reltuples, 0)::BIGINT * COALESCE((
+                SELECT SUM(pg_stats.avg_width)
+                FROM pg_stats
+                WHERE
+                    pg_stats.schemaname = pg_namespace.nspname
+                    AND pg_stats.tablename = pg_class.relname
+                    AND NOT pg_stats.inherited
+            ), 0)
+        FROM pg_class
+            JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+        WHERE
+            pg_namespace.nspname || '.' || pg_class.relname
+                = ANY(%(full_table_names)s)
+        """,
+        {'full_table_names': list(full_table_names)},
+    )
+    table_costs = dict(data_cursor.fetchall())
+
+    return {
+        full_table_name: table_costs.get(full_table_name, 0)
+        for full_table_name in full_table_names
+    }
+
+
+def get_column_costs(data_cursor, schema_name, table_name, column_names):
+    """Estimate the cost of profiling the columns of a table.
+
+    The cost of a column is the number of bytes aggregated, the number of
+    rows times the average width of the column. Columns without statistics
+    are taken to be 8 bytes wide.
+
+    Returns:
+        (dict): Column name to cost.
+
+    """
+
+    data_cursor.execute(
+        """
+        SELECT
+            pg_attribute.attname,
+            GREATEST(pg_class.reltuples, 0)::BIGINT
+                * COALESCE(pg_stats.avg_width, 8)
+        FROM pg_class
+            JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+            JOIN pg_attribute ON pg_attribute.attrelid = pg_class.oid
+            LEFT JOIN pg_stats ON
+                pg_stats.schemaname = pg_namespace.nspname
+                AND pg_stats.tablename = pg_class.relname
+                AND pg_stats.attname = pg_attribute.attname
+                AND NOT pg_stats.inherited
+        WHERE
+            pg_namespace.nspname = %(schema)s
+            AND pg_class.relname = %(table)s
+            AND pg_attribute.attnum > 0
+            AND NOT pg_attribute.attisdropped
+        """,
+        {
+            'schema': schema_name,
+            'table': table_name,
+        },
+    )
+    column_costs = dict(data_cursor.fetchall())
+
+    return {col: column_costs.get(col, 0) for col in column_names}
+
+
+def order_by_cost(names, costs):
+    """Return names ordered by decreasing cost, for longest first scheduling.
+
+    Handing the most costly work out first to whichever worker is free (LPT
+    scheduling) keeps a large table or column from finishing last alone.
+    Ties keep their original order.
+
+    """
+    return sorted(names, key=lambda name: -costs.get(name, 0))
+
+
+@instrumentation.step
+def get_all_columns_estimates(data_cursor, column_names, categorical_threshold,
+                              type_overrides, schema_name, table_name,
+                              n_rows, data_types=None):
+    """Estimate the type and metadata of every column from `pg_stats`.
+
+    The most common values and histogram bounds of a column are a sample of
+    its values. Their castability is checked in the database, so textual
+    columns are inferred as numeric or date when every sampled value casts.
+
+    Args:
+        n_rows (int): Estimated number of rows of the table.
+        data_types (dict): Column name to declared type.
+
+    Returns:
+        (dict): Column name to ColumnProfile.
+
+    """
+    if data_types is None:
+        data_types = {}
+
+    column_stats = _get_pg_stats(data_cursor, schema_name, table_name)
+
+    column_profiles = {}
+    for col in column_names:
+        if col not in column_stats:
+            raise ValueError('Column {} has no planner statistics. Run '
+                             'ANALYZE first.'.format(col))
+        stats = column_stats[col]
+
+        declared_type = extract_metadata_helper.get_declared_column_type(
+            data_types.get(col))
+        if col in type_overrides:
+            col_type = type_overrides[col]
+        elif declared_type in ('numeric', 'date'):
+            col_type = declared_type
+        elif declared_type is None and None not in stats['numeric_values']:
+            col_type = 'numeric'
+        elif declared_type is None and None not in stats['date_values']:
+            col_type = 'date'
+        elif (_estimate_n_distinct(stats['n_distinct'], n_rows)
+                <= categorical_threshold):
+            col_type = 'code'
+        else:
+            col_type = 'text'
+
+        column_profiles[col] = ColumnProfile(
+            col_type,
+            _estimate_column_stats(col_type, stats, n_rows),
+        )
+
+    return column_profiles
+
+
+def _get_pg_stats(data_cursor, schema_name, table_name):
+    """Return the planner statistics of every column of a table.
+
+    Sampled values are the most common values followed by the histogram
+    bounds. They are returned as text and also cast to numeric and date,
+    with nulls for values which cannot be cast.
+
+    Returns:
+        (dict): Column name to a dict of statistics.
+
+    """
+    valid_numeric = extract_metadata_helper.get_valid_input_check(
+        data_cursor, 'numeric')
+    valid_date = extract_metadata_helper.get_valid_input_check(
+        data_cursor, 'date')
+    value = sql.SQL('sampled.value')
+
+    data_cursor.execute(
+        sql.SQL("""
+        WITH column_stats AS (
+            -- Statistics including inheritance children are preferred, as
+            -- they describe the same rows as a SELECT on the table.
+            SELECT DISTINCT ON (attname)
+                attname,
+                null_frac,
+                n_distinct,
+                COALESCE(most_common_vals::TEXT::TEXT[], ARRAY[]::TEXT[])
+                    AS most_common_vals,
+                COALESCE(most_common_freqs, ARRAY[]::REAL[])
+                    AS most_common_freqs,
+                COALESCE(histogram_bounds::TEXT::TEXT[], ARRAY[]::TEXT[])
+                    AS histogram_bounds
+            FROM pg_stats
+            WHERE
+                schemaname = %(schema)s
+                AND tablename = %(table)s
+            ORDER BY attname, inherited DESC
+        )
+        SELECT
+            attname,
+            null_frac,
+            n_distinct,
+            most_common_vals,
+            most_common_freqs,
+            histogram_bounds,
+            ARRAY(
+                SELECT CASE WHEN {valid_numeric}
+                    THEN sampled.value::NUMERIC END
+                FROM UNNEST(most_common_vals || histogram_bounds)
+                    WITH ORDINALITY AS sampled (value, position)
+                ORDER BY sampled.position
+            ),
+            ARRAY(
+                SELECT CASE WHEN {valid_date}
+                    THEN sampled.value::DATE END
+                FROM UNNEST(most_common_vals || histogram_bounds)
+                    WITH ORDINALITY AS sampled (value, position)
+                ORDER BY sampled.position
+            )
+        FROM column_stats
+        """).format(
+            valid_numeric=valid_numeric(value),
+            valid_date=valid_date(value),
+        ),
+        {
+            'schema': schema_name,
+            'table': table_name,
+        },
+    )
+
+    column_stats = {}
+    for (col, null_frac, n_distinct, most_common_vals, most_common_freqs,
+         histogram_bounds, numeric_values,
+         date_values) in data_cursor.fetchall():
+        column_stats[col] = {
+            'null_frac': null_frac,
+            'n_distinct': n_distinct,
+            'most_common_vals': most_common_vals,
+            'most_common_freqs': most_common_freqs,
+            'histogram_bounds': histogram_bounds,
+            'numeric_values': numeric_values,
+            'date_values': date_values,
+            'weights': _get_sample_weights(null_frac, most_common_freqs,
+                                           histogram_bounds),
+        }
+
+    return column_stats
+
+
+def _get_sample_weights(null_frac, most_common_freqs, histogram_bounds):
+    """Return the fraction of rows represented by each sampled value.
+
+    Most common values weigh their frequency. The histogram splits the other
+    non-null rows into equally populated buckets, the rows of each bucket
+    being shared between its two bounds.
+
+    """
+    weights = list(most_common_freqs)
+
+    histogram_frac = max(1 - null_frac - sum(most_common_freqs), 0)
+    n_buckets = len(histogram_bounds) - 1
+    if n_buckets == 0:
+        weights.append(histogram_frac)
+    elif n_buckets > 0:
+        half_bucket_frac = histogram_frac / n_buckets / 2
+        weights.append(half_bucket_frac)
+        weights.extend([2 * half_bucket_frac] * (n_buckets - 1))
+        weights.append(half_bucket_frac)
+
+    return weights
+
+
+def _estimate_n_distinct(n_distinct, n_rows):
+    """Return the estimated number of distinct values.
+
+    Negative `pg_stats.n_distinct` values are the opposite of the number of
+    distinct values divided by the number of rows.
+
+    """
+    if n_distinct < 0:
+        return -n_distinct * n_rows
+    return n_distinct
+
+
+def _estimate_column_stats(col_type, stats, n_rows):
+    """Estimate the statistics of a column given its type."""
+
+    missing = round(stats['null_frac'] * n_rows)
+
+    if col_type == 'numeric':
+        values = _get_weighted_values(stats['numeric_values'],
+                                      stats['weights'])
+        if values:
+            total_weight = sum(weight for _, weight in values)
+            mean = sum(
+                float(value) * weight for value, weight in values
+            ) / total_weight
+            return NumericStats(
+                values[0][0],
+                values[-1][0],
+                mean,
+                _get_weighted_median(values),
+                missing,
+            )
+        return NumericStats(None, None, None, None, missing)
+
+    elif col_type == 'date':
+        values = _get_weighted_values(stats['date_values'], stats['weights'])
+        if values:
+            return DateStats(values[0][0], values[-1][0], missing)
+        return DateStats(None, None, missing)
+
+    elif col_type == 'text':
+        text_values = stats['most_common_vals'] + stats['histogram_bounds']
+        lengths = _get_weighted_values(
+            [len(value) for value in text_values],
+            stats['weights'],
+        )
+        if lengths:
+            return TextStats(
+                lengths[-1][0],
+                lengths[0][0],
+                _get_weighted_median(lengths),
+                missing,
+            )
+        return TextStats(None, None, None, missing)
+
+    else:
+        code_frequecy_counter = Counter({
+            code: round(frequency * n_rows)
+            for code, frequency in zip(stats['most_common_vals'],
+                                       stats['most_common_freqs'])
+        })
+
+        # Rows of the histogram are shared equally by the other codes.
+        other_codes = set(stats['histogram_bounds']) - \
+            set(stats['most_common_vals'])
+        if other_codes:
+            n_other_codes = max(
+                _estimate_n_distinct(stats['n_distinct'], n_rows)
+                - len(stats['most_common_vals']),
+                len(other_codes),
+            )
+            histogram_frac = max(1 - stats['null_frac']
+                                 - sum(stats['most_common_freqs']), 0)
+            for code in other_codes:
+                code_frequecy_counter[code] = round(
+                    histogram_frac * n_rows / n_other_codes)
+
+        if missing:
+            code_frequecy_counter[None] = missing
+        return CodeStats(code_frequecy_counter, missing, 0)
+
+
+def _get_weighted_values(values, weights):
+    """Return sorted (value, weight) pairs, dropping null values."""
+
+    return sorted(
+        (value, weight)
+        for value, weight in zip(values, weights)
+        if value is not None
+    )
+
+
+def _get_weighted_median(values):
+    """Return the weighted median of sorted (value, weight) pairs."""
+
+    half_weight = sum(weight for _, weight in values) / 2
+    cumulative_weight = 0
+    for value, weight in values:
+        cumulative_weight += weight
+        if cumulative_weight >= half_weight:
+            return value
@@ -1,68 +1,529 @@
 """Class to extract metadata from a Data Table"""
 
+from concurrent import futures
+import contextlib
+import functools
 import getpass
+import uuid
 
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from psycopg2 import sql
 
 from . import settings
+from . import connection_pools
+from . import block_range_metadata_helper
+from . import checkpoint_helper
+from . import estimate_metadata_helper
 from . import extract_metadata_helper
+from . import incremental_metadata_helper
+from . import instrumentation
+from . import partition_metadata_helper
 
 
 class ExtractMetadata():
-    """Class to extract metadata from a Data Table."""
+    """Class to extract metadata from a Data Table.
 
-    def __init__(self, data_table_id):
-        """Set Data Table ID and connect to database.
+    The data connection is borrowed by `process_table`. Used as a context
+    manager, it is kept for every call within the block and only released
+    on exit:
+
+        with ExtractMetadata(data_table_id) as extract:
+            extract.process_table()
+            extract.export_table_metadata(output_filepath)
+
+    Otherwise `process_table` releases it when done.
+
+    """
+
+    def __init__(self, data_table_id, data_pool=None, metabase_pool=None):
+        """Set Data Table ID and the pools to connect with.
+
+        Connections are borrowed from the pools shared by all instances
+        (see `connection_pools`) unless `settings.connection_pool_size` is 0.
 
         Args:
            data_table_id (int): ID associated with this Data Table.
+           data_pool (psycopg2.pool.AbstractConnectionPool): Pool to borrow
+               the data connection from instead of the shared pool.
+           metabase_pool (psycopg2.pool.AbstractConnectionPool): Pool to
+               borrow metabase connections from instead of the shared pool.
 
         """
         self.data_table_id = data_table_id
 
         self.metabase_connection_string = settings.metabase_connection_string
+        self.data_connection_string = settings.data_connection_string
+
+        if data_pool is None:
+            data_pool = connection_pools.get_shared_pool(
+                self.data_connection_string,
+                settings.connection_pool_size,
+                'data',
+            )
+        if metabase_pool is None:
+            metabase_pool = connection_pools.get_shared_pool(
+                self.metabase_connection_string,
+                settings.connection_pool_size,
+                'metabase',
+            )
+        self.data_pool = data_pool
+        self.metabase_pool = metabase_pool
+        self._in_context = False
+
+        self.data_conn = None
+        self.data_cur = None
+
+    def __enter__(self):
+        self._in_context = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._in_context = False
+        self.close()
+
+    def __borrow_data_connection(self):
+        """Borrow the data connection, unless it is already borrowed."""
+
+        if self.data_conn is not None:
+            return
 
-        self.data_conn = psycopg2.connect(settings.data_connection_string)
+        if self.data_pool is None:
+            self.data_conn = psycopg2.connect(self.data_connection_string)
+        else:
+            self.data_conn = self.data_pool.getconn()
         self.data_conn.autocommit = True
-        self.data_cur = self.data_conn.cursor()
+        self.data_cur = self.data_conn.cursor(
+            cursor_factory=instrumentation.InstrumentedCursor)
+
+    def close(self):
+        """Release the data connection, back to its pool if any."""
+
+        if self.data_conn is None:
+            return
+
+        self.data_cur.close()
+        if self.data_pool is None:
+            self.data_conn.close()
+        else:
+            self.data_pool.putconn(self.data_conn)
+        self.data_conn = None
+        self.data_cur = None
+
+    def process_table(self, categorical_threshold=10, type_overrides={},
+                      single_scan=False, estimate=False, analyze=False,
+                      quantile_method=None, workers=1, max_codes=None,
+                      skip_unchanged=False, watermark_column=None,
+                      block_ranges=None, run_id=None, instrument=False,
+                      max_memory=None, exact_numeric=False,
+                      run_options={}):
+        """Update the metabase with metadata from this Data Table.
+
+        Args:
+            categorical_threshold (int): Max number of distinct values in
+                categorical columns.
+            type_overrides (dict): Column name to column type.
+            single_scan (bool): Profile all columns with one aggregate query
+                per chunk of columns instead of several queries per column.
+            estimate (bool): Estimate metadata from planner statistics
+                instead of scanning the table. Stored metadata is flagged as
+                estimated.
+            analyze (bool): Refresh planner statistics with ANALYZE before
+                estimating metadata.
+            quantile_method (str): Name of a quantile sketch computing medians
+                from values streamed out of the database ('exact' or 'kll'),
+                or None for exact medians computed by the database. Ignored
+                when `estimate` is set.
+            workers (int): Number of columns profiled concurrently, each over
+                its own data connection. Used when columns are profiled one
+                by one (neither `single_scan` nor `estimate` is set). The
+                data pool must have more than `workers` connections, one
+                being held by this instance.
+            max_codes (int): Max number of codes stored per categorical
+                column. Rows of the less frequent codes are stored as one
+                other code. None stores every code.
+            skip_unchanged (bool): Leave the metadata of a previous extraction
+                in place if the fingerprint of the table has not changed
+                since then, and it was extracted with the same profiling
+                options and `estimate` setting.
+            watermark_column (str): Column whose values increase with the
+                rows appended to the table, such as a serial key or a load
+                timestamp. Mergeable aggregates of every column are stored,
+                and when the table only had rows appended since the last
+                extraction, only the rows past the largest stored watermark
+                are aggregated and merged. Cannot be used with `estimate`.
+            block_ranges (int): Split the table into this many ranges of
+                blocks, scanned `workers` at a time, and merge their partial
+                aggregates, so that one large table is scanned by several
+                connections. Medians are computed with KLL sketches. Cannot
+                be used with `estimate`.
+            run_id (str): ID of the extraction run. When columns are
+                profiled one by one, every profiled column is committed to
+                the metabase under this run, and columns already profiled by
+                an earlier attempt of the run are not profiled again. A run
+                must be resumed with the same categorical threshold, type
+                overrides, quantile method, max codes and exact numeric
+                flag.
+            instrument (bool): Record the wall time of every phase of the
+                extraction per column, with the queries, rows and bytes it
+                executed and fetched, in metabase.extraction_step under
+                `run_id`, or under a new run if not set.
+            max_memory (int): Max number of bytes of rows held at once by the
+                client, however many rows the table has. Rows streamed out
+                of the database are fetched in batches sized to fit this
+                limit. Cannot be used with the 'exact' quantile method,
+                which holds every value, nor with columns overridden as code
+                unless `max_codes` is set. Mergeable aggregates keep every
+                code, so columns overridden as code cannot be used with
+                `watermark_column`, `block_ranges` or partitioned tables.
+            exact_numeric (bool): Aggregate numeric columns as NUMERIC, with
+                statistics returned as decimals (medians only with the
+                'exact' quantile method), instead of DOUBLE PRECISION values
+                keeping 15 significant digits, e.g. for currency amounts.
+                With `watermark_column`, `block_ranges` or partitioned
+                tables, sums are aggregated as NUMERIC instead of DOUBLE
+                PRECISION, and medians still come from quantile sketches
+                of DOUBLE PRECISION values. Ignored when `estimate` is set.
+            run_options (dict): Options of the caller stored with the run
+                `run_id`, such as the table name, to be read back with
+                `checkpoint_helper.select_run` when resuming it. A run must
+                be resumed with the same options.
+
+        Returns:
+            (bool): False if the table was skipped as unchanged.
+
+        The data table is read in one REPEATABLE READ transaction, whose
+        snapshot is exported to the workers, so table and column level
+        metadata describe the same state of the table even while it is
+        being loaded.
+
+        An incremental extraction falls back to a full one when the table had
+        rows updated or deleted, its columns changed, type overrides changed
+        or appended values cannot be cast to the type of their column. Rows
+        whose watermark is null and a change of `categorical_threshold` are
+        only taken into account by full extractions.
+
+        Unless `estimate` is set, the partitions of a partitioned table are
+        profiled one by one, `workers` at a time, and their aggregates are
+        cached and merged into the metadata of the table. Only partitions
+        added or changed since the last extraction are scanned. Medians of
+        partitioned tables are computed with KLL sketches.
+
+        """
+        if estimate and watermark_column is not None:
+            raise ValueError('Estimated metadata cannot be extracted '
+                             'incrementally.')
+        if estimate and block_ranges:
+            raise ValueError('Estimated metadata cannot be extracted by '
+                             'block ranges.')
+        if workers > 1 and self.data_pool is not None \
+                and workers >= self.data_pool.maxconn:
+            raise ValueError(
+                '{} workers need a data pool of more than {} connections, '
+                'not {}.'.format(workers, workers, self.data_pool.maxconn))
+        if max_memory is not None:
+            if quantile_method == 'exact':
+                raise ValueError('Exact quantiles hold every value, so '
+                                 'their memory cannot be bounded.')
+            if max_codes is None and 'code' in type_overrides.values():
+                # Detected code columns have at most categorical_threshold
+                # codes, overridden ones any number.
+                raise ValueError('Columns overridden as code need max_codes '
+                                 'to bound memory.')
+            if 'code' in type_overrides.values() and (
+                    watermark_column is not None or block_ranges):
+                raise ValueError('Mergeable aggregates keep every code of '
+                                 'columns overridden as code, so their '
+                                 'memory cannot be bounded.')
+
+        try:
+            self.__borrow_data_connection()
+            checkpoint_run_id = run_id
+            if instrument and run_id is None:
+                # Only runs given by the caller are checkpointed.
+                run_id = uuid.uuid4().hex
+            if run_id is not None:
+                # Committed at once, so that checkpoints can refer to it.
+                with self.__metabase_connection() as conn:
+                    with conn.cursor() as cursor:
+                        checkpoint_helper.begin_run(
+                            cursor,
+                            run_id,
+                            self.data_table_id,
+                            dict(
+                                run_options,
+                                categorical_threshold=categorical_threshold,
+                                type_overrides=type_overrides,
+                                quantile_method=quantile_method,
+                                max_codes=max_codes,
+                                exact_numeric=exact_numeric,
+                            ),
+                        )
+
+            # Steps are recorded by the recorder of the caller, if any,
+            # unless they are stored.
+            recorder = instrumentation.get_recorder()
+            if instrument:
+                recorder = instrumentation.StepRecorder()
+            try:
+                with instrumentation.recording(recorder):
+                    return self.__process_table(
+                        categorical_threshold,
+                        type_overrides,
+                        single_scan,
+                        estimate,
+                        analyze,
+                        quantile_method,
+                        workers,
+                        max_codes,
+                        skip_unchanged,
+                        watermark_column,
+                        block_ranges,
+                        run_id,
+                        checkpoint_run_id,
+                        max_memory,
+                        exact_numeric,
+                    )
+            finally:
+                if instrument:
+                    # Also stored when the extraction failed.
+                    with self.__metabase_connection() as conn:
+                        with conn.cursor() as cursor:
+                            instrumentation.insert_steps(
+                                cursor, run_id, recorder)
+        finally:
+            if not self._in_context:
+                self.close()
+
+    def __process_table(self, categorical_threshold, type_overrides,
+                        single_scan, estimate, analyze, quantile_method,
+                        workers, max_codes, skip_unchanged, watermark_column,
+                        block_ranges, run_id, checkpoint_run_id,
+                        max_memory, exact_numeric):
+        """Extract the metadata of this Data Table, see `process_table`.
 
-    def process_table(self, categorical_threshold=10, type_overrides={}):
-        """Update the metabase with metadata from this Data Table."""
+        Args:
+            run_id (str): ID of the run to complete, if any.
+            checkpoint_run_id (str): ID of the run checkpointing columns, if
+                any.
 
-        with psycopg2.connect(self.metabase_connection_string) as conn:
+        Returns:
+            (bool): False if the table was skipped as unchanged.
+
+        """
+        with self.__metabase_connection() as conn:
             with conn.cursor() as cursor:
                 schema_name, table_name = self.__get_table_name(cursor)
-                self._get_table_level_metadata(cursor, schema_name, table_name)
-                self._get_column_level_metadata(
-                    cursor,
-                    schema_name,
-                    table_name,
-                    categorical_threshold,
-                    type_overrides,
-                )
+                if estimate and analyze:
+                    estimate_metadata_helper.analyze_table(
+                        self.data_cur,
+                        schema_name,
+                        table_name,
+                    )
 
-        self.data_cur.close()
-        self.data_conn.close()
+                extract_metadata_helper.begin_snapshot_transaction(
+                    self.data_conn)
+                try:
+                    partitions = []
+                    if not estimate:
+                        partitions = \
+                            partition_metadata_helper.list_partitions(
+                                self.data_cur,
+                                schema_name,
+                                table_name,
+                            )
+                    if partitions and watermark_column is not None:
+                        raise ValueError(
+                            'Partitioned tables are extracted per '
+                            'partition, not from a watermark column.')
+                    if partitions and max_memory is not None \
+                            and 'code' in type_overrides.values():
+                        raise ValueError(
+                            'Partition aggregates keep every code of '
+                            'columns overridden as code, so their memory '
+                            'cannot be bounded.')
+
+                    # Taken before profiling, so that changes made
+                    # meanwhile are extracted by the next run.
+                    fingerprint = \
+                        extract_metadata_helper.get_table_fingerprint(
+                            self.data_cur,
+                            schema_name,
+                            table_name,
+                        )
+                    partition_fingerprints = \
+                        partition_metadata_helper.\
+                        get_partition_fingerprints(
+                            self.data_cur, partitions)
+                    if partitions:
+                        fingerprint = \
+                            partition_metadata_helper.combine_fingerprints(
+                                fingerprint, partition_fingerprints)
+                    previous_fingerprint, previous_options = \
+                        extract_metadata_helper.select_table_fingerprint(
+                            cursor,
+                            self.data_table_id,
+                        )
+                    fingerprint_options = {
+                        'estimate': estimate,
+                        'categorical_threshold': categorical_threshold,
+                        'type_overrides': type_overrides,
+                        'quantile_method': quantile_method,
+                        'max_codes': max_codes,
+                        'exact_numeric': exact_numeric,
+                    }
+                    if skip_unchanged and \
+                            fingerprint == previous_fingerprint and \
+                            fingerprint_options == previous_options:
+                        return False
+
+                    extract_metadata_helper.delete_column_metadata(
+                        cursor, self.data_table_id)
+                    snapshot_id = None
+                    if workers > 1:
+                        snapshot_id = \
+                            extract_metadata_helper.export_snapshot(
+                                self.data_cur)
+                    if partitions:
+                        self.__process_partitions(
+                            cursor,
+                            schema_name,
+                            table_name,
+                            partitions,
+                            partition_fingerprints,
+                            categorical_threshold,
+                            type_overrides,
+                            workers,
+                            snapshot_id,
+                            max_codes,
+                            max_memory,
+                            exact_numeric,
+                        )
+                    elif watermark_column is None or \
+                            not self.__process_appended_rows(
+                                cursor,
+                                schema_name,
+                                table_name,
+                                categorical_threshold,
+                                type_overrides,
+                                max_codes,
+                                watermark_column,
+                                previous_fingerprint,
+                                fingerprint,
+                                max_memory,
+                                exact_numeric,
+                            ):
+                        with instrumentation.recorded_step(
+                                self.data_cur, 'get_table_level_metadata'):
+                            n_rows = self._get_table_level_metadata(
+                                cursor,
+                                schema_name,
+                                table_name,
+                                estimate,
+                            )
+                        column_profiles = self._get_column_level_metadata(
+                            cursor,
+                            schema_name,
+                            table_name,
+                            categorical_threshold,
+                            type_overrides,
+                            single_scan,
+                            estimate,
+                            n_rows,
+                            quantile_method,
+                            workers,
+                            snapshot_id,
+                            max_codes,
+                            block_ranges,
+                            checkpoint_run_id,
+                            max_memory,
+                            exact_numeric,
+                        )
+                        if watermark_column is not None:
+                            self.__store_column_aggregates(
+                                cursor,
+                                schema_name,
+                                table_name,
+                                column_profiles,
+                                watermark_column,
+                                type_overrides,
+                                max_memory,
+                                exact_numeric,
+                            )
+                    extract_metadata_helper.update_table_fingerprint(
+                        cursor,
+                        self.data_table_id,
+                        fingerprint,
+                        fingerprint_options,
+                    )
+                    if run_id is not None:
+                        checkpoint_helper.complete_run(cursor, run_id)
+                finally:
+                    # Nothing is written to the data database.
+                    extract_metadata_helper.end_snapshot_transaction(
+                        self.data_conn)
+
+        return True
+
+    @contextlib.contextmanager
+    def __metabase_connection(self):
+        """Return a metabase connection, borrowed from the pool if any.
+
+        The connection commits when the block exits without error and rolls
+        back otherwise. Its cursors are instrumented.
+
+        """
+        if self.metabase_pool is None:
+            conn = psycopg2.connect(self.metabase_connection_string)
+        else:
+            conn = self.metabase_pool.getconn()
+            conn.autocommit = False
+        conn.cursor_factory = instrumentation.MetabaseCursor
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.cursor_factory = None
+            if self.metabase_pool is None:
+                conn.close()
+            else:
+                self.metabase_pool.putconn(conn)
 
-    def _get_table_level_metadata(self, metabase_cur, schema_name, table_name):
+    def _get_table_level_metadata(self, metabase_cur, schema_name, table_name,
+                                  estimate=False, n_rows=None,
+                                  table_size=None):
         """Extract table level metadata and store it in the metabase.
 
         Extract table level metadata (number of rows, number of columns and
         file size (table size)) and store it in DataTable. Also set updated by
-        and date last updated.
+        and date last updated. The number of rows is read from planner
+        statistics if `estimate` is set, and not counted if `n_rows` is given.
+        `table_size` is given for partitioned tables, whose rows are stored by
+        their partitions.
 
         Size is in bytes
 
+        Returns:
+            (int): Number of rows.
+
         """
-        self.data_cur.execute(
-            sql.SQL('SELECT COUNT(*) as n_rows FROM {}.{};').format(
-                sql.Identifier(schema_name),
-                sql.Identifier(table_name),
+        if n_rows is not None:
+            pass
+        elif estimate:
+            n_rows, _ = estimate_metadata_helper.get_table_estimates(
+                self.data_cur,
+                schema_name,
+                table_name,
             )
-        )
-        n_rows = self.data_cur.fetchone()[0]
+        else:
+            self.data_cur.execute(
+                sql.SQL('SELECT COUNT(*) as n_rows FROM {}.{};').format(
+                    sql.Identifier(schema_name),
+                    sql.Identifier(table_name),
+                )
+            )
+            n_rows = self.data_cur.fetchone()[0]
 
         self.data_cur.execute(
             sql.SQL("""
@@ -76,11 +537,12 @@ class ExtractMetadata():
         )
         n_cols = self.data_cur.fetchone()[0]
 
-        self.data_cur.execute(
-            sql.SQL('SELECT PG_RELATION_SIZE(%s);'),
-            [schema_name + '.' + table_name],
-        )
-        table_size = self.data_cur.fetchone()[0]
+        if table_size is None:
+            self.data_cur.execute(
+                sql.SQL('SELECT PG_RELATION_SIZE(%s);'),
+                [schema_name + '.' + table_name],
+            )
+            table_size = self.data_cur.fetchone()[0]
 
         if n_rows == 0:
             raise ValueError('Selected data table has 0 rows.')
@@ -93,6 +555,7 @@ class ExtractMetadata():
                     number_rows = %(n_rows)s,
                     number_columns = %(n_cols)s,
                     size = %(table_size)s,
+                    estimated = %(estimated)s,
                     updated_by = %(user_name)s,
                     date_last_updated = (SELECT CURRENT_TIMESTAMP)
                 WHERE data_table_id = %(data_table_id)s
@@ -102,6 +565,7 @@ class ExtractMetadata():
                 'n_rows': n_rows,
                 'n_cols': n_cols,
                 'table_size': table_size,
+                'estimated': estimate,
                 'user_name': getpass.getuser(),
                 'data_table_id': self.data_table_id,
             }
@@ -110,72 +574,433 @@ class ExtractMetadata():
         # TODO: Update create_by and date_created
         # https://github.com/chapinhall/adrf-metabase/pull/8#discussion_r265339190
 
+        return n_rows
+
     def _get_column_level_metadata(self, metabase_cur, schema_name, table_name,
-                                   categorical_threshold, type_overrides):
+                                   categorical_threshold, type_overrides,
+                                   single_scan=False, estimate=False,
+                                   n_rows=None, quantile_method=None,
+                                   workers=1, snapshot_id=None,
+                                   max_codes=None, block_ranges=None,
+                                   run_id=None, max_memory=None,
+                                   exact_numeric=False):
         """Extract column level metadata and store it in the metabase.
 
-        Process columns one by one, identify or infer type, update Column Info
-        and corresponding column table.
+        Identify or infer the type of every column and aggregate its
+        statistics in the data database, then update Column Info and the
+        corresponding column table. Columns are profiled one by one, or all
+        together when `single_scan` is set. When `estimate` is set, types and
+        statistics are estimated from planner statistics for a table of
+        `n_rows` rows instead. Medians are computed by the quantile sketch
+        named by `quantile_method` if set.
+
+        Column by column profiling runs on `workers` data connections at once,
+        which all import the snapshot `snapshot_id` if given. The metabase is
+        only updated once every column has been profiled, in the transaction
+        of `metabase_cur`. At most `max_codes` codes are kept per categorical
+        column. With `block_ranges`, the table is split into ranges of blocks
+        profiled on `workers` data connections at once instead.
+
+        Columns profiled one by one are checkpointed under `run_id` if set,
+        and the checkpoints of the run are used instead of profiling again.
+        Rows streamed to the client take at most `max_memory` bytes at once
+        if set. Numeric columns are aggregated as NUMERIC if `exact_numeric`
+        is set, and as DOUBLE PRECISION otherwise.
 
         """
 
-        column_names = self.__get_column_names(schema_name, table_name)
-
-        for col_name in column_names:
-            column_results = self.__get_column_type(schema_name,
-                                                    table_name,
-                                                    col_name,
-                                                    categorical_threshold)
-            if col_name in type_overrides:
-                column_type = type_overrides[col_name]
-                if column_type in ['numeric', 'date']:
-                    msg = ('Invalid type override. Column {} cannot be '
-                           'converted to type {}').format(
-                               col_name,
-                               column_type)
-                    raise ValueError(msg)
-                if column_type == 'text':
-                    column_data = [str(i) for i in column_results.data]
-                else:
-                    column_data = column_results.data
-            else:
-                column_type = column_results.type
-                column_data = column_results.data
-
-            if column_type == 'numeric':
-                self.__update_numeric_metadata(
-                    metabase_cur,
-                    col_name, column_data)
-            elif column_type == 'text':
-                self.__update_text_metadata(
-                    metabase_cur,
-                    col_name,
-                    column_data)
-            elif column_type == 'date':
-                self.__update_date_metadata(
-                    metabase_cur,
-                    col_name,
-                    column_data)
-            elif column_type == 'code':
-                self.__update_code_metadata(
-                    metabase_cur,
+        data_types = self.__get_column_data_types(schema_name, table_name)
+        column_names = list(data_types)
+
+        self.__check_type_overrides(type_overrides)
+
+        checkpoints = {}
+        if run_id is not None:
+            checkpoints = checkpoint_helper.select_column_checkpoints(
+                metabase_cur, run_id)
+
+        # TODO: modify categorical_threshold to take percentage arguments.
+
+        if estimate:
+            column_profiles = \
+                estimate_metadata_helper.get_all_columns_estimates(
+                    self.data_cur,
+                    column_names,
+                    categorical_threshold,
+                    type_overrides,
+                    schema_name,
+                    table_name,
+                    n_rows,
+                    data_types,
+                )
+            for col_name, (column_type, column_stats) in \
+                    column_profiles.items():
+                if column_type == 'code':
+                    column_profiles[col_name] = \
+                        extract_metadata_helper.ColumnProfile(
+                            column_type,
+                            extract_metadata_helper.cap_code_frequencies(
+                                column_stats, max_codes),
+                        )
+        elif single_scan:
+            column_profiles = extract_metadata_helper.get_all_columns_metadata(
+                self.data_cur,
+                column_names,
+                categorical_threshold,
+                type_overrides,
+                schema_name,
+                table_name,
+                data_types,
+                quantile_method,
+                max_codes,
+                max_memory=max_memory,
+                exact_numeric=exact_numeric,
+            )
+        elif block_ranges:
+            column_profiles = self.__get_column_profiles_by_block_range(
+                schema_name,
+                table_name,
+                data_types,
+                categorical_threshold,
+                type_overrides,
+                block_ranges,
+                workers,
+                snapshot_id,
+                max_codes,
+                max_memory,
+                exact_numeric,
+            )
+        elif workers > 1:
+            column_profiles = self.__get_column_profiles_in_parallel(
+                schema_name,
+                table_name,
+                data_types,
+                categorical_threshold,
+                type_overrides,
+                quantile_method,
+                workers,
+                snapshot_id,
+                max_codes,
+                run_id,
+                checkpoints,
+                max_memory,
+                exact_numeric,
+            )
+        else:
+            column_profiles = {}
+            for col_name in column_names:
+                column_profiles[col_name] = self.__get_column_profile(
+                    self.data_cur,
+                    schema_name,
+                    table_name,
                     col_name,
-                    column_data)
+                    data_types[col_name],
+                    categorical_threshold,
+                    type_overrides,
+                    quantile_method,
+                    max_codes,
+                    run_id,
+                    checkpoints,
+                    max_memory,
+                    exact_numeric,
+                )
+
+        column_profiles = {col_name: column_profiles[col_name]
+                           for col_name in column_names}
+        extract_metadata_helper.update_all_columns(
+            metabase_cur,
+            column_profiles,
+            self.data_table_id,
+            estimate,
+        )
+
+        return column_profiles
+
+    def __process_appended_rows(self, metabase_cur, schema_name, table_name,
+                                categorical_threshold, type_overrides,
+                                max_codes, watermark_column,
+                                previous_fingerprint, fingerprint,
+                                max_memory=None, exact_numeric=False):
+        """Update the metabase from the rows appended since the last run.
+
+        The aggregates of the rows past the stored watermark are merged into
+        the stored aggregates, from which table and column level metadata
+        are derived. Aggregates stored with other type overrides or another
+        `exact_numeric` setting are not merged into.
+
+        Returns:
+            (bool): False if the table must be extracted in full instead.
+
+        """
+        data_types = self.__get_column_data_types(schema_name, table_name)
+        if watermark_column not in data_types:
+            raise ValueError('Watermark column {} not found in {}.{}'.format(
+                watermark_column, schema_name, table_name))
+
+        stored_column, stored_value, stored_exact_numeric, \
+            stored_type_overrides = \
+            incremental_metadata_helper.select_watermark(
+                metabase_cur, self.data_table_id)
+        if (stored_column != watermark_column or stored_value is None
+                or stored_exact_numeric != exact_numeric
+                or stored_type_overrides != type_overrides
+                or not incremental_metadata_helper.is_append_only_change(
+                    previous_fingerprint, fingerprint)):
+            return False
+
+        column_aggregates = \
+            incremental_metadata_helper.select_column_aggregates(
+                metabase_cur, self.data_table_id)
+        if set(column_aggregates) != set(data_types):
+            return False
+
+        new_watermark, new_aggregates, uncastable_columns = \
+            incremental_metadata_helper.get_column_aggregates(
+                self.data_cur,
+                {col_name: column_aggregates[col_name].type
+                 for col_name in data_types},
+                schema_name,
+                table_name,
+                watermark_column,
+                stored_value,
+                data_types,
+                max_memory=max_memory,
+                exact_numeric=exact_numeric,
+            )
+        if uncastable_columns:
+            return False
+
+        column_profiles, column_aggregates = \
+            incremental_metadata_helper.get_merged_column_profiles(
+                [
+                    {col_name: column_aggregates[col_name]
+                     for col_name in data_types},
+                    new_aggregates,
+                ],
+                categorical_threshold,
+                type_overrides,
+                max_codes,
+            )
+
+        self._get_table_level_metadata(
+            metabase_cur,
+            schema_name,
+            table_name,
+            n_rows=column_aggregates[watermark_column].row_count,
+        )
+        extract_metadata_helper.update_all_columns(
+            metabase_cur,
+            column_profiles,
+            self.data_table_id,
+        )
+        incremental_metadata_helper.update_column_aggregates(
+            metabase_cur,
+            self.data_table_id,
+            column_aggregates,
+        )
+        if new_watermark is not None:
+            incremental_metadata_helper.update_watermark(
+                metabase_cur,
+                self.data_table_id,
+                watermark_column,
+                new_watermark,
+                exact_numeric,
+                type_overrides,
+            )
+
+        return True
+
+    def __process_partitions(self, metabase_cur, schema_name, table_name,
+                             partitions, partition_fingerprints,
+                             categorical_threshold, type_overrides,
+                             workers=1, snapshot_id=None, max_codes=None,
+                             max_memory=None, exact_numeric=False):
+        """Update the metabase from the aggregates of every partition.
+
+        Partitions whose fingerprint or profiling settings changed since
+        their aggregates were cached are aggregated again, `workers` at a
+        time and largest first. The others are read from the cache.
+        Partitions which inferred different types for a column are
+        aggregated again as the type of the table.
+
+        """
+        self.__check_type_overrides(type_overrides)
+        data_types = self.__get_column_data_types(schema_name, table_name)
+        partitions = {
+            partition_metadata_helper.get_partition_name(partition):
+                partition
+            for partition in partitions
+        }
+
+        cached_partitions = partition_metadata_helper.select_partitions(
+            metabase_cur, self.data_table_id)
+        partition_aggregates = {}
+        changed_partition_names = []
+        for partition_name in partitions:
+            if cached_partitions.get(partition_name) == {
+                    'fingerprint': partition_fingerprints[partition_name],
+                    'categorical_threshold': categorical_threshold,
+                    'type_overrides': type_overrides,
+                    'exact_numeric': exact_numeric}:
+                partition_aggregates[partition_name] = \
+                    incremental_metadata_helper.select_column_aggregates(
+                        metabase_cur,
+                        self.data_table_id,
+                        partition_name,
+                    )
             else:
-                raise ValueError('Unknown column type')
+                changed_partition_names.append(partition_name)
+
+        def aggregate_partition(data_cur, partition_name):
+            return partition_metadata_helper.get_partition_aggregates(
+                data_cur,
+                partitions[partition_name],
+                data_types,
+                categorical_threshold,
+                type_overrides,
+                max_memory,
+                exact_numeric,
+            )
+
+        partition_costs = estimate_metadata_helper.get_table_costs(
+            self.data_cur, changed_partition_names)
+        partition_aggregates.update(self.__map_over_data_connections(
+            aggregate_partition,
+            estimate_metadata_helper.order_by_cost(
+                changed_partition_names, partition_costs),
+            workers,
+            snapshot_id,
+        ))
+
+        conflicting_columns = \
+            partition_metadata_helper.get_conflicting_columns(
+                partition_aggregates)
+        for partition_name, partition in partitions.items():
+            column_aggregates = \
+                partition_metadata_helper.reaggregate_partition(
+                    self.data_cur,
+                    partition,
+                    partition_aggregates[partition_name],
+                    conflicting_columns,
+                    data_types,
+                    categorical_threshold,
+                    max_memory,
+                    exact_numeric,
+                )
+            if column_aggregates is not partition_aggregates[partition_name]:
+                partition_aggregates[partition_name] = column_aggregates
+                if partition_name not in changed_partition_names:
+                    changed_partition_names.append(partition_name)
+
+        # Cached before merging, which updates quantile sketches in place.
+        for partition_name in changed_partition_names:
+            partition_metadata_helper.update_partition(
+                metabase_cur,
+                self.data_table_id,
+                partition_name,
+                partition_fingerprints[partition_name],
+                categorical_threshold,
+                type_overrides,
+                partition_aggregates[partition_name],
+                exact_numeric,
+            )
+        partition_metadata_helper.delete_partitions(
+            metabase_cur,
+            self.data_table_id,
+            set(cached_partitions) - set(partitions),
+        )
+
+        column_profiles, column_aggregates = \
+            incremental_metadata_helper.get_merged_column_profiles(
+                [partition_aggregates[partition_name]
+                 for partition_name in partitions],
+                categorical_threshold,
+                type_overrides,
+                max_codes,
+            )
+
+        self._get_table_level_metadata(
+            metabase_cur,
+            schema_name,
+            table_name,
+            n_rows=column_aggregates[next(iter(data_types))].row_count,
+            table_size=partition_metadata_helper.get_partitions_size(
+                self.data_cur, partitions.values()),
+        )
+        extract_metadata_helper.update_all_columns(
+            metabase_cur,
+            column_profiles,
+            self.data_table_id,
+        )
+
+    def __store_column_aggregates(self, metabase_cur, schema_name,
+                                  table_name, column_profiles,
+                                  watermark_column, type_overrides,
+                                  max_memory=None, exact_numeric=False):
+        """Store the aggregates of all rows and the watermark to merge into.
+
+        Columns are aggregated according to their profiled types, numeric
+        sums as NUMERIC if `exact_numeric` is set. The type overrides they
+        were profiled with are stored along.
+
+        """
+        if watermark_column not in column_profiles:
+            raise ValueError('Watermark column {} not found in {}.{}'.format(
+                watermark_column, schema_name, table_name))
+
+        watermark_value, column_aggregates, _ = \
+            incremental_metadata_helper.get_column_aggregates(
+                self.data_cur,
+                {col_name: column_profile.type
+                 for col_name, column_profile in column_profiles.items()},
+                schema_name,
+                table_name,
+                watermark_column,
+                data_types=self.__get_column_data_types(
+                    schema_name, table_name),
+                max_memory=max_memory,
+                exact_numeric=exact_numeric,
+            )
+        incremental_metadata_helper.update_column_aggregates(
+            metabase_cur,
+            self.data_table_id,
+            column_aggregates,
+        )
+        incremental_metadata_helper.update_watermark(
+            metabase_cur,
+            self.data_table_id,
+            watermark_column,
+            watermark_value,
+            exact_numeric,
+            type_overrides,
+        )
 
-    def __get_column_names(self, schema_name, table_name):
-        """Returns the names of the columns in the data table.
+    def __check_type_overrides(self, type_overrides):
+        """Raise ValueError if a column is overridden as numeric or date."""
+
+        for col_name, column_type in type_overrides.items():
+            if column_type in ['numeric', 'date']:
+                msg = ('Invalid type override. Column {} cannot be '
+                       'converted to type {}').format(
+                           col_name,
+                           column_type)
+                raise ValueError(msg)
+
+    def __get_column_data_types(self, schema_name, table_name):
+        """Returns the names and declared types of the columns in the table.
+
+        All columns are read with one catalog query.
 
         Returns:
-            (str): Column names.
+            (dict): Column names to declared types, in column order.
 
         """
         self.data_cur.execute(
                 """
-                SELECT column_name FROM INFORMATION_SCHEMA.COLUMNS
+                SELECT column_name, data_type FROM INFORMATION_SCHEMA.COLUMNS
                 WHERE table_schema = %(schema)s
-                AND table_name  = %(table)s;
+                AND table_name  = %(table)s
+                ORDER BY ordinal_position;
                 """,
                 {
                     'schema': schema_name,
@@ -184,7 +1009,7 @@ class ExtractMetadata():
                 )
 
         columns = self.data_cur.fetchall()
-        return([c[0] for c in columns])
+        return dict(columns)
 
     def __get_table_name(self, metabase_cur):
         """Return the the table schema and name using the Data Table ID.
@@ -218,96 +1043,361 @@ class ExtractMetadata():
 
         return schema_name_table_name_tp
 
-    def __get_column_type(self, schema_name, table_name, col,
-                          categorical_threshold):
-        """Identify or infer column type.
+    def __get_column_profiles_in_parallel(self, schema_name, table_name,
+                                          data_types, categorical_threshold,
+                                          type_overrides, quantile_method,
+                                          workers, snapshot_id=None,
+                                          max_codes=None, run_id=None,
+                                          checkpoints=None, max_memory=None,
+                                          exact_numeric=False):
+        """Profile columns concurrently over a pool of data connections.
 
-        Infers the column type.
+        See `__map_over_data_connections`. Columns are handed out widest
+        first according to planner statistics.
 
         Returns:
-          str: 'numeric', 'text', 'date' or 'code'
+            (dict): Column name to ColumnProfile.
 
         """
+        def profile_column(data_cur, col_name):
+            return self.__get_column_profile(
+                data_cur,
+                schema_name,
+                table_name,
+                col_name,
+                data_types[col_name],
+                categorical_threshold,
+                type_overrides,
+                quantile_method,
+                max_codes,
+                run_id,
+                checkpoints,
+                max_memory,
+                exact_numeric,
+            )
 
-        column_data = extract_metadata_helper.get_column_type(
+        column_costs = estimate_metadata_helper.get_column_costs(
             self.data_cur,
-            col,
-            categorical_threshold,
             schema_name,
-            table_name
+            table_name,
+            data_types,
+        )
+        column_profiles = self.__map_over_data_connections(
+            profile_column,
+            estimate_metadata_helper.order_by_cost(data_types, column_costs),
+            workers,
+            snapshot_id,
         )
 
-        return column_data
-
-    def __update_numeric_metadata(self, metabase_cur, col_name, col_data):
-        """Extract metadata from a numeric column.
+        return {col_name: column_profiles[col_name]
+                for col_name in data_types}
+
+    def __get_column_profiles_by_block_range(self, schema_name, table_name,
+                                             data_types,
+                                             categorical_threshold,
+                                             type_overrides, block_ranges,
+                                             workers, snapshot_id=None,
+                                             max_codes=None,
+                                             max_memory=None,
+                                             exact_numeric=False):
+        """Profile columns from the merged aggregates of ranges of blocks.
+
+        Ranges are scanned on `workers` data connections at once (see
+        `__map_over_data_connections`), first to count the values castable
+        to numeric and date, then to collect the distinct values of the
+        other columns up to the categorical threshold, and last to aggregate
+        the columns according to their types, numeric sums as NUMERIC if
+        `exact_numeric` is set.
+
+        The distinct values are collected by one scan of the range per
+        column. Medians are computed from numeric values streamed to KLL
+        sketches in Python, which do not run in parallel since they hold
+        the GIL.
 
-        Extract metadata from a numeric column and store metadata in Column
-        Info and Numeric Column. Update relevant audit fields.
+        Returns:
+            (dict): Column name to ColumnProfile.
 
         """
+        ranges = block_range_metadata_helper.get_block_ranges(
+            self.data_cur,
+            schema_name,
+            table_name,
+            block_ranges,
+        )
+        conditions = {
+            block_range:
+                block_range_metadata_helper.get_block_range_condition(
+                    block_range)
+            for block_range in ranges
+        }
+
+        column_types = dict(type_overrides)
+        probed_column_names = []
+        for col_name, data_type in data_types.items():
+            if col_name in column_types:
+                continue
+            declared_type = extract_metadata_helper.get_declared_column_type(
+                data_type)
+            if declared_type in ('numeric', 'date'):
+                column_types[col_name] = declared_type
+            elif declared_type is None:
+                probed_column_names.append(col_name)
+
+        if probed_column_names:
+            def count_castable_values(data_cur, block_range):
+                return block_range_metadata_helper.count_castable_values(
+                    data_cur,
+                    probed_column_names,
+                    schema_name,
+                    table_name,
+                    conditions[block_range],
+                )
 
-        extract_metadata_helper.update_numeric(
-            metabase_cur,
-            col_name,
-            col_data,
-            self.data_table_id,
+            cast_counts = functools.reduce(
+                block_range_metadata_helper.merge_cast_counts,
+                self.__map_over_data_connections(
+                    count_castable_values, ranges, workers, snapshot_id,
+                ).values(),
+            )
+            for col_name in probed_column_names:
+                if cast_counts[col_name]['numeric'].unparseable == 0:
+                    column_types[col_name] = 'numeric'
+                elif cast_counts[col_name]['date'].unparseable == 0:
+                    column_types[col_name] = 'date'
+
+        textual_column_names = [col_name for col_name in data_types
+                                if col_name not in column_types]
+        if textual_column_names:
+            def get_distinct_values(data_cur, block_range):
+                return block_range_metadata_helper.\
+                    get_distinct_values_bounded(
+                        data_cur,
+                        textual_column_names,
+                        schema_name,
+                        table_name,
+                        categorical_threshold + 1,
+                        conditions[block_range],
+                    )
+
+            range_distinct_values = self.__map_over_data_connections(
+                get_distinct_values, ranges, workers, snapshot_id,
+            ).values()
+            for col_name in textual_column_names:
+                distinct_values = set().union(*[
+                    values[col_name] for values in range_distinct_values])
+                if len(distinct_values) <= categorical_threshold:
+                    column_types[col_name] = 'code'
+                else:
+                    column_types[col_name] = 'text'
+
+        def aggregate_range(data_cur, block_range):
+            _, column_aggregates, _ = \
+                incremental_metadata_helper.get_column_aggregates(
+                    data_cur,
+                    {col_name: column_types[col_name]
+                     for col_name in data_types},
+                    schema_name,
+                    table_name,
+                    data_types=data_types,
+                    condition=conditions[block_range],
+                    max_memory=max_memory,
+                    exact_numeric=exact_numeric,
+                )
+            return column_aggregates
+
+        range_aggregates = self.__map_over_data_connections(
+            aggregate_range, ranges, workers, snapshot_id,
         )
+        column_profiles, _ = \
+            incremental_metadata_helper.get_merged_column_profiles(
+                [range_aggregates[block_range] for block_range in ranges],
+                categorical_threshold,
+                type_overrides,
+                max_codes,
+            )
+
+        return column_profiles
+
+    def __map_over_data_connections(self, function, items, workers,
+                                    snapshot_id=None):
+        """Call a function on items concurrently over a connection pool.
+
+        Each worker thread borrows a connection from the data pool of this
+        instance for the whole call on an item, so at most `workers` queries
+        run at once. The pool must allow `workers` connections besides the
+        one of this instance. Without a data pool, a pool of `workers`
+        connections is opened for the call. With `snapshot_id`, every call
+        reads in a transaction importing that snapshot. With one worker,
+        items are processed in turn on the data connection of this instance
+        instead.
 
-    def __update_text_metadata(self, metabase_cur, col_name, col_data):
-        """Extract metadata from a text column.
+        Args:
+            function (function): Takes a data cursor and an item.
+            items (list): Items, in the order they are handed out.
 
-        Extract metadata from a text column and store metadata in Column Info
-        and Text Column. Update relevant audit fields.
+        Returns:
+            (dict): Item to result.
 
         """
+        if workers <= 1 or len(items) <= 1:
+            return {item: function(self.data_cur, item) for item in items}
+
+        connection_pool = self.data_pool
+        if connection_pool is None:
+            connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                1,
+                workers,
+                self.data_connection_string,
+            )
 
-        extract_metadata_helper.update_text(
-            metabase_cur,
-            col_name,
-            col_data,
-            self.data_table_id,
-        )
+        # Steps of the worker threads are recorded with the recorder of
+        # this thread.
+        recorder = instrumentation.get_recorder()
 
-    def __update_date_metadata(self, metabase_cur, col_name, col_data):
-        """Extract metadata from a date column.
+        def call(item):
+            data_conn = connection_pool.getconn()
+            try:
+                if snapshot_id is None:
+                    data_conn.autocommit = True
+                else:
+                    extract_metadata_helper.begin_snapshot_transaction(
+                        data_conn, snapshot_id)
+                with data_conn.cursor(
+                        cursor_factory=instrumentation.InstrumentedCursor
+                ) as data_cur, instrumentation.recording(recorder):
+                    return function(data_cur, item)
+            finally:
+                if not data_conn.autocommit:
+                    extract_metadata_helper.end_snapshot_transaction(
+                        data_conn)
+                connection_pool.putconn(data_conn)
+
+        try:
+            with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                return dict(zip(items, executor.map(call, items)))
+        finally:
+            if self.data_pool is None:
+                connection_pool.closeall()
+
+    def __get_column_profile(self, data_cursor, schema_name, table_name,
+                             col_name, data_type, categorical_threshold,
+                             type_overrides, quantile_method=None,
+                             max_codes=None, run_id=None, checkpoints=None,
+                             max_memory=None, exact_numeric=False):
+        """Identify the type of a column and aggregate its statistics.
+
+        The checkpointed profile of the column is returned if
+        `checkpoints` has one for its declared type. Otherwise the profile
+        is checkpointed under `run_id` if set.
 
-        Extract metadata from date column and store metadate in Column Info and
-        Date Column. Update relevant audit fields.
+        Returns:
+            (ColumnProfile): Column type and statistics.
 
         """
-
-        extract_metadata_helper.update_date(
-            metabase_cur,
-            col_name,
-            col_data,
-            self.data_table_id,
+        if checkpoints and col_name in checkpoints:
+            checkpoint_data_type, column_profile = checkpoints[col_name]
+            if checkpoint_data_type == data_type:
+                return column_profile
+
+        if col_name in type_overrides:
+            column_type = type_overrides[col_name]
+        else:
+            column_type = self.__get_column_type(
+                data_cursor,
+                schema_name,
+                table_name,
+                col_name,
+                categorical_threshold,
+                data_type)
+
+        column_profile = extract_metadata_helper.ColumnProfile(
+            column_type,
+            self.__get_column_stats(
+                data_cursor,
+                schema_name,
+                table_name,
+                col_name,
+                column_type,
+                quantile_method,
+                max_codes,
+                max_memory,
+                exact_numeric),
         )
 
-    def __update_code_metadata(self, metabase_cur, col_name, col_data):
-        """Extract metadata from a categorial column.
+        if run_id is not None:
+            with self.__metabase_connection() as conn:
+                with conn.cursor() as cursor:
+                    checkpoint_helper.insert_column_checkpoint(
+                        cursor,
+                        run_id,
+                        col_name,
+                        data_type,
+                        column_profile,
+                    )
+
+        return column_profile
+
+    def __get_column_type(self, data_cursor, schema_name, table_name, col,
+                          categorical_threshold, data_type):
+        """Identify or infer column type.
+
+        Uses the declared type of natively typed columns and infers the type
+        of textual columns.
+
+        Returns:
+          str: 'numeric', 'text', 'date' or 'code'
 
-        Extract metadata from a categorial columns and store metadata in Column
-        Info and Code Frequency. Update relevant audit fields.
         """
-        # TODO: modify categorical_threshold to take percentage arguments.
 
-        extract_metadata_helper.update_code(
-            metabase_cur,
-            col_name,
-            col_data,
-            self.data_table_id,
+        column_type = extract_metadata_helper.get_column_type(
+            data_cursor,
+            col,
+            categorical_threshold,
+            schema_name,
+            table_name,
+            data_type,
         )
 
+        return column_type
+
+    def __get_column_stats(self, data_cursor, schema_name, table_name,
+                           col_name, column_type, quantile_method=None,
+                           max_codes=None, max_memory=None,
+                           exact_numeric=False):
+        """Aggregate the statistics of a column according to its type.
+
+        Returns:
+            (namedtuple): NumericStats, TextStats, DateStats or CodeStats.
+
+        """
+        kwargs = {}
+        if column_type == 'numeric':
+            get_metadata = extract_metadata_helper.get_numeric_metadata
+            kwargs['quantile_method'] = quantile_method
+            kwargs['max_memory'] = max_memory
+            kwargs['exact_numeric'] = exact_numeric
+        elif column_type == 'text':
+            get_metadata = extract_metadata_helper.get_text_metadata
+            kwargs['quantile_method'] = quantile_method
+            kwargs['max_memory'] = max_memory
+        elif column_type == 'date':
+            get_metadata = extract_metadata_helper.get_date_metadata
+        elif column_type == 'code':
+            get_metadata = extract_metadata_helper.get_code_metadata
+            kwargs['max_codes'] = max_codes
+        else:
+            raise ValueError('Unknown column type')
+
+        return get_metadata(data_cursor, col_name, schema_name, table_name,
+                            **kwargs)
+
     def export_table_metadata(self, output_filepath):
         """
         Export GMETA (metadata in JSON format) for a processed table given
         data_table_id.
 
         """
-        with psycopg2.connect(
-            self.metabase_connection_string
-                ) as metabase_conn:
+        with self.__metabase_connection() as metabase_conn:
             with metabase_conn.cursor(
                 cursor_factory=psycopg2.extras.DictCursor
                     ) as metabase_cur:
@@ -4,401 +4,1362 @@
 from collections import namedtuple, Counter
 import getpass
 import json
-import statistics
+import sys
 
-import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
 from psycopg2 import sql
 
+try:
+    import numpy
+except ImportError:
+    # Optional, see `get_value_columns`.
+    numpy = None
+
+from . import instrumentation
+from . import quantile_sketch
+
+
+NumericStats = namedtuple(
+    'numeric_stats',
+    ['min', 'max', 'mean', 'median', 'missing'],
+)
+TextStats = namedtuple(
+    'text_stats',
+    ['max_length', 'min_length', 'median_length', 'missing'],
+)
+DateStats = namedtuple('date_stats', ['min', 'max', 'missing'])
+CodeStats = namedtuple('code_stats', ['frequencies', 'missing', 'other'])
+
+# Number of values which can and cannot be cast to a type, and of nulls.
+CastCounts = namedtuple('cast_counts', ['parseable', 'unparseable', 'missing'])
+
+# Type and statistics of a profiled column.
+ColumnProfile = namedtuple('column_profile', ['type', 'stats'])
+
+
+# Declared types, as in INFORMATION_SCHEMA.COLUMNS.DATA_TYPE, for which the
+# column type is known without probing the data.
+NUMERIC_DATA_TYPES = {
+    'smallint',
+    'integer',
+    'bigint',
+    'numeric',
+    'real',
+    'double precision',
+    'money',
+}
+DATE_DATA_TYPES = {
+    'date',
+    'timestamp without time zone',
+    'timestamp with time zone',
+}
+# Declared types whose values may hold numbers or dates and are cast probed.
+TEXT_DATA_TYPES = {
+    'text',
+    'character varying',
+    'character',
+}
+
+
+def get_declared_column_type(data_type):
+    """Return the column type implied by the declared type of a column.
 
+    Args:
+        data_type (str): Declared type from INFORMATION_SCHEMA.COLUMNS, or
+            None if unknown.
+
+    Returns:
+        str: 'numeric' or 'date' for natively typed columns, 'text' for other
+            non textual types (which can only be 'code' or 'text'), or None if
+            the column has to be cast probed.
+
+    """
+    if data_type in NUMERIC_DATA_TYPES:
+        return 'numeric'
+    elif data_type in DATE_DATA_TYPES:
+        return 'date'
+    elif data_type is None or data_type in TEXT_DATA_TYPES:
+        return None
+    else:
+        return 'text'
+
+
+@instrumentation.step
 def get_column_type(data_cursor, col, categorical_threshold, schema_name,
-                    table_name):
-    """Return the column type and the contents of the column."""
+                    table_name, data_type=None):
+    """Return the column type.
+
+    Numeric and date casts are only probed for textual columns (or when the
+    declared type is unknown); natively typed columns are not scanned.
 
-    col_type = ''
-    data = []
+    Returns:
+      str: 'numeric', 'text', 'date' or 'code'
+
+    """
 
-    numeric_flag, numeric_data = is_numeric(data_cursor, col, schema_name,
+    declared_type = get_declared_column_type(data_type)
+
+    if declared_type is None:
+        cast_counts = count_castable_values(data_cursor, col, schema_name,
                                             table_name)
-    date_flag, date_data = is_date(data_cursor, col, schema_name, table_name)
-    code_flag, code_data = is_code(data_cursor, col, schema_name, table_name,
-                                   categorical_threshold)
-
-    if numeric_flag:
-        col_type = 'numeric'
-        data = numeric_data
-    elif date_flag:
-        col_type = 'date'
-        data = date_data
-    elif code_flag:
+        if cast_counts['numeric'].unparseable == 0:
+            declared_type = 'numeric'
+        elif cast_counts['date'].unparseable == 0:
+            declared_type = 'date'
+
+    if declared_type in ('numeric', 'date'):
+        col_type = declared_type
+    elif is_code(data_cursor, col, schema_name, table_name,
+                 categorical_threshold):
         col_type = 'code'
-        data = code_data
     else:
-        col_type = 'text'
-        data = code_data  # If is_code is False, column assumed to be text.
+        col_type = 'text'  # If is_code is False, column assumed to be text.
+
+    return col_type
+
 
-    column_data = namedtuple('column_data', ['type', 'data'])
-    return column_data(col_type, data)
+@instrumentation.step
+def count_castable_values(data_cursor, col, schema_name, table_name):
+    """Count the values of a column which can be cast to numeric and date.
 
+    Castability is checked inside the database without raising, so a single
+    aggregate row is returned whatever the column contents.
+
+    Returns:
+        (dict): 'numeric' and 'date' to CastCounts.
 
-def is_numeric(data_cursor, col, schema_name, table_name):
-    """Return True and contents of column if column is numeric.
     """
 
-    try:
-        data_cursor.execute(
-            sql.SQL("""
-            SELECT {}::NUMERIC FROM {}.{}
-            """).format(
-                sql.Identifier(col),
-                sql.Identifier(schema_name),
-                sql.Identifier(table_name),
-            )
+    valid_numeric = get_valid_input_check(data_cursor, 'numeric')
+    valid_date = get_valid_input_check(data_cursor, 'date')
+    value = sql.SQL('converted.value')
+
+    data_cursor.execute(
+        sql.SQL("""
+        SELECT
+            COUNT(*) FILTER (WHERE converted.value IS NULL),
+            COUNT(*) FILTER (WHERE {valid_numeric}),
+            COUNT(*) FILTER (WHERE NOT {valid_numeric}),
+            COUNT(*) FILTER (WHERE {valid_date}),
+            COUNT(*) FILTER (WHERE NOT {valid_date})
+        FROM (SELECT {col}::TEXT AS value FROM {schema}.{table}) AS converted
+        """).format(
+            valid_numeric=valid_numeric(value),
+            valid_date=valid_date(value),
+            col=sql.Identifier(col),
+            schema=sql.Identifier(schema_name),
+            table=sql.Identifier(table_name),
         )
-        data = [i[0] for i in data_cursor.fetchall()]
+    )
+    (missing, numeric, not_numeric, date,
+     not_date) = data_cursor.fetchone()
+
+    return {
+        'numeric': CastCounts(numeric, not_numeric, missing),
+        'date': CastCounts(date, not_date, missing),
+    }
+
+
+def get_valid_input_check(data_cursor, type_name):
+    """Return a function building a check that a text value casts to a type.
+
+    The check never raises, so it can be evaluated inside a larger aggregate.
+    PostgreSQL 16 and later provide `pg_input_is_valid`; on older servers a
+    temporary PL/pgSQL function trapping the cast error is created instead.
+
+    Args:
+        data_cursor: Cursor on the data database.
+        type_name (str): 'numeric' or 'date'.
+
+    Returns:
+        (function): Takes a text sql.Composable and returns a boolean
+            sql.Composed.
+
+    """
+    if data_cursor.connection.server_version >= 160000:
+        return lambda value_sql: sql.SQL('PG_INPUT_IS_VALID({}, {})').format(
+            value_sql,
+            sql.Literal(type_name),
+        )
+
+    function_name = sql.Identifier('metabase_is_valid_' + type_name)
+    data_cursor.execute(
+        sql.SQL("""
+        CREATE OR REPLACE FUNCTION pg_temp.{}(value TEXT) RETURNS BOOLEAN AS $$
+        BEGIN
+            PERFORM value::{};
+            RETURN TRUE;
+        EXCEPTION WHEN OTHERS THEN
+            RETURN FALSE;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE
+        """).format(function_name, sql.SQL(type_name.upper()))
+    )
+
+    return lambda value_sql: sql.SQL('pg_temp.{}({})').format(
+        function_name,
+        value_sql,
+    )
+
+
+@instrumentation.step
+def is_code(data_cursor, col, schema_name, table_name,
+            categorical_threshold):
+    """Return True if column is categorical.
+
+    Counting stops as soon as `categorical_threshold + 1` distinct values
+    have been seen, so high cardinality columns are not scanned in full.
+    """
+
+    n_distinct = count_distinct_bounded(
+        data_cursor,
+        col,
+        schema_name,
+        table_name,
+        categorical_threshold + 1,
+    )
+
+    if n_distinct <= categorical_threshold:
         flag = True
-    except (psycopg2.ProgrammingError, psycopg2.DataError):
-        data_cursor.execute('DROP TABLE IF EXISTS converted_data')
-        data = []
+    else:
         flag = False
 
-    return flag, data
+    return flag
+
 
+def count_distinct_bounded(data_cursor, col, schema_name, table_name,
+                           max_distinct):
+    """Return the number of distinct non-null values, up to max_distinct.
+
+    `SELECT DISTINCT ... LIMIT` still sorts or hashes the whole column
+    before the limit applies, so values are streamed through a temporary
+    PL/pgSQL function which returns once `max_distinct` distinct values have
+    been seen. The function is (re)created in the same round trip.
 
-def is_date(data_cursor, col, schema_name, table_name):
-    """Return True and contents of column if column is date.
     """
 
-    try:
-        data_cursor.execute(
-            sql.SQL("""
-            SELECT {}::DATE FROM {}.{}
-            """).format(
+    data_cursor.execute(
+        sql.SQL("""
+        CREATE OR REPLACE FUNCTION pg_temp.metabase_count_distinct_bounded(
+            query TEXT, max_distinct INTEGER
+        ) RETURNS INTEGER AS $$
+        DECLARE
+            seen TEXT[] := ARRAY[]::TEXT[];
+            value TEXT;
+        BEGIN
+            FOR value IN EXECUTE query LOOP
+                IF value IS NOT NULL AND NOT value = ANY(seen) THEN
+                    seen := seen || value;
+                    EXIT WHEN CARDINALITY(seen) >= max_distinct;
+                END IF;
+            END LOOP;
+            RETURN CARDINALITY(seen);
+        END;
+        $$ LANGUAGE plpgsql;
+
+        SELECT pg_temp.metabase_count_distinct_bounded(%s, %s);
+        """),
+        [
+            sql.SQL('SELECT {}::TEXT FROM {}.{}').format(
                 sql.Identifier(col),
                 sql.Identifier(schema_name),
                 sql.Identifier(table_name),
-            )
+            ).as_string(data_cursor),
+            max_distinct,
+        ]
+    )
+
+    return data_cursor.fetchone()[0]
+
+
+@instrumentation.step
+def update_numeric(metabase_cursor, col_name, numeric_stats, data_table_id,
+                   estimated=False):
+    """Update Column Info and Numeric Column for a numerical column."""
+
+    update_all_columns(
+        metabase_cursor,
+        {col_name: ColumnProfile('numeric', numeric_stats)},
+        data_table_id,
+        estimated,
+    )
+
+
+@instrumentation.step
+def get_numeric_metadata(data_cursor, col, schema_name, table_name,
+                         quantile_method=None, max_memory=None,
+                         exact_numeric=False):
+    """Get metdata from a numeric column.
+
+    All statistics are aggregated in the database and only the summary row
+    is returned. Nulls are ignored by the aggregates.
+
+    Args:
+        quantile_method (str): Name of a quantile sketch computing the median
+            from streamed values, or None for the exact median computed by
+            the database.
+        max_memory (int): Max bytes of streamed rows held at once, see
+            `iter_row_batches`.
+        exact_numeric (bool): Aggregate NUMERIC values, returned as
+            decimals, instead of DOUBLE PRECISION ones, see
+            `get_numeric_value`.
+
+    """
+    value = get_numeric_value(sql.SQL('converted.value'), exact_numeric)
+
+    data_cursor.execute(
+        sql.SQL("""
+        SELECT
+            MIN(converted.value),
+            MAX(converted.value),
+            AVG({value}),
+            {median},
+            COUNT(*) - COUNT(converted.value)
+        FROM (SELECT {col}::NUMERIC AS value FROM {schema}.{table})
+            AS converted
+        """).format(
+            value=value,
+            median=sql.SQL(
+                'PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY {})'
+                if quantile_method is None else 'NULL'
+            ).format(value),
+            col=sql.Identifier(col),
+            schema=sql.Identifier(schema_name),
+            table=sql.Identifier(table_name),
         )
-        data = [i[0] for i in data_cursor.fetchall()]
-        flag = True
-    except (psycopg2.ProgrammingError, psycopg2.DataError):
-        data_cursor.execute("DROP TABLE IF EXISTS converted_data")
-        data = []
-        flag = False
+    )
+    numeric_stats = NumericStats(*data_cursor.fetchone())
+
+    if quantile_method is not None:
+        medians = get_streamed_medians(
+            data_cursor,
+            {col: get_numeric_value(sql.Identifier(col), exact_numeric)},
+            schema_name,
+            table_name,
+            quantile_method,
+            max_memory,
+            exact_numeric,
+        )
+        numeric_stats = numeric_stats._replace(median=medians[col])
 
-    return flag, data
+    return numeric_stats
 
 
-def is_code(data_cursor, col, schema_name, table_name,
-            categorical_threshold):
-    """Return True and contents of column if column is categorical.
+@instrumentation.step
+def update_text(metabase_cursor, col_name, text_stats, data_table_id,
+                estimated=False):
+    """Update Column Info  and Numeric Column for a text column."""
+
+    update_all_columns(
+        metabase_cursor,
+        {col_name: ColumnProfile('text', text_stats)},
+        data_table_id,
+        estimated,
+    )
+
+
+@instrumentation.step
+def get_text_metadata(data_cursor, col, schema_name, table_name,
+                      quantile_method=None, max_memory=None):
+    """Get metadata from a text column.
+
+    Lengths are computed on the text representation of the column, so this
+    also works for columns whose type was overridden to text.
+
+    Args:
+        quantile_method (str): Name of a quantile sketch computing the median
+            length from streamed lengths, or None for the exact median
+            computed by the database.
+        max_memory (int): Max bytes of streamed rows held at once, see
+            `iter_row_batches`.
+
     """
 
     data_cursor.execute(
-        sql.SQL(
-            """
-            SELECT COUNT(DISTINCT {}) FROM {}.{}
-            """).format(
+        sql.SQL("""
+        SELECT
+            MAX(LENGTH(converted.value)),
+            MIN(LENGTH(converted.value)),
+            {},
+            COUNT(*) - COUNT(converted.value)
+        FROM (SELECT {}::TEXT AS value FROM {}.{}) AS converted
+        """).format(
+            sql.SQL(
+                'PERCENTILE_CONT(0.5) WITHIN GROUP ('
+                'ORDER BY LENGTH(converted.value))'
+                if quantile_method is None else 'NULL'
+            ),
             sql.Identifier(col),
             sql.Identifier(schema_name),
             sql.Identifier(table_name),
         )
     )
-    n_distinct = data_cursor.fetchall()[0][0]
+    # Lengths will only be None if categorical_threshold = 0
+    text_stats = TextStats(*data_cursor.fetchone())
+
+    if quantile_method is not None:
+        medians = get_streamed_medians(
+            data_cursor,
+            {col: sql.SQL('LENGTH({}::TEXT)').format(sql.Identifier(col))},
+            schema_name,
+            table_name,
+            quantile_method,
+            max_memory,
+        )
+        text_stats = text_stats._replace(median_length=medians[col])
+
+    return text_stats
+
+
+@instrumentation.step
+def update_date(metabase_cursor, col_name, date_stats,
+                data_table_id, estimated=False):
+    """
+    Update Column Info and Date Column for a date column.
+    """
+    update_all_columns(
+        metabase_cursor,
+        {col_name: ColumnProfile('date', date_stats)},
+        data_table_id,
+        estimated,
+    )
+
+
+@instrumentation.step
+def get_date_metadata(data_cursor, col, schema_name, table_name):
+    """Get metadata from a date column."""
 
-    data_cursor.execute(sql.SQL("""
-        SELECT {} FROM {}.{}
+    data_cursor.execute(
+        sql.SQL("""
+        SELECT
+            MIN(converted.value),
+            MAX(converted.value),
+            COUNT(*) - COUNT(converted.value)
+        FROM (SELECT {}::DATE AS value FROM {}.{}) AS converted
         """).format(
-                sql.Identifier(col),
-                sql.Identifier(schema_name),
-                sql.Identifier(table_name),
-        )
+            sql.Identifier(col),
+            sql.Identifier(schema_name),
+            sql.Identifier(table_name),
         )
-    data = [i[0] for i in data_cursor.fetchall()]
+    )
+    return DateStats(*data_cursor.fetchone())
 
-    if n_distinct <= categorical_threshold:
-        flag = True
-    else:
-        flag = False
 
-    return flag, data
+@instrumentation.step
+def update_code(metabase_cursor, col_name, code_stats,
+                data_table_id, estimated=False):
+    """Update Column Info and Code Frequency for a categorical column.
 
+    All codes are inserted with one statement.
 
-def update_numeric(metabase_cursor, col_name, col_data, data_table_id):
-    """Update Column Info and Numeric Column for a numerical column."""
+    """
+    update_all_columns(
+        metabase_cursor,
+        {col_name: ColumnProfile('code', code_stats)},
+        data_table_id,
+        estimated,
+    )
 
-    serial_column_id = update_column_info(metabase_cursor, col_name,
-                                          data_table_id, 'numeric')
-    # TODO: Update created by, created date.
 
-    numeric_stats = get_numeric_metadata(col_data)
+@instrumentation.step
+def get_code_metadata(data_cursor, col, schema_name, table_name,
+                      max_codes=None):
+    """Get code frequencies from a categorical column.
 
-    metabase_cursor.execute(
+    Codes are counted with a GROUP BY in the database. Nulls are counted as
+    their own code. With `max_codes`, only the most frequent codes are
+    returned and the rows of the other codes are summed in the database, so
+    the result size does not depend on the number of codes.
+
+    Args:
+        max_codes (int): Max number of non-null codes returned, or None for
+            all codes.
+
+    """
+
+    data_cursor.execute(
+        sql.SQL("""
+        SELECT
+            CASE WHEN NOT ranked.is_other THEN ranked.code END,
+            ranked.is_other,
+            SUM(ranked.frequency)
+        FROM (
+            SELECT
+                grouped.code,
+                grouped.frequency,
+                grouped.code IS NOT NULL
+                    AND %(max_codes)s IS NOT NULL
+                    AND ROW_NUMBER() OVER (
+                        PARTITION BY grouped.code IS NULL
+                        ORDER BY grouped.frequency DESC, grouped.code
+                    ) > %(max_codes)s AS is_other
+            FROM (
+                SELECT {0}::TEXT AS code, COUNT(*) AS frequency
+                FROM {1}.{2}
+                GROUP BY {0}
+            ) AS grouped
+        ) AS ranked
+        GROUP BY 1, 2
+        ORDER BY 3 DESC
+        """).format(
+            sql.Identifier(col),
+            sql.Identifier(schema_name),
+            sql.Identifier(table_name),
+        ),
+        {'max_codes': max_codes},
+    )
+
+    code_frequecy_counter = Counter()
+    other = 0
+    for code, is_other, frequency in data_cursor.fetchall():
+        if is_other:
+            other = int(frequency)
+        else:
+            code_frequecy_counter[code] = int(frequency)
+
+    return CodeStats(code_frequecy_counter,
+                     code_frequecy_counter.get(None, 0),
+                     other)
+
+
+def cap_code_frequencies(code_stats, max_codes=None):
+    """Keep the most frequent codes and sum the others in the other bucket.
+
+    Used for code frequencies which are not capped in the database.
+
+    """
+    if max_codes is None:
+        return code_stats
+
+    codes = sorted(
+        (code for code in code_stats.frequencies if code is not None),
+        key=lambda code: (-code_stats.frequencies[code], code),
+    )
+    code_frequecy_counter = Counter({
+        code: code_stats.frequencies[code] for code in codes[:max_codes]
+    })
+    if None in code_stats.frequencies:
+        code_frequecy_counter[None] = code_stats.frequencies[None]
+    other = code_stats.other + sum(
+        code_stats.frequencies[code] for code in codes[max_codes:]
+    )
+
+    return CodeStats(code_frequecy_counter, code_stats.missing, other)
+
+
+# #############################################################################
+#   Incremental extraction
+# #############################################################################
+
+@instrumentation.step
+def get_table_fingerprint(data_cursor, schema_name, table_name):
+    """Return a fingerprint changing whenever the table may have changed.
+
+    The fingerprint combines the file node of the table (changed by
+    TRUNCATE, VACUUM FULL, CLUSTER and rewriting ALTER TABLE), the inserted,
+    updated and deleted row counters of `pg_stat_user_tables`, the size of
+    the table and a hash of its column names and types. Counters include
+    rolled back changes and may be reset, which only causes an unneeded
+    extraction.
+
+    Returns:
+        (str): Fingerprint of the table.
+
+    """
+
+    data_cursor.execute(
         """
-        INSERT INTO metabase.numeric_column (
-            column_id,
-            data_table_id,
-            column_name,
-            minimum,
-            maximum,
-            mean,
-            median,
-            updated_by,
-            date_last_updated
-        ) VALUES (
-            %(column_id)s,
-            %(data_table_id)s,
-            %(column_name)s,
-            %(minimum)s,
-            %(maximum)s,
-            %(mean)s,
-            %(median)s,
-            %(updated_by)s,
-            (SELECT CURRENT_TIMESTAMP)
+        SELECT CONCAT_WS(
+            ':',
+            pg_class.relfilenode,
+            pg_stat_user_tables.n_tup_ins,
+            pg_stat_user_tables.n_tup_upd,
+            pg_stat_user_tables.n_tup_del,
+            PG_RELATION_SIZE(pg_class.oid),
+            (
+                SELECT MD5(STRING_AGG(
+                    attname || ' ' || atttypid::TEXT, ',' ORDER BY attnum))
+                FROM pg_attribute
+                WHERE
+                    attrelid = pg_class.oid
+                    AND attnum > 0
+                    AND NOT attisdropped
+            )
         )
+        FROM pg_class
+            JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+            LEFT JOIN pg_stat_user_tables
+                ON pg_stat_user_tables.relid = pg_class.oid
+        WHERE
+            pg_namespace.nspname = %(schema)s
+            AND pg_class.relname = %(table)s
         """,
         {
-            'column_id': serial_column_id,
-            'data_table_id': data_table_id,
-            'column_name': col_name,
-            'minimum': numeric_stats.min,
-            'maximum': numeric_stats.max,
-            'mean': numeric_stats.mean,
-            'median': numeric_stats.median,
-            'updated_by': getpass.getuser(),
-        }
+            'schema': schema_name,
+            'table': table_name,
+        },
     )
+    result = data_cursor.fetchone()
 
+    if result is None:
+        raise ValueError('Selected data table does not exist.')
 
-def get_numeric_metadata(col_data):
-    """Get metdata from a numeric column."""
+    return result[0]
 
-    not_null_num_ls = [num for num in col_data if num is not None]
 
-    if not_null_num_ls:
-        mean = statistics.mean(not_null_num_ls)
-        median = statistics.median(not_null_num_ls)
-        max_col = max(not_null_num_ls)
-        min_col = min(not_null_num_ls)
-    else:
-        mean = None
-        median = None
-        max_col = None
-        min_col = None
-
-    numeric_stats = namedtuple(
-        'numeric_stats',
-        ['min', 'max', 'mean', 'median'],
+def select_table_fingerprint(metabase_cursor, data_table_id):
+    """Return the fingerprint stored by the last extraction.
+
+    Returns:
+        (str, dict): (fingerprint, profiling options of the extraction),
+            both None if the table was never extracted.
+
+    """
+
+    metabase_cursor.execute(
+        """
+        SELECT fingerprint, fingerprint_options
+        FROM metabase.data_table
+        WHERE data_table_id = %(data_table_id)s
+        """,
+        {'data_table_id': data_table_id},
     )
-    return numeric_stats(min_col, max_col, mean, median)
+    result = metabase_cursor.fetchone()
 
+    return (None, None) if result is None else tuple(result)
 
-def update_text(metabase_cursor, col_name, col_data, data_table_id):
-    """Update Column Info  and Numeric Column for a text column."""
 
-    serial_column_id = update_column_info(metabase_cursor, col_name,
-                                          data_table_id, 'text')
-    # Update created by, created date.
+def update_table_fingerprint(metabase_cursor, data_table_id, fingerprint,
+                             fingerprint_options):
+    """Store the fingerprint of the extracted table.
 
-    (max_len, min_len, median_len) = get_text_metadata(col_data)
+    Args:
+        fingerprint_options (dict): Options the metadata was profiled with,
+            such as whether it was estimated, so that it is only reused by
+            extractions with the same options.
+
+    """
 
     metabase_cursor.execute(
         """
-        INSERT INTO metabase.text_column
-        (
-        column_id,
-        data_table_id,
-        column_name,
-        max_length,
-        min_length,
-        median_length,
-        updated_by,
-        date_last_updated
-        )
-        VALUES
-        (
-        %(column_id)s,
-        %(data_table_id)s,
-        %(column_name)s,
-        %(max_length)s,
-        %(min_length)s,
-        %(median_length)s,
-        %(updated_by)s,
-        (SELECT CURRENT_TIMESTAMP)
-        )
+        UPDATE metabase.data_table
+        SET
+            fingerprint = %(fingerprint)s,
+            fingerprint_options = %(fingerprint_options)s
+        WHERE data_table_id = %(data_table_id)s
         """,
         {
-            'column_id': serial_column_id,
+            'fingerprint': fingerprint,
+            'fingerprint_options': psycopg2.extras.Json(fingerprint_options),
             'data_table_id': data_table_id,
-            'column_name': col_name,
-            'max_length': max_len,
-            'min_length': min_len,
-            'median_length': median_len,
-            'updated_by': getpass.getuser(),
-        }
+        },
     )
 
 
-def get_text_metadata(col_data):
-    """Get metadata from a text column."""
+def delete_column_metadata(metabase_cursor, data_table_id):
+    """Delete the column level metadata of a previous extraction."""
+
+    for table_name in ['code_frequency', 'numeric_column', 'text_column',
+                       'date_column', 'column_info']:
+        metabase_cursor.execute(
+            sql.SQL("""
+            DELETE FROM metabase.{}
+            WHERE data_table_id = %(data_table_id)s
+            """).format(sql.Identifier(table_name)),
+            {'data_table_id': data_table_id},
+        )
 
-    not_null_text_ls = [text for text in col_data if text is not None]
 
-    if not_null_text_ls:
-        text_lens_ls = [len(text) for text in not_null_text_ls]
-        min_len = min(text_lens_ls)
-        max_len = max(text_lens_ls)
-        median_len = statistics.median(text_lens_ls)
-    else:
-        # Will only be needed if categorical_threshold = 0
-        min_len = None
-        max_len = None
-        median_len = None
+# #############################################################################
+#   Snapshot shared by parallel workers
+# #############################################################################
 
-    return (max_len, min_len, median_len)
+def begin_snapshot_transaction(data_conn, snapshot_id=None):
+    """Open a REPEATABLE READ transaction on a data connection.
 
+    All the queries of the transaction see the same state of the database.
+    With `snapshot_id`, the transaction sees the state of the transaction
+    which exported that snapshot instead.
 
-def update_date(metabase_cursor, col_name, col_data,
-                data_table_id):
     """
-    Update Column Info and Date Column for a date column.
+    data_conn.autocommit = False
+    data_conn.set_session(
+        isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ)
+    with data_conn.cursor() as data_cur:
+        if snapshot_id is None:
+            # Take the snapshot of the transaction now.
+            data_cur.execute('SELECT 1')
+        else:
+            # Must be the first statement of the transaction.
+            data_cur.execute('SET TRANSACTION SNAPSHOT %s', [snapshot_id])
+
+
+def end_snapshot_transaction(data_conn):
+    """Roll back a snapshot transaction and restore autocommit.
+
+    The connection is left as new, so that it can be returned to a pool.
+
     """
-    serial_column_id = update_column_info(metabase_cursor, col_name,
-                                          data_table_id, 'date')
+    data_conn.rollback()
+    data_conn.set_session(isolation_level='DEFAULT', autocommit=True)
 
-    (minimum, maximum) = get_date_metadata(col_data)
 
-    metabase_cursor.execute(
-        """
-        INSERT INTO metabase.date_column
-        (
-        column_id,
-        data_table_id,
-        column_name,
-        min_date,
-        max_date,
-        updated_by,
-        date_last_updated
+def export_snapshot(data_cursor):
+    """Return the ID of the snapshot of the current transaction.
+
+    The snapshot can be imported by other sessions while the transaction is
+    open.
+
+    """
+    data_cursor.execute('SELECT PG_EXPORT_SNAPSHOT()')
+    return data_cursor.fetchone()[0]
+
+
+# #############################################################################
+#   Streaming quantiles
+# #############################################################################
+
+# Number of rows fetched at once when values are streamed to the client.
+STREAM_BATCH_SIZE = 10000
+
+# Number of rows fetched first, and measured to size the next batches, when
+# streaming with a memory limit.
+SIZING_BATCH_SIZE = 100
+
+
+def get_batch_size(rows, max_memory):
+    """Return the number of rows like `rows` held in max_memory bytes.
+
+    The size of rows is measured on the first `SIZING_BATCH_SIZE` of them,
+    as Python objects, and doubled for the buffer of the database driver
+    holding the same rows while they are fetched.
+
+    """
+    sample = rows[:SIZING_BATCH_SIZE]
+    row_size = sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+        for row in sample
+    ) / len(sample)
+
+    return max(1, int(max_memory // (2 * row_size)))
+
+
+def iter_row_batches(data_cursor, query, batch_size=STREAM_BATCH_SIZE,
+                     max_memory=None):
+    """Yield the rows of a query as lists of at most batch_size rows.
+
+    Rows are read through a server-side (named) cursor, so only one batch is
+    held in memory. Named cursors need a transaction, so autocommit is
+    turned off on the connection while the rows are streamed. A transaction
+    already open on the connection, e.g. one using an exported snapshot, is
+    used as is. Queries and rows are counted for `data_cursor` (see
+    `instrumentation.InstrumentedCursor`).
+
+    With `max_memory`, batches are sized from the rows of the previous
+    batch so that a batch takes at most about `max_memory` bytes instead
+    (see `get_batch_size`), starting with `SIZING_BATCH_SIZE` rows.
+
+    """
+    connection = data_cursor.connection
+    autocommit = connection.autocommit
+    if autocommit:
+        connection.autocommit = False
+    try:
+        with connection.cursor(name='metabase_stream') as stream_cursor:
+            if max_memory is not None:
+                batch_size = min(batch_size, SIZING_BATCH_SIZE)
+            stream_cursor.itersize = batch_size
+            stream_cursor.execute(query)
+            instrumentation.count_query(data_cursor)
+            instrumentation.log_statement(data_cursor, query)
+            while True:
+                rows = stream_cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                instrumentation.count_fetched(data_cursor, rows)
+                if max_memory is not None:
+                    batch_size = get_batch_size(rows, max_memory)
+                    stream_cursor.itersize = batch_size
+                yield rows
+    finally:
+        if autocommit:
+            connection.rollback()
+            connection.autocommit = True
+
+
+def get_streamed_medians(data_cursor, value_sqls, schema_name, table_name,
+                         quantile_method, max_memory=None,
+                         exact_numeric=False):
+    """Return the medians of expressions over a table using quantile sketches.
+
+    Args:
+        value_sqls (dict): Name to SQL expression of the values.
+        quantile_method (str): Name of the quantile sketch.
+        max_memory (int): Max bytes of streamed rows held at once, see
+            `iter_row_batches`.
+        exact_numeric (bool): Some values are decimals, see
+            `get_streamed_sketches`.
+
+    Returns:
+        (dict): Name to median.
+
+    """
+    sketches = get_streamed_sketches(data_cursor, value_sqls, schema_name,
+                                     table_name, quantile_method,
+                                     max_memory=max_memory,
+                                     exact_numeric=exact_numeric)
+
+    return {name: sketch.median() for name, sketch in sketches.items()}
+
+
+def get_streamed_sketches(data_cursor, value_sqls, schema_name, table_name,
+                          quantile_method, where=None, max_memory=None,
+                          exact_numeric=False):
+    """Return quantile sketches of expressions over the rows of a table.
+
+    All expressions are streamed by one query and fed batch by batch to one
+    sketch each. Nulls are skipped. Values are numbers, converted to floats
+    by `get_value_columns` unless `exact_numeric` is set.
+
+    Args:
+        value_sqls (dict): Name to SQL expression of the values.
+        quantile_method (str): Name of the quantile sketch.
+        where (sql.Composable): WHERE clause selecting the rows, or None for
+            all rows.
+        max_memory (int): Max bytes of streamed rows held at once, see
+            `iter_row_batches`.
+        exact_numeric (bool): Some values are decimals, fed to the sketches
+            as they are.
+
+    Returns:
+        (dict): Name to QuantileSketch.
+
+    """
+    names = list(value_sqls)
+    sketches = {
+        name: quantile_sketch.get_quantile_sketch(quantile_method)
+        for name in names
+    }
+
+    query = sql.SQL('SELECT {} FROM {}.{} {}').format(
+        sql.SQL(', ').join(value_sqls[name] for name in names),
+        sql.Identifier(schema_name),
+        sql.Identifier(table_name),
+        where if where is not None else sql.SQL(''),
+    )
+    for rows in iter_row_batches(data_cursor, query,
+                                 max_memory=max_memory):
+        value_columns = get_value_columns(rows, len(names),
+                                          as_float=not exact_numeric)
+        for name, values in zip(names, value_columns):
+            sketches[name].update_batch(values)
+
+    return sketches
+
+
+def get_value_columns(rows, n_columns, as_float=True):
+    """Return the non-null values of every column of a batch of rows.
+
+    With NumPy installed, a batch of numbers `as_float` is transposed into a
+    float64 array and its nulls are dropped by vectorized operations.
+    Otherwise values are transposed one by one, as they are.
+
+    Returns:
+        ([list]): Values of every column.
+
+    """
+    if numpy is not None and as_float:
+        # Nulls become NaNs.
+        values = numpy.array(rows, dtype=numpy.float64).reshape(
+            len(rows), n_columns)
+        return [
+            column[~numpy.isnan(column)].tolist()
+            for column in values.T
+        ]
+
+    return [
+        [row[i] for row in rows if row[i] is not None]
+        for i in range(n_columns)
+    ]
+
+
+def get_numeric_value(value, exact_numeric=False):
+    """Return the SQL of a value converted for means, sums and medians.
+
+    Values are converted to DOUBLE PRECISION, whose aggregates and sorts are
+    much faster than those of NUMERIC but keep 15 significant digits only.
+    With `exact_numeric`, values are converted to NUMERIC instead, and their
+    statistics returned as decimals, e.g. for currency amounts. Medians
+    computed by PERCENTILE_CONT are DOUBLE PRECISION either way, unlike
+    those of the 'exact' quantile method. Minimums and maximums are never
+    converted, so that integers beyond 2^53 are not rounded.
+
+    Args:
+        value (sql.Composable): Value castable to NUMERIC.
+
+    """
+    if exact_numeric:
+        return sql.SQL('{}::NUMERIC').format(value)
+
+    return sql.SQL('{}::DOUBLE PRECISION').format(value)
+
+
+# #############################################################################
+#   Single scan profiling of all columns
+# #############################################################################
+
+# Upper bound on the number of columns aggregated by one query. Each column
+# adds 12 aggregates to the target list, which PostgreSQL limits to 1664
+# entries.
+COLUMNS_PER_SCAN = 100
+
+
+@instrumentation.step
+def get_all_columns_metadata(data_cursor, column_names, categorical_threshold,
+                             type_overrides, schema_name, table_name,
+                             data_types=None, quantile_method=None,
+                             max_codes=None,
+                             columns_per_scan=COLUMNS_PER_SCAN,
+                             max_memory=None, exact_numeric=False):
+    """Infer the type and get the metadata of every column in one pass.
+
+    Type probes and statistics of all candidate types are collected by a
+    single aggregate query per chunk of `columns_per_scan` columns, so the
+    table is scanned once per chunk instead of several times per column.
+    Columns which are neither numeric nor dates are then checked for being
+    categorical with an early-exit distinct count, and code frequencies of
+    all categorical columns are counted by a single GROUPING SETS query.
+
+    Args:
+        data_types (dict): Column name to declared type. Natively typed
+            columns are neither cast probed nor aggregated for other types.
+        quantile_method (str): Name of a quantile sketch computing medians
+            from values streamed by one more scan, or None for exact medians
+            computed by the database.
+        max_codes (int): Max number of codes kept per categorical column,
+            the others being summed in an other bucket. Capped columns are
+            grouped one by one.
+        max_memory (int): Max bytes of streamed rows held at once, see
+            `iter_row_batches`.
+        exact_numeric (bool): Aggregate numeric columns as NUMERIC instead
+            of DOUBLE PRECISION, see `get_numeric_value`.
+
+    Returns:
+        (dict): Column name to ColumnProfile.
+
+    """
+    if data_types is None:
+        data_types = {}
+
+    column_profiles = {}
+    for i in range(0, len(column_names), columns_per_scan):
+        chunk = column_names[i:i + columns_per_scan]
+        column_profiles.update(
+            _get_columns_chunk_metadata(
+                data_cursor,
+                chunk,
+                type_overrides,
+                schema_name,
+                table_name,
+                data_types,
+                quantile_method is None,
+                exact_numeric,
+            )
         )
-        VALUES
-        (
-        %(column_id)s,
-        %(data_table_id)s,
-        %(column_name)s,
-        %(min_date)s,
-        %(max_date)s,
-        %(updated_by)s,
-        (SELECT CURRENT_TIMESTAMP)
+
+    if quantile_method is not None:
+        _update_streamed_medians(data_cursor, column_profiles, schema_name,
+                                 table_name, quantile_method, max_memory,
+                                 exact_numeric)
+
+    for col in column_names:
+        if (column_profiles[col].type == 'text'
+                and col not in type_overrides
+                and is_code(data_cursor, col, schema_name, table_name,
+                            categorical_threshold)):
+            column_profiles[col] = ColumnProfile('code', None)
+
+    code_columns = [col for col in column_names
+                    if column_profiles[col].type == 'code']
+    if max_codes is not None:
+        for col in code_columns:
+            column_profiles[col] = ColumnProfile(
+                'code',
+                get_code_metadata(data_cursor, col, schema_name, table_name,
+                                  max_codes),
+            )
+        code_columns = []
+    for i in range(0, len(code_columns), columns_per_scan):
+        chunk = code_columns[i:i + columns_per_scan]
+        frequencies = get_code_metadata_grouping_sets(
+            data_cursor,
+            chunk,
+            schema_name,
+            table_name,
         )
-        """,
-        {
-            'column_id': serial_column_id,
-            'data_table_id': data_table_id,
-            'column_name': col_name,
-            'min_date': minimum,
-            'max_date': maximum,
-            'updated_by': getpass.getuser(),
-        }
+        for col in chunk:
+            column_profiles[col] = ColumnProfile('code', frequencies[col])
+
+    return column_profiles
+
+
+def _get_columns_chunk_metadata(data_cursor, column_names, type_overrides,
+                                schema_name, table_name, data_types,
+                                with_medians=True, exact_numeric=False):
+    """Profile a chunk of columns with one aggregate query.
+
+    Every column is converted to text, numeric and date in a subquery. Values
+    which cannot be converted become null, so the numeric and date
+    statistics are only kept when every non-null value was converted.
+    Conversions and aggregates which cannot be used given the declared type
+    or the type override of a column are replaced by nulls, as are medians
+    unless `with_medians` is set. Numeric values are aggregated as DOUBLE
+    PRECISION unless `exact_numeric` is set.
+
+    """
+    valid_numeric = get_valid_input_check(data_cursor, 'numeric')
+    valid_date = get_valid_input_check(data_cursor, 'date')
+
+    converted_ls = []
+    aggregate_ls = []
+    declared_type_ls = []
+    for i, col in enumerate(column_names):
+        declared_type = get_declared_column_type(data_types.get(col))
+        declared_type_ls.append(declared_type)
+
+        text_value = sql.SQL('{}::TEXT').format(sql.Identifier(col))
+        t, n, d = (sql.Identifier(prefix + str(i)) for prefix in 'tnd')
+
+        if declared_type == 'numeric':
+            numeric_value = sql.SQL('{}::NUMERIC').format(sql.Identifier(col))
+            date_value = sql.SQL('NULL::DATE')
+        elif declared_type == 'date':
+            numeric_value = sql.SQL('NULL::NUMERIC')
+            date_value = sql.SQL('{}::DATE').format(sql.Identifier(col))
+        elif declared_type is None:
+            numeric_value = sql.SQL(
+                'CASE WHEN {} THEN {}::NUMERIC END'
+            ).format(valid_numeric(text_value), text_value)
+            date_value = sql.SQL(
+                'CASE WHEN {} THEN {}::DATE END'
+            ).format(valid_date(text_value), text_value)
+        else:
+            numeric_value = sql.SQL('NULL::NUMERIC')
+            date_value = sql.SQL('NULL::DATE')
+
+        converted_ls.append(
+            sql.SQL('{} AS {}, {} AS {}, {} AS {}').format(
+                text_value, t,
+                numeric_value, n,
+                date_value, d,
+            )
         )
 
+        if col in type_overrides:
+            candidate_types = {type_overrides[col]}
+        elif declared_type is None:
+            candidate_types = {'numeric', 'date', 'text'}
+        else:
+            candidate_types = {declared_type}
 
-def get_date_metadata(col_data):
-    """Get metadata from a date column."""
+        aggregate_ls.append(
+            sql.SQL("""
+                COUNT(converted.{t}),
+                COUNT(converted.{n}),
+                COUNT(converted.{d})
+            """).format(t=t, n=n, d=d)
+        )
+        if 'numeric' in candidate_types:
+            value = get_numeric_value(sql.SQL('converted.') + n,
+                                      exact_numeric)
+            aggregate_ls.append(
+                sql.SQL("""
+                    MIN(converted.{n}),
+                    MAX(converted.{n}),
+                    AVG({value}),
+                    {median}
+                """).format(
+                    n=n,
+                    value=value,
+                    median=sql.SQL(
+                        'PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY {})'
+                        if with_medians else 'NULL'
+                    ).format(value),
+                )
+            )
+        else:
+            aggregate_ls.append(sql.SQL('NULL, NULL, NULL, NULL'))
+        if 'text' in candidate_types:
+            aggregate_ls.append(
+                sql.SQL("""
+                    MAX(LENGTH(converted.{t})),
+                    MIN(LENGTH(converted.{t})),
+                    {median}
+                """).format(
+                    t=t,
+                    median=sql.SQL(
+                        'PERCENTILE_CONT(0.5) WITHIN GROUP ('
+                        'ORDER BY LENGTH({}))'
+                        if with_medians else 'NULL'
+                    ).format(sql.SQL('converted.') + t),
+                )
+            )
+        else:
+            aggregate_ls.append(sql.SQL('NULL, NULL, NULL'))
+        if 'date' in candidate_types:
+            aggregate_ls.append(
+                sql.SQL("""
+                    MIN(converted.{d}),
+                    MAX(converted.{d})
+                """).format(d=d)
+            )
+        else:
+            aggregate_ls.append(sql.SQL('NULL, NULL'))
 
-    not_null_date_ls = [date for date in col_data if date is not None]
+    data_cursor.execute(
+        sql.SQL("""
+        SELECT COUNT(*), {}
+        FROM (SELECT {} FROM {}.{}) AS converted
+        """).format(
+            sql.SQL(',').join(aggregate_ls),
+            sql.SQL(',').join(converted_ls),
+            sql.Identifier(schema_name),
+            sql.Identifier(table_name),
+        )
+    )
+    result = data_cursor.fetchone()
+    n_rows = result[0]
+
+    column_profiles = {}
+    for i, col in enumerate(column_names):
+        (n_not_null, n_numeric, n_date, min_num, max_num, mean_num,
+         median_num, max_len, min_len, median_len, min_date,
+         max_date) = result[1 + 12 * i:1 + 12 * (i + 1)]
+        missing = n_rows - n_not_null
+        declared_type = declared_type_ls[i]
+
+        if col in type_overrides:
+            col_type = type_overrides[col]
+        elif declared_type is not None:
+            col_type = declared_type
+        elif n_numeric == n_not_null:
+            col_type = 'numeric'
+        elif n_date == n_not_null:
+            col_type = 'date'
+        else:
+            col_type = 'text'  # Checked for being categorical afterwards.
+
+        if col_type == 'numeric':
+            stats = NumericStats(min_num, max_num, mean_num, median_num,
+                                 missing)
+        elif col_type == 'date':
+            stats = DateStats(min_date, max_date, missing)
+        elif col_type == 'text':
+            stats = TextStats(max_len, min_len, median_len, missing)
+        else:
+            stats = None  # Code frequencies are counted separately.
 
-    if not_null_date_ls:
-        min_date = min(not_null_date_ls)
-        max_date = max(not_null_date_ls)
-    else:
-        min_date = None
-        max_date = None
+        column_profiles[col] = ColumnProfile(col_type, stats)
 
-    return (min_date, max_date)
+    return column_profiles
 
 
-def update_code(metabase_cursor, col_name, col_data,
-                data_table_id):
-    """Update Column Info and Code Frequency for a categorical column."""
+def _update_streamed_medians(data_cursor, column_profiles, schema_name,
+                             table_name, quantile_method, max_memory=None,
+                             exact_numeric=False):
+    """Set the medians of numeric and text columns from one streaming scan."""
 
-    serial_column_id = update_column_info(metabase_cursor, col_name,
-                                          data_table_id, 'code')
+    value_sqls = {}
+    for col, (col_type, _) in column_profiles.items():
+        if col_type == 'numeric':
+            value_sqls[col] = get_numeric_value(sql.Identifier(col),
+                                                exact_numeric)
+        elif col_type == 'text':
+            value_sqls[col] = sql.SQL('LENGTH({}::TEXT)').format(
+                sql.Identifier(col))
 
-    code_counter = get_code_metadata(col_data)
+    if not value_sqls:
+        return
 
-    for code, frequency in code_counter.items():
-        metabase_cursor.execute(
-            """
-            INSERT INTO metabase.code_frequency (
-                column_id,
-                data_table_id,
-                column_name,
-                code,
-                frequency,
-                updated_by,
-                date_last_updated
-            ) VALUES (
-                %(column_id)s,
-                %(data_table_id)s,
-                %(column_name)s,
-                %(code)s,
-                %(frequency)s,
-                %(updated_by)s,
-               (SELECT CURRENT_TIMESTAMP)
-            )
-            """,
-            {
-                'column_id': serial_column_id,
-                'data_table_id': data_table_id,
-                'column_name': col_name,
-                'code': code,
-                'frequency': frequency,
-                'updated_by': getpass.getuser(),
-            },
+    medians = get_streamed_medians(data_cursor, value_sqls, schema_name,
+                                   table_name, quantile_method, max_memory,
+                                   exact_numeric)
+    for col, median in medians.items():
+        col_type, stats = column_profiles[col]
+        if col_type == 'numeric':
+            stats = stats._replace(median=median)
+        else:
+            stats = stats._replace(median_length=median)
+        column_profiles[col] = ColumnProfile(col_type, stats)
+
+
+@instrumentation.step
+def get_code_metadata_grouping_sets(data_cursor, column_names, schema_name,
+                                    table_name, where=None):
+    """Get code frequencies of several categorical columns in one query.
+
+    Args:
+        where (sql.Composable): WHERE clause selecting the rows, or None for
+            all rows.
+
+    Returns:
+        (dict): Column name to CodeStats.
+
+    """
+    select_ls = []
+    for col in column_names:
+        select_ls.append(
+            sql.SQL('GROUPING({0}), {0}::TEXT').format(sql.Identifier(col))
         )
 
+    data_cursor.execute(
+        sql.SQL("""
+        SELECT {}, COUNT(*)
+        FROM {}.{}
+        {}
+        GROUP BY GROUPING SETS ({})
+        """).format(
+            sql.SQL(',').join(select_ls),
+            sql.Identifier(schema_name),
+            sql.Identifier(table_name),
+            where if where is not None else sql.SQL(''),
+            sql.SQL(',').join(
+                sql.SQL('({})').format(sql.Identifier(col))
+                for col in column_names
+            ),
+        )
+    )
 
-def get_code_metadata(col_data):
+    counters = {col: Counter() for col in column_names}
+    for row in data_cursor.fetchall():
+        frequency = row[-1]
+        for i, col in enumerate(column_names):
+            if row[2 * i] == 0:  # GROUPING() is 0 for the grouped column.
+                counters[col][row[2 * i + 1]] = frequency
+                break
+
+    return {
+        col: CodeStats(counter, counter.get(None, 0), 0)
+        for col, counter in counters.items()
+    }
 
-    code_frequecy_counter = Counter(col_data)
 
-    return code_frequecy_counter
+@instrumentation.step
+def update_all_columns(metabase_cursor, column_profiles, data_table_id,
+                       estimated=False):
+    """Update Column Info and the column tables for profiled columns.
 
+    Rows are sent with one multi-row INSERT per metabase table, so the
+    number of round trips does not depend on the number of columns or codes.
 
-def update_column_info(cursor, col_name, data_table_id, data_type):
-    """Add a row for this data column to the column info metadata table."""
+    Args:
+        column_profiles (dict): Column name to ColumnProfile.
 
-    # TODO How to handled existing rows?
+    """
+    for column_type, _ in column_profiles.values():
+        if column_type not in ('numeric', 'text', 'date', 'code'):
+            raise ValueError('Unknown column type')
+
+    if not column_profiles:
+        return
+
+    updated_by = getpass.getuser()
 
-    # Create Column Info entry
-    cursor.execute(
+    column_ids = dict(psycopg2.extras.execute_values(
+        metabase_cursor,
         """
         INSERT INTO metabase.column_info (
             data_table_id,
             column_name,
             data_type,
+            number_missing,
+            estimated,
             updated_by,
             date_last_updated
         )
-        VALUES (
-            %(data_table_id)s,
-            %(column_name)s,
-            %(data_type)s,
-            %(updated_by)s,
-            (SELECT CURRENT_TIMESTAMP)
-        )
-        RETURNING column_id
-        ;
+        VALUES %s
+        RETURNING column_name, column_id
         """,
-        {
-            'data_table_id': data_table_id,
-            'column_name': col_name,
-            'data_type': data_type,
-            'updated_by': getpass.getuser(),
-        }
-    )
+        [
+            (data_table_id, col_name, column_type, column_stats.missing,
+             estimated, updated_by)
+            for col_name, (column_type, column_stats)
+            in column_profiles.items()
+        ],
+        template='(%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)',
+        page_size=len(column_profiles),
+        fetch=True,
+    ))
+
+    rows = {'numeric': [], 'text': [], 'date': [], 'code': []}
+    for col_name, (column_type, column_stats) in column_profiles.items():
+        row_start = (column_ids[col_name], data_table_id, col_name)
+        row_end = (estimated, updated_by)
+        if column_type == 'numeric':
+            rows['numeric'].append(
+                row_start
+                + (column_stats.min, column_stats.max, column_stats.mean,
+                   column_stats.median)
+                + row_end
+            )
+        elif column_type == 'text':
+            rows['text'].append(
+                row_start
+                + (column_stats.max_length, column_stats.min_length,
+                   column_stats.median_length)
+                + row_end
+            )
+        elif column_type == 'date':
+            rows['date'].append(
+                row_start
+                + (column_stats.min, column_stats.max)
+                + row_end
+            )
+        else:
+            rows['code'].extend(
+                row_start + (code, frequency, False) + row_end
+                for code, frequency in column_stats.frequencies.items()
+            )
+            if column_stats.other:
+                rows['code'].append(
+                    row_start + (None, column_stats.other, True) + row_end)
+
+    _insert_rows(metabase_cursor, 'numeric_column',
+                 ['minimum', 'maximum', 'mean', 'median'], rows['numeric'])
+    _insert_rows(metabase_cursor, 'text_column',
+                 ['max_length', 'min_length', 'median_length'], rows['text'])
+    _insert_rows(metabase_cursor, 'date_column',
+                 ['min_date', 'max_date'], rows['date'])
+    _insert_rows(metabase_cursor, 'code_frequency',
+                 ['code', 'frequency', 'is_other'], rows['code'])
+
+
+def _insert_rows(metabase_cursor, table_name, stats_column_names, rows):
+    """Insert rows of column metadata into a metabase table at once.
 
-    serial_column_id = cursor.fetchall()[0][0]
-    return serial_column_id
+    Rows hold the column ID, data table ID and column name, then the
+    statistics, then the estimated flag and the updating user.
+    Date last updated is set to the current timestamp.
+
+    """
+    if not rows:
+        return
+
+    column_names = (['column_id', 'data_table_id', 'column_name']
+                    + stats_column_names
+                    + ['estimated', 'updated_by', 'date_last_updated'])
+    psycopg2.extras.execute_values(
+        metabase_cursor,
+        sql.SQL('INSERT INTO metabase.{} ({}) VALUES %s').format(
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(map(sql.Identifier, column_names)),
+        ),
+        rows,
+        template='({}, CURRENT_TIMESTAMP)'.format(
+            ', '.join(['%s'] * len(rows[0]))),
+        page_size=len(rows),
+    )
 
 
 # #############################################################################
@@ -579,7 +1540,10 @@ def select_categorical_gmeta_fields(metabase_cur, column_id):
         """
             SELECT code, frequency
             FROM metabase.code_frequency
-            WHERE column_id = %(column_id)s
+            WHERE
+                column_id = %(column_id)s
+                AND NOT is_other
+                AND code IS NOT NULL    -- Missing values are not a code.
             ORDER BY frequency DESC
             LIMIT 20    -- Top-k
         """,
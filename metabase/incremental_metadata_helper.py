@@ -0,0 +1,647 @@
+"""Helper functions to extract metadata of append-only tables incrementally.
+
+For every column, partial aggregates which can be merged are kept in
+`metabase.column_aggregate`: numbers of rows and nulls, sum and sum of
+squares, minimum and maximum, minimum and maximum lengths, a KLL quantile
+sketch of the values (numeric columns) or lengths (text and categorical
+columns) and the code frequencies of categorical columns. The largest value
+of a watermark column (a key or a timestamp increasing with appended rows)
+is kept in `metabase.data_table`.
+
+A later extraction then only aggregates the rows whose watermark is greater
+than the stored one, merges these aggregates into the stored ones and
+derives the metadata of the whole table from the merged aggregates. Rows
+with a null watermark are only aggregated by full extractions.
+
+Sums of numeric values are aggregated as DOUBLE PRECISION, or as NUMERIC
+for exact numeric extractions (see
+`extract_metadata_helper.get_numeric_value`), and kept as decimals either
+way. Minimums and maximums are always NUMERIC.
+"""
+
+from collections import namedtuple, Counter
+import datetime
+import decimal
+import functools
+import getpass
+
+import psycopg2.extras
+from psycopg2 import sql
+
+from . import extract_metadata_helper
+from . import instrumentation
+from .extract_metadata_helper import (
+    CodeStats,
+    ColumnProfile,
+    DateStats,
+    NumericStats,
+    TextStats,
+)
+from .quantile_sketch import KLLSketch
+
+
+ColumnAggregate = namedtuple(
+    'column_aggregate',
+    [
+        'type',
+        'row_count',
+        'null_count',
+        'value_sum',
+        'value_sum_squares',
+        'min',
+        'max',
+        'min_length',
+        'max_length',
+        'quantile_sketch',
+        'code_frequencies',
+    ],
+)
+
+
+def select_watermark(metabase_cursor, data_table_id):
+    """Return the watermark column and value of the last extraction.
+
+    Returns:
+        (str, str, bool, dict): (watermark column, watermark value, whether
+            the stored aggregates are exact numeric, type overrides they
+            were profiled with), all None if the table was never extracted
+            incrementally.
+
+    """
+
+    metabase_cursor.execute(
+        """
+        SELECT watermark_column, watermark_value, exact_numeric,
+            type_overrides
+        FROM metabase.data_table
+        WHERE data_table_id = %(data_table_id)s
+        """,
+        {'data_table_id': data_table_id},
+    )
+    result = metabase_cursor.fetchone()
+
+    return (None, None, None, None) if result is None else tuple(result)
+
+
+def update_watermark(metabase_cursor, data_table_id, watermark_column,
+                     watermark_value, exact_numeric=False,
+                     type_overrides={}):
+    """Store the watermark of the extracted rows.
+
+    Args:
+        exact_numeric (bool): Whether the stored aggregates are exact
+            numeric.
+        type_overrides (dict): Type overrides the stored aggregates were
+            profiled with.
+
+    """
+
+    metabase_cursor.execute(
+        """
+        UPDATE metabase.data_table
+        SET
+            watermark_column = %(watermark_column)s,
+            watermark_value = %(watermark_value)s,
+            exact_numeric = %(exact_numeric)s,
+            type_overrides = %(type_overrides)s
+        WHERE data_table_id = %(data_table_id)s
+        """,
+        {
+            'watermark_column': watermark_column,
+            'watermark_value': watermark_value,
+            'exact_numeric': exact_numeric,
+            'type_overrides': psycopg2.extras.Json(type_overrides),
+            'data_table_id': data_table_id,
+        },
+    )
+
+
+def is_append_only_change(previous_fingerprint, fingerprint):
+    """Return whether a table only had rows inserted between fingerprints.
+
+    Fingerprints are returned by
+    `extract_metadata_helper.get_table_fingerprint`. Only the number of
+    inserted rows and the size of the table may differ.
+
+    """
+    if previous_fingerprint is None:
+        return False
+
+    previous_parts = previous_fingerprint.split(':')
+    parts = fingerprint.split(':')
+    # File node, updated and deleted rows, column names and types.
+    return all(previous_parts[i] == parts[i] for i in (0, 2, 3, 5))
+
+
+def select_column_aggregates(metabase_cursor, data_table_id,
+                             partition_name=''):
+    """Return the partial aggregates stored by the last extraction.
+
+    Args:
+        partition_name (str): Full name of a partition of the table, or ''
+            for the whole table.
+
+    Returns:
+        (dict): Column name to ColumnAggregate.
+
+    """
+
+    metabase_cursor.execute(
+        """
+        SELECT
+            column_name,
+            data_type,
+            row_count,
+            null_count,
+            value_sum,
+            value_sum_squares,
+            min_value,
+            max_value,
+            min_length,
+            max_length,
+            quantile_sketch,
+            code_frequencies
+        FROM metabase.column_aggregate
+        WHERE
+            data_table_id = %(data_table_id)s
+            AND partition_name = %(partition_name)s
+        """,
+        {
+            'data_table_id': data_table_id,
+            'partition_name': partition_name,
+        },
+    )
+
+    column_aggregates = {}
+    for (col, col_type, row_count, null_count, value_sum, value_sum_squares,
+         min_value, max_value, min_length, max_length, sketch_state,
+         code_frequencies) in metabase_cursor.fetchall():
+        column_aggregates[col] = ColumnAggregate(
+            col_type,
+            row_count,
+            null_count,
+            value_sum,
+            value_sum_squares,
+            _parse_value(col_type, min_value),
+            _parse_value(col_type, max_value),
+            min_length,
+            max_length,
+            (KLLSketch.from_dict(sketch_state)
+             if sketch_state is not None else None),
+            (Counter(dict(map(tuple, code_frequencies)))
+             if code_frequencies is not None else None),
+        )
+
+    return column_aggregates
+
+
+@instrumentation.step
+def update_column_aggregates(metabase_cursor, data_table_id,
+                             column_aggregates, partition_name=''):
+    """Replace the stored partial aggregates of a table or a partition."""
+
+    metabase_cursor.execute(
+        """
+        DELETE FROM metabase.column_aggregate
+        WHERE
+            data_table_id = %(data_table_id)s
+            AND partition_name = %(partition_name)s
+        """,
+        {
+            'data_table_id': data_table_id,
+            'partition_name': partition_name,
+        },
+    )
+
+    if not column_aggregates:
+        return
+
+    updated_by = getpass.getuser()
+    rows = []
+    for col, aggregate in column_aggregates.items():
+        rows.append((
+            data_table_id,
+            partition_name,
+            col,
+            aggregate.type,
+            aggregate.row_count,
+            aggregate.null_count,
+            aggregate.value_sum,
+            aggregate.value_sum_squares,
+            _format_value(aggregate.min),
+            _format_value(aggregate.max),
+            aggregate.min_length,
+            aggregate.max_length,
+            (psycopg2.extras.Json(aggregate.quantile_sketch.to_dict())
+             if aggregate.quantile_sketch is not None else None),
+            (psycopg2.extras.Json(
+                sorted(aggregate.code_frequencies.items(),
+                       key=lambda item: (item[0] is None, item[0] or '')))
+             if aggregate.code_frequencies is not None else None),
+            updated_by,
+        ))
+
+    psycopg2.extras.execute_values(
+        metabase_cursor,
+        """
+        INSERT INTO metabase.column_aggregate (
+            data_table_id,
+            partition_name,
+            column_name,
+            data_type,
+            row_count,
+            null_count,
+            value_sum,
+            value_sum_squares,
+            min_value,
+            max_value,
+            min_length,
+            max_length,
+            quantile_sketch,
+            code_frequencies,
+            updated_by,
+            date_last_updated
+        )
+        VALUES %s
+        """,
+        rows,
+        template='({}, CURRENT_TIMESTAMP)'.format(', '.join(['%s'] * 15)),
+        page_size=len(rows),
+    )
+
+
+@instrumentation.step
+def get_column_aggregates(data_cursor, column_types, schema_name, table_name,
+                          watermark_column=None, watermark_value=None,
+                          data_types=None, condition=None, max_memory=None,
+                          exact_numeric=False):
+    """Aggregate the rows of a table added since a watermark.
+
+    Values of columns inferred as numeric or date are cast only when they
+    can be, and the values which cannot are counted, so that a change of
+    type is detected instead of failing.
+
+    Args:
+        column_types (dict): Column name to column type.
+        watermark_column (str): Column whose largest value is returned, or
+            None.
+        watermark_value (str): Only rows whose watermark column is greater
+            are aggregated. All rows if None.
+        data_types (dict): Column name to declared type.
+        condition (sql.Composable): Boolean expression further restricting
+            the aggregated rows, or None.
+        max_memory (int): Max bytes of rows streamed to quantile sketches
+            held at once, see `extract_metadata_helper.iter_row_batches`.
+        exact_numeric (bool): Sum numeric values as NUMERIC instead of
+            DOUBLE PRECISION.
+
+    Returns:
+        (str, dict, set): (largest watermark of the aggregated rows or None,
+            column
+            name to ColumnAggregate, names of columns with values
+            which cannot be cast to their type)
+
+    """
+    if data_types is None:
+        data_types = {}
+
+    conditions = []
+    if watermark_value is not None:
+        conditions.append(sql.SQL('{} > {}').format(
+            sql.Identifier(watermark_column),
+            sql.Literal(watermark_value),
+        ))
+    if condition is not None:
+        conditions.append(condition)
+    where = None
+    if conditions:
+        where = sql.SQL('WHERE {}').format(sql.SQL(' AND ').join(conditions))
+
+    column_names = list(column_types)
+    new_watermark = None
+    column_aggregates = {}
+    uncastable_columns = set()
+    columns_per_scan = extract_metadata_helper.COLUMNS_PER_SCAN
+    for i in range(0, len(column_names), columns_per_scan):
+        chunk_watermark, chunk_aggregates, chunk_uncastable = \
+            _get_columns_chunk_aggregates(
+                data_cursor,
+                {col: column_types[col]
+                 for col in column_names[i:i + columns_per_scan]},
+                data_types,
+                schema_name,
+                table_name,
+                watermark_column,
+                where,
+                exact_numeric,
+            )
+        new_watermark = chunk_watermark
+        column_aggregates.update(chunk_aggregates)
+        uncastable_columns.update(chunk_uncastable)
+
+    # Quantile sketches of numeric values and text lengths.
+    value_sqls = {}
+    for col, col_type in column_types.items():
+        if col in uncastable_columns:
+            continue
+        if col_type == 'numeric':
+            value_sqls[col] = sql.SQL(
+                '{}::NUMERIC::DOUBLE PRECISION').format(sql.Identifier(col))
+        elif col_type in ('text', 'code'):
+            value_sqls[col] = sql.SQL('LENGTH({}::TEXT)').format(
+                sql.Identifier(col))
+    if value_sqls:
+        sketches = extract_metadata_helper.get_streamed_sketches(
+            data_cursor,
+            value_sqls,
+            schema_name,
+            table_name,
+            'kll',
+            where,
+            max_memory,
+        )
+        for col, sketch in sketches.items():
+            column_aggregates[col] = column_aggregates[col]._replace(
+                quantile_sketch=sketch)
+
+    code_columns = [col for col, col_type in column_types.items()
+                    if col_type == 'code']
+    for i in range(0, len(code_columns), columns_per_scan):
+        chunk = code_columns[i:i + columns_per_scan]
+        code_stats = extract_metadata_helper.get_code_metadata_grouping_sets(
+            data_cursor,
+            chunk,
+            schema_name,
+            table_name,
+            where,
+        )
+        for col in chunk:
+            # Nulls are counted by null_count.
+            code_frequencies = Counter({
+                code: frequency
+                for code, frequency in code_stats[col].frequencies.items()
+                if code is not None
+            })
+            column_aggregates[col] = column_aggregates[col]._replace(
+                code_frequencies=code_frequencies)
+
+    return new_watermark, column_aggregates, uncastable_columns
+
+
+def _get_columns_chunk_aggregates(data_cursor, column_types, data_types,
+                                  schema_name, table_name, watermark_column,
+                                  where, exact_numeric=False):
+    """Aggregate a chunk of columns with one query.
+
+    Returns:
+        (str, dict, set): See `get_column_aggregates`.
+
+    """
+    valid_numeric = extract_metadata_helper.get_valid_input_check(
+        data_cursor, 'numeric')
+    valid_date = extract_metadata_helper.get_valid_input_check(
+        data_cursor, 'date')
+
+    aggregate_ls = []
+    for col, col_type in column_types.items():
+        value = sql.Identifier(col)
+        text_value = sql.SQL('{}::TEXT').format(value)
+        declared_type = extract_metadata_helper.get_declared_column_type(
+            data_types.get(col))
+
+        if col_type in ('numeric', 'date'):
+            cast_type = sql.SQL(
+                'NUMERIC' if col_type == 'numeric' else 'DATE')
+            valid = valid_numeric if col_type == 'numeric' else valid_date
+            if declared_type == col_type:
+                converted = sql.SQL('{}::{}').format(value, cast_type)
+                n_uncastable = sql.SQL('0')
+            else:
+                converted = sql.SQL(
+                    'CASE WHEN {} THEN {}::{} END'
+                ).format(valid(text_value), text_value, cast_type)
+                n_uncastable = sql.SQL(
+                    'COUNT(*) FILTER (WHERE {} IS NOT NULL AND NOT {})'
+                ).format(value, valid(text_value))
+        else:
+            converted = text_value
+            n_uncastable = sql.SQL('0')
+
+        aggregate_ls.append(sql.SQL('COUNT({}), {}').format(
+            value, n_uncastable))
+        if col_type == 'numeric':
+            aggregate_ls.append(
+                sql.SQL('SUM({0}), SUM({0} * {0}), MIN({1}), MAX({1})')
+                .format(
+                    extract_metadata_helper.get_numeric_value(
+                        converted, exact_numeric),
+                    converted,
+                )
+            )
+        elif col_type == 'date':
+            aggregate_ls.append(
+                sql.SQL('NULL, NULL, MIN({0}), MAX({0})').format(converted))
+        else:
+            aggregate_ls.append(sql.SQL('NULL, NULL, NULL, NULL'))
+        if col_type in ('text', 'code'):
+            aggregate_ls.append(
+                sql.SQL('MIN(LENGTH({0})), MAX(LENGTH({0}))')
+                .format(converted)
+            )
+        else:
+            aggregate_ls.append(sql.SQL('NULL, NULL'))
+
+    if watermark_column is None:
+        watermark = sql.SQL('NULL')
+    else:
+        watermark = sql.SQL('MAX({})::TEXT').format(
+            sql.Identifier(watermark_column))
+
+    data_cursor.execute(
+        sql.SQL("""
+        SELECT {}, COUNT(*), {}
+        FROM {}.{}
+        {}
+        """).format(
+            watermark,
+            sql.SQL(',').join(aggregate_ls),
+            sql.Identifier(schema_name),
+            sql.Identifier(table_name),
+            where if where is not None else sql.SQL(''),
+        )
+    )
+    result = data_cursor.fetchone()
+    new_watermark, n_rows = result[:2]
+
+    column_aggregates = {}
+    uncastable_columns = set()
+    for i, (col, col_type) in enumerate(column_types.items()):
+        (n_not_null, n_uncastable, value_sum, value_sum_squares, min_value,
+         max_value, min_length, max_length) = result[2 + 8 * i:2 + 8 * (i + 1)]
+        if n_uncastable:
+            uncastable_columns.add(col)
+        column_aggregates[col] = ColumnAggregate(
+            col_type,
+            n_rows,
+            n_rows - n_not_null,
+            _to_decimal(value_sum),
+            _to_decimal(value_sum_squares),
+            min_value,
+            max_value,
+            min_length,
+            max_length,
+            None,
+            None,
+        )
+
+    return new_watermark, column_aggregates, uncastable_columns
+
+
+def merge_column_aggregates(aggregate, other):
+    """Return the partial aggregates of the rows of two aggregates.
+
+    Aggregates of a categorical and a text column merge into a text column.
+    Other types must be the same.
+
+    """
+
+    def merge(values, function):
+        values = [value for value in values if value is not None]
+        return function(values) if values else None
+
+    quantile_sketch = aggregate.quantile_sketch
+    if quantile_sketch is None:
+        quantile_sketch = other.quantile_sketch
+    elif other.quantile_sketch is not None:
+        quantile_sketch.merge(other.quantile_sketch)
+
+    code_frequencies = None
+    if (aggregate.code_frequencies is not None
+            and other.code_frequencies is not None):
+        code_frequencies = aggregate.code_frequencies + other.code_frequencies
+
+    return ColumnAggregate(
+        aggregate.type if aggregate.type == other.type else 'text',
+        aggregate.row_count + other.row_count,
+        aggregate.null_count + other.null_count,
+        merge([aggregate.value_sum, other.value_sum], sum),
+        merge([aggregate.value_sum_squares, other.value_sum_squares], sum),
+        merge([aggregate.min, other.min], min),
+        merge([aggregate.max, other.max], max),
+        merge([aggregate.min_length, other.min_length], min),
+        merge([aggregate.max_length, other.max_length], max),
+        quantile_sketch,
+        code_frequencies,
+    )
+
+
+def get_column_profile(aggregate, categorical_threshold, is_overridden=False):
+    """Derive the type and statistics of a column from its aggregates.
+
+    A categorical column whose merged codes exceed `categorical_threshold`
+    becomes a text column, unless its type is overridden. Distinct values
+    only grow in an append-only table, so text columns stay text.
+
+    Returns:
+        (ColumnProfile, ColumnAggregate): Profile of the column, and its
+            aggregates with the type updated.
+
+    """
+    col_type = aggregate.type
+    if (col_type == 'code' and not is_overridden
+            and len(aggregate.code_frequencies) > categorical_threshold):
+        col_type = 'text'
+        aggregate = aggregate._replace(type='text', code_frequencies=None)
+
+    median = None
+    if aggregate.quantile_sketch is not None:
+        median = aggregate.quantile_sketch.median()
+    missing = aggregate.null_count
+    n_values = aggregate.row_count - aggregate.null_count
+
+    if col_type == 'numeric':
+        mean = None
+        if n_values:
+            mean = decimal.Decimal(aggregate.value_sum) / n_values
+        stats = NumericStats(aggregate.min, aggregate.max, mean, median,
+                             missing)
+    elif col_type == 'date':
+        stats = DateStats(aggregate.min, aggregate.max, missing)
+    elif col_type == 'text':
+        stats = TextStats(aggregate.max_length, aggregate.min_length, median,
+                          missing)
+    else:
+        frequencies = Counter(aggregate.code_frequencies)
+        if missing:
+            frequencies[None] = missing
+        stats = CodeStats(frequencies, missing, 0)
+
+    return ColumnProfile(col_type, stats), aggregate
+
+
+def get_merged_column_profiles(column_aggregates_ls, categorical_threshold,
+                               type_overrides, max_codes=None):
+    """Merge the aggregates of parts of a table into column profiles.
+
+    Args:
+        column_aggregates_ls ([dict]): Column name to ColumnAggregate of
+            every part of the table, with the same columns.
+        type_overrides (dict): Column name to column type.
+        max_codes (int): Max number of codes kept per categorical column.
+
+    Returns:
+        (dict, dict): (column name to ColumnProfile, column name to merged
+            ColumnAggregate)
+
+    """
+    column_profiles = {}
+    column_aggregates = {}
+    for col_name in column_aggregates_ls[0]:
+        column_profile, column_aggregates[col_name] = get_column_profile(
+            functools.reduce(
+                merge_column_aggregates,
+                [aggregates[col_name] for aggregates in column_aggregates_ls],
+            ),
+            categorical_threshold,
+            col_name in type_overrides,
+        )
+        if column_profile.type == 'code':
+            column_profile = ColumnProfile(
+                'code',
+                extract_metadata_helper.cap_code_frequencies(
+                    column_profile.stats, max_codes),
+            )
+        column_profiles[col_name] = column_profile
+
+    return column_profiles, column_aggregates
+
+
+def _to_decimal(value):
+    """Return a sum as a decimal, so that it merges with stored sums."""
+
+    if isinstance(value, float):
+        # Shortest decimal representation of the float.
+        return decimal.Decimal(repr(value))
+    return value
+
+
+def _format_value(value):
+    """Return a minimum or maximum as text."""
+
+    if value is None:
+        return None
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def _parse_value(col_type, value):
+    """Return a minimum or maximum stored as text."""
+
+    if value is None:
+        return None
+    if col_type == 'numeric':
+        return decimal.Decimal(value)
+    if col_type == 'date':
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    return value
@@ -0,0 +1,367 @@
+"""Instrumentation of the phases of metadata extraction.
+
+Helper functions decorated with `step` are timed while a `StepRecorder` is
+active (see `recording`). Every call records its wall time and the queries,
+rows and bytes its cursor executed and fetched, counted by
+`InstrumentedCursor`. Steps may call other steps, e.g. `get_column_type`
+calls `is_code`: the counts of a step include those of the steps nested in
+it, whose depth is one more than its own.
+
+Recorded steps are stored in `metabase.extraction_step` under the run they
+belong to (see `checkpoint_helper.begin_run`). A recorder can also log every
+statement of the data and metabase cursors, whose sequential scans are
+counted by `count_seq_scans`, so that tests can assert query budgets.
+"""
+
+from collections import namedtuple
+import contextlib
+import contextvars
+import functools
+import inspect
+import re
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from psycopg2 import sql
+
+
+StepTiming = namedtuple(
+    'StepTiming',
+    ['column_name', 'phase', 'depth', 'start_seconds', 'seconds',
+     'rows_fetched', 'bytes_fetched', 'query_count'],
+)
+
+# Recorder of the steps of the current thread, or None.
+_recorder = contextvars.ContextVar('metabase_step_recorder', default=None)
+# Number of steps the current step is nested in.
+_depth = contextvars.ContextVar('metabase_step_depth', default=0)
+
+# Names of the parameters holding the column profiled by a step.
+COLUMN_PARAMETERS = ['col', 'col_name']
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Cursor counting the queries it executed and the rows it fetched.
+
+    Rows and bytes are only counted while a recorder is active, bytes as the
+    length of the text of non-null values.
+
+    """
+
+    # Database the cursor reads, as logged by recorders.
+    database = 'data'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_count = 0
+        self.rows_fetched = 0
+        self.bytes_fetched = 0
+
+    def execute(self, query, vars=None):
+        count_query(self)
+        result = super().execute(query, vars)
+        log_statement(self, self.query)
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            count_fetched(self, [row])
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            rows = super().fetchmany()
+        else:
+            rows = super().fetchmany(size)
+        count_fetched(self, rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        count_fetched(self, rows)
+        return rows
+
+
+class MetabaseCursor(InstrumentedCursor):
+    """Instrumented cursor of a metabase connection."""
+
+    database = 'metabase'
+
+
+def count_query(cursor):
+    """Count a query executed for a cursor, if it is instrumented."""
+
+    if isinstance(cursor, InstrumentedCursor):
+        cursor.query_count += 1
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.add_counts(0, 0, 1)
+
+
+def log_statement(cursor, statement):
+    """Log a statement executed for a cursor, if it is instrumented.
+
+    Statements are only logged if the active recorder logs statements.
+
+    """
+    recorder = _recorder.get()
+    if isinstance(cursor, InstrumentedCursor) and recorder is not None \
+            and recorder.log_statements:
+        if isinstance(statement, sql.Composable):
+            statement = statement.as_string(cursor)
+        elif isinstance(statement, bytes):
+            statement = statement.decode()
+        recorder.add_statement(cursor.database, statement)
+
+
+def count_fetched(cursor, rows):
+    """Count rows fetched for a cursor, if it is instrumented.
+
+    Used as well for rows fetched by another cursor on behalf of this one,
+    such as the server-side cursor of
+    `extract_metadata_helper.iter_row_batches`.
+
+    """
+    recorder = _recorder.get()
+    if isinstance(cursor, InstrumentedCursor) and recorder is not None:
+        bytes_fetched = sum(
+            len(str(value))
+            for row in rows
+            for value in row
+            if value is not None
+        )
+        cursor.rows_fetched += len(rows)
+        cursor.bytes_fetched += bytes_fetched
+        recorder.add_counts(len(rows), bytes_fetched, 0)
+
+
+def _get_counts(cursor):
+    """Return the counts of a cursor, or Nones if it is not instrumented."""
+
+    if isinstance(cursor, InstrumentedCursor):
+        return (cursor.rows_fetched, cursor.bytes_fetched, cursor.query_count)
+    return (None, None, None)
+
+
+class StepRecorder():
+    """Steps recorded by every thread of an extraction.
+
+    The recorder also counts every query, row and byte of instrumented
+    cursors while it is active, within steps or not, and with
+    `log_statements` logs every query as (database, statement), with its
+    parameters bound.
+
+    """
+
+    def __init__(self, log_statements=False):
+        self.start = time.perf_counter()
+        self.steps = []
+        self.log_statements = log_statements
+        self.statements = []
+        self.rows_fetched = 0
+        self.bytes_fetched = 0
+        self.query_count = 0
+        self._lock = threading.Lock()
+
+    def add(self, step_timing):
+        with self._lock:
+            self.steps.append(step_timing)
+
+    def add_counts(self, rows_fetched, bytes_fetched, query_count):
+        with self._lock:
+            self.rows_fetched += rows_fetched
+            self.bytes_fetched += bytes_fetched
+            self.query_count += query_count
+
+    def add_statement(self, database, statement):
+        with self._lock:
+            self.statements.append((database, statement))
+
+    def get_seconds(self):
+        """Return the wall time since the recorder was created."""
+
+        return time.perf_counter() - self.start
+
+
+@contextlib.contextmanager
+def recording(recorder):
+    """Record steps of the current thread with a recorder, if not None.
+
+    Threads do not inherit the recorder: worker threads must record with
+    the recorder of the thread handing them out work.
+
+    """
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def get_recorder():
+    """Return the recorder of the current thread, or None."""
+
+    return _recorder.get()
+
+
+@contextlib.contextmanager
+def recorded_step(cursor, phase, column_name=None):
+    """Record the block as a step, if a recorder is active.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): Cursor whose queries and rows
+            are counted, if instrumented.
+        phase (str): Name of the step.
+        column_name (str): Column profiled by the step, if any.
+
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        yield
+        return
+
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    counts = _get_counts(cursor)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _depth.reset(token)
+        recorder.add(StepTiming(
+            column_name,
+            phase,
+            depth,
+            start - recorder.start,
+            end - start,
+            *[
+                None if count is None else end_count - count
+                for count, end_count in zip(counts, _get_counts(cursor))
+            ]
+        ))
+
+
+def step(function):
+    """Record calls of a function as steps named after it.
+
+    The cursor of the step is the first argument of the function, and its
+    column the argument named as one of `COLUMN_PARAMETERS`, if any.
+
+    """
+    parameters = list(inspect.signature(function).parameters)
+    column_parameters = [name for name in parameters
+                         if name in COLUMN_PARAMETERS]
+    column_parameter = column_parameters[0] if column_parameters else None
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _recorder.get() is None:
+            return function(*args, **kwargs)
+
+        column_name = None
+        if column_parameter is not None:
+            column_index = parameters.index(column_parameter)
+            if column_index < len(args):
+                column_name = args[column_index]
+            else:
+                column_name = kwargs.get(column_parameter)
+        cursor = args[0] if args else None
+
+        with recorded_step(cursor, function.__name__, column_name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def insert_steps(metabase_cursor, run_id, recorder):
+    """Store the steps recorded for a run, and its total wall time.
+
+    The wall time of a resumed run is that of its last attempt.
+
+    """
+
+    psycopg2.extras.execute_values(
+        metabase_cursor,
+        """
+        INSERT INTO metabase.extraction_step (
+            run_id,
+            column_name,
+            phase,
+            depth,
+            start_seconds,
+            seconds,
+            rows_fetched,
+            bytes_fetched,
+            query_count,
+            date_created
+        )
+        VALUES %s
+        """,
+        [(run_id, ) + tuple(step_timing) for step_timing in recorder.steps],
+        template='(%s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)',
+    )
+    metabase_cursor.execute(
+        """
+        UPDATE metabase.extraction_run
+        SET seconds = %(seconds)s
+        WHERE run_id = %(run_id)s
+        """,
+        {
+            'run_id': run_id,
+            'seconds': recorder.get_seconds(),
+        },
+    )
+
+
+def count_seq_scans(cursor, statement, table_name=None):
+    """Count the sequential scans in the plan of a statement.
+
+    Only single SELECT statements are explained. Statements defining and
+    calling a temporary PL/pgSQL function, such as
+    `extract_metadata_helper.count_distinct_bounded`, are counted from the
+    queries passed to the function as string literals, which it executes.
+    The transaction of the cursor is rolled back afterwards, so the cursor
+    must not be used for anything else in that transaction.
+
+    Args:
+        table_name (str): Only count the scans of this table, if set.
+
+    Returns:
+        (int): Number of Seq Scan nodes, or None if the statement cannot be
+            explained.
+
+    """
+    if '$$' in statement:
+        # Literals of the statements after the function body.
+        literals = re.findall(r"'((?:[^']|'')*)'",
+                              statement.rsplit('$$', 1)[1])
+        return sum(
+            count_seq_scans(cursor, literal.replace("''", "'"),
+                            table_name) or 0
+            for literal in literals
+        )
+
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')) \
+            or ';' in statement.strip().rstrip(';'):
+        return None
+
+    try:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement)
+        plan = cursor.fetchone()[0]
+    except psycopg2.Error:
+        return None
+    finally:
+        cursor.connection.rollback()
+
+    def count(node):
+        is_seq_scan = node['Node Type'] == 'Seq Scan' and (
+            table_name is None or node['Relation Name'] == table_name)
+        return int(is_seq_scan) + sum(
+            count(child) for child in node.get('Plans', []))
+
+    return count(plan[0]['Plan'])
@@ -3,6 +3,9 @@
 import argparse
 import json
 
+from . import quantile_sketch
+from .benchmark_mixes import MIXES
+
 
 class ParseInput():
     """Class to parse json input."""
@@ -37,6 +40,33 @@ class ParseInput():
         self.gmeta_output = data['gmeta_output']
 
 
+def parse_manifest(file_name):
+    """Load the full names of the tables listed in a manifest file.
+
+    The manifest lists one <schema>.<table> per line. Blank lines and lines
+    starting with # are ignored.
+
+    Args:
+        file_name (str): Text file listing tables.
+
+    Returns:
+        ([str]): Full table names.
+
+    """
+    with open(file_name) as f:
+        lines = [line.strip() for line in f]
+
+    full_table_names = [
+        line for line in lines if line and not line.startswith('#')
+    ]
+    for full_table_name in full_table_names:
+        if len(full_table_name.split('.')) != 2:
+            raise ValueError('Table {} is not in <schema>.<table> '
+                             'format'.format(full_table_name))
+
+    return full_table_names
+
+
 def parse_command_line_args(args):
     """Parse command line arguments.
 
@@ -61,23 +91,101 @@ def parse_command_line_args(args):
     parser.add_argument(
         '-f', '--input_file', type=str,
         help='JSON file containing input parameters')
+    parser.add_argument(
+        '--schema_all', '--schema-all', type=str,
+        help='Schema name of the data, to extract all its tables')
+    parser.add_argument(
+        '--manifest', type=str,
+        help='File listing the tables to extract, one <schema>.<table> per '
+             'line')
+    parser.add_argument(
+        '--table_workers', type=int, default=1,
+        help='Number of tables extracted concurrently in batch mode')
+    parser.add_argument(
+        '--single_scan', action='store_true',
+        help='Profile all columns with one scan of the table')
+    parser.add_argument(
+        '--estimate', action='store_true',
+        help='Estimate metadata from planner statistics instead of scanning')
+    parser.add_argument(
+        '--analyze', action='store_true',
+        help='Run ANALYZE on the table before estimating metadata')
+    parser.add_argument(
+        '--quantile_method', type=str, default=None,
+        choices=sorted(quantile_sketch.QUANTILE_SKETCHES),
+        help='Compute medians with a quantile sketch over streamed values')
+    parser.add_argument(
+        '-w', '--workers', type=int, default=1,
+        help='Number of columns profiled concurrently')
+    parser.add_argument(
+        '--max_codes', type=int, default=None,
+        help='Max number of codes stored per categorical column')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Reuse the metadata of tables unchanged since their last '
+             'extraction')
+    parser.add_argument(
+        '--watermark_column', type=str, default=None,
+        help='Column increasing with appended rows, to only aggregate the '
+             'rows appended since the last extraction')
+    parser.add_argument(
+        '--block_ranges', type=int, default=None,
+        help='Number of block ranges the table is split into, scanned '
+             '--workers at a time')
+    parser.add_argument(
+        '--checkpoint', action='store_true',
+        help='Checkpoint columns as they are profiled, so that the run can '
+             'be resumed with --resume if interrupted')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='ID of an interrupted extraction run to resume')
+    parser.add_argument(
+        '--timing', action='store_true',
+        help='Record the wall time, queries and rows fetched of every phase '
+             'of the extraction in metabase.extraction_step')
+    parser.add_argument(
+        '--max_memory_mb', type=int, default=None,
+        help='Max megabytes of rows held at once while streaming them out '
+             'of the database')
+    parser.add_argument(
+        '--exact_numeric', action='store_true',
+        help='Aggregate numeric columns as exact decimals instead of double '
+             'precision floats')
 
     out = parser.parse_args(args)
 
     # Validation
-    msg = ('Either an input file or both a table name and schema name must be '
-           'provided.')
-    if out.input_file is None:
-        if (out.schema is None) or (out.table is None):
-            raise ValueError(msg)
+    msg = ('Either an input file, both a table name and schema name, a '
+           'schema to extract entirely, a manifest or a run to resume must '
+           'be provided.')
+    n_table_sources = sum([
+        out.input_file is not None,
+        (out.schema is not None) or (out.table is not None),
+        out.schema_all is not None,
+        out.manifest is not None,
+        out.resume is not None,
+    ])
+    if n_table_sources != 1:
+        raise ValueError(msg)
 
-    if out.input_file is not None:
-        if (out.schema is not None) or (out.table is not None):
-            raise ValueError(msg)
+    if (out.schema is not None) != (out.table is not None):
+        raise ValueError(msg)
+
+    if out.max_memory_mb is not None and out.max_memory_mb <= 0:
+        raise ValueError('Max memory must be positive.')
 
     return out
 
 
+def get_max_memory(args):
+    """Return the max memory of parsed arguments in bytes, or None."""
+
+    if args.max_memory_mb is None:
+        return None
+
+    return args.max_memory_mb * 2**20
+
+
 def derive_full_table_name(args):
     """Derive the full table name from command line arguments.
 
@@ -104,3 +212,83 @@ def derive_full_table_name(args):
         raise ValueError('Invalid table and schema names provided.')
 
     return full_table_name
+
+
+def parse_benchmark_args(args):
+    """Parse command line arguments of the benchmark script.
+
+    Every combination of the given row counts, column counts, type mixes,
+    null ratios and cardinalities is a benchmark case.
+
+    Args:
+        args ([str]): List of command line arguments and flags.
+
+    Returns
+        (argparse.Namespace): Parsed arguments from argparse
+
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--rows', type=int, nargs='+', default=[1000, 100000],
+        help='Numbers of rows of the synthetic tables')
+    parser.add_argument(
+        '--columns', type=int, nargs='+', default=[8],
+        help='Numbers of columns of the synthetic tables')
+    parser.add_argument(
+        '--mixes', type=str, nargs='+', default=['mixed'],
+        choices=sorted(MIXES),
+        help='Mixes of column kinds of the synthetic tables')
+    parser.add_argument(
+        '--null_ratios', type=float, nargs='+', default=[0.0, 0.2],
+        help='Ratios of null values in every column')
+    parser.add_argument(
+        '--cardinalities', type=int, nargs='+', default=[5, 1000],
+        help='Numbers of distinct values in every column')
+    parser.add_argument(
+        '--repeat', type=int, default=1,
+        help='Number of extractions of every synthetic table')
+    parser.add_argument(
+        '-o', '--output', type=str, default=None,
+        help='File the JSON lines of the results are appended to, instead '
+             'of the standard output')
+    parser.add_argument(
+        '-c', '--categorical', type=int, default=10,
+        help='Max number of distinct values in all categorical columns')
+    parser.add_argument(
+        '--single_scan', action='store_true',
+        help='Profile all columns with one scan of the table')
+    parser.add_argument(
+        '--estimate', action='store_true',
+        help='Estimate metadata from planner statistics instead of scanning')
+    parser.add_argument(
+        '--quantile_method', type=str, default=None,
+        choices=sorted(quantile_sketch.QUANTILE_SKETCHES),
+        help='Compute medians with a quantile sketch over streamed values')
+    parser.add_argument(
+        '-w', '--workers', type=int, default=1,
+        help='Number of columns profiled concurrently')
+    parser.add_argument(
+        '--block_ranges', type=int, default=None,
+        help='Number of block ranges the table is split into, scanned '
+             '--workers at a time')
+    parser.add_argument(
+        '--max_memory_mb', type=int, default=None,
+        help='Max megabytes of rows held at once while streaming them out '
+             'of the database')
+    parser.add_argument(
+        '--exact_numeric', action='store_true',
+        help='Aggregate numeric columns as exact decimals instead of double '
+             'precision floats')
+
+    out = parser.parse_args(args)
+
+    if any(not 0 <= null_ratio <= 1 for null_ratio in out.null_ratios):
+        raise ValueError('Null ratios must be between 0 and 1.')
+    if any(n <= 0 for n in out.rows + out.columns + out.cardinalities):
+        raise ValueError('Numbers of rows, columns and distinct values must '
+                         'be positive.')
+    if out.max_memory_mb is not None and out.max_memory_mb <= 0:
+        raise ValueError('Max memory must be positive.')
+
+    return out
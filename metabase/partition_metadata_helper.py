@@ -0,0 +1,365 @@
+"""Helper functions to extract metadata of partitioned tables per partition.
+
+The leaf partitions of a declaratively partitioned table are found through
+`pg_inherits` and each of them is aggregated on its own (see
+`incremental_metadata_helper.get_column_aggregates`). The aggregates of
+every partition are cached in `metabase.column_aggregate` under the name of
+the partition, with its fingerprint in `metabase.data_partition`, so that a
+later extraction only aggregates the partitions added or changed since
+then. The metadata of the partitioned table is derived from the merged
+aggregates of its partitions.
+"""
+
+import getpass
+import hashlib
+
+import psycopg2.extras
+from psycopg2 import sql
+
+from . import extract_metadata_helper
+from . import incremental_metadata_helper
+from . import instrumentation
+
+
+# Cached partition: its fingerprint and the profiling settings it was
+# aggregated with.
+PARTITION_FIELDS = ['fingerprint', 'categorical_threshold', 'type_overrides',
+                    'exact_numeric']
+
+
+def list_partitions(data_cursor, schema_name, table_name):
+    """Return the leaf partitions of a partitioned table.
+
+    Partitions of partitions are followed down to the partitions holding
+    rows.
+
+    Returns:
+        ([(str, str)]): (schema name, table name) of every leaf partition, in
+            name order. Empty if the table is not partitioned.
+
+    """
+
+    data_cursor.execute(
+        """
+        WITH RECURSIVE partition_tree AS (
+            SELECT pg_class.oid, pg_class.relkind
+            FROM pg_class
+                JOIN pg_namespace
+                    ON pg_namespace.oid = pg_class.relnamespace
+            WHERE
+                pg_namespace.nspname = %(schema)s
+                AND pg_class.relname = %(table)s
+                AND pg_class.relkind = 'p'
+            UNION ALL
+            SELECT child.oid, child.relkind
+            FROM partition_tree
+                JOIN pg_inherits
+                    ON pg_inherits.inhparent = partition_tree.oid
+                JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        )
+        SELECT pg_namespace.nspname, pg_class.relname
+        FROM partition_tree
+            JOIN pg_class ON pg_class.oid = partition_tree.oid
+            JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+        WHERE partition_tree.relkind <> 'p'
+        ORDER BY pg_namespace.nspname, pg_class.relname
+        """,
+        {
+            'schema': schema_name,
+            'table': table_name,
+        },
+    )
+
+    return [tuple(partition) for partition in data_cursor.fetchall()]
+
+
+def get_partition_name(partition):
+    """Return the full name of a partition, as stored in the metabase."""
+
+    return '.'.join(partition)
+
+
+def get_partition_fingerprints(data_cursor, partitions):
+    """Return the fingerprints of partitions.
+
+    Returns:
+        (dict): Full partition name to fingerprint, see
+            `extract_metadata_helper.get_table_fingerprint`.
+
+    """
+    return {
+        get_partition_name(partition):
+            extract_metadata_helper.get_table_fingerprint(
+                data_cursor, *partition)
+        for partition in partitions
+    }
+
+
+def get_partitions_size(data_cursor, partitions):
+    """Return the total size of partitions in bytes."""
+
+    partitions = list(partitions)
+    data_cursor.execute(
+        """
+        SELECT COALESCE(SUM(PG_RELATION_SIZE(
+            FORMAT('%%I.%%I', partition.schema_name, partition.table_name)
+        )), 0)
+        FROM UNNEST(%(schema_names)s::TEXT[], %(table_names)s::TEXT[])
+            AS partition (schema_name, table_name)
+        """,
+        {
+            'schema_names': [schema_name for schema_name, _ in partitions],
+            'table_names': [table_name for _, table_name in partitions],
+        },
+    )
+
+    return data_cursor.fetchone()[0]
+
+
+def combine_fingerprints(fingerprint, partition_fingerprints):
+    """Return the fingerprint of a partitioned table.
+
+    The fingerprint of the partitioned table itself only changes with its
+    columns, so a hash of the fingerprints of its partitions is appended.
+
+    """
+    partitions_hash = hashlib.md5(
+        ','.join(
+            '{}={}'.format(partition_name, partition_fingerprint)
+            for partition_name, partition_fingerprint
+            in sorted(partition_fingerprints.items())
+        ).encode()
+    ).hexdigest()
+
+    return '{}:{}'.format(fingerprint, partitions_hash)
+
+
+def select_partitions(metabase_cursor, data_table_id):
+    """Return the partitions cached by the last extraction.
+
+    Returns:
+        (dict): Full partition name to a dict of `PARTITION_FIELDS`.
+
+    """
+
+    metabase_cursor.execute(
+        """
+        SELECT
+            partition_name,
+            fingerprint,
+            categorical_threshold,
+            type_overrides,
+            exact_numeric
+        FROM metabase.data_partition
+        WHERE data_table_id = %(data_table_id)s
+        """,
+        {'data_table_id': data_table_id},
+    )
+
+    return {
+        partition_name: dict(zip(PARTITION_FIELDS, fields))
+        for partition_name, *fields in metabase_cursor.fetchall()
+    }
+
+
+@instrumentation.step
+def update_partition(metabase_cursor, data_table_id, partition_name,
+                     fingerprint, categorical_threshold, type_overrides,
+                     column_aggregates, exact_numeric=False):
+    """Cache the aggregates of a partition."""
+
+    metabase_cursor.execute(
+        """
+        INSERT INTO metabase.data_partition (
+            data_table_id,
+            partition_name,
+            fingerprint,
+            categorical_threshold,
+            type_overrides,
+            exact_numeric,
+            updated_by,
+            date_last_updated
+        )
+        VALUES (
+            %(data_table_id)s,
+            %(partition_name)s,
+            %(fingerprint)s,
+            %(categorical_threshold)s,
+            %(type_overrides)s,
+            %(exact_numeric)s,
+            %(updated_by)s,
+            CURRENT_TIMESTAMP
+        )
+        ON CONFLICT (data_table_id, partition_name) DO UPDATE
+        SET
+            fingerprint = EXCLUDED.fingerprint,
+            categorical_threshold = EXCLUDED.categorical_threshold,
+            type_overrides = EXCLUDED.type_overrides,
+            exact_numeric = EXCLUDED.exact_numeric,
+            updated_by = EXCLUDED.updated_by,
+            date_last_updated = EXCLUDED.date_last_updated
+        """,
+        {
+            'data_table_id': data_table_id,
+            'partition_name': partition_name,
+            'fingerprint': fingerprint,
+            'categorical_threshold': categorical_threshold,
+            'type_overrides': psycopg2.extras.Json(type_overrides),
+            'exact_numeric': exact_numeric,
+            'updated_by': getpass.getuser(),
+        },
+    )
+    incremental_metadata_helper.update_column_aggregates(
+        metabase_cursor,
+        data_table_id,
+        column_aggregates,
+        partition_name,
+    )
+
+
+def delete_partitions(metabase_cursor, data_table_id, partition_names):
+    """Delete the cached aggregates of partitions."""
+
+    for table_name in ['column_aggregate', 'data_partition']:
+        metabase_cursor.execute(
+            sql.SQL("""
+            DELETE FROM metabase.{}
+            WHERE
+                data_table_id = %(data_table_id)s
+                AND partition_name = ANY(%(partition_names)s)
+            """).format(sql.Identifier(table_name)),
+            {
+                'data_table_id': data_table_id,
+                'partition_names': list(partition_names),
+            },
+        )
+
+
+@instrumentation.step
+def get_partition_aggregates(data_cursor, partition, data_types,
+                             categorical_threshold, type_overrides,
+                             max_memory=None, exact_numeric=False):
+    """Infer the column types of a partition and aggregate its rows.
+
+    Args:
+        max_memory (int): Max bytes of streamed rows held at once, see
+            `extract_metadata_helper.iter_row_batches`.
+        exact_numeric (bool): Sum numeric values as NUMERIC instead of
+            DOUBLE PRECISION.
+
+    Returns:
+        (dict): Column name to ColumnAggregate.
+
+    """
+    schema_name, table_name = partition
+    column_types = {}
+    for col_name, data_type in data_types.items():
+        if col_name in type_overrides:
+            column_types[col_name] = type_overrides[col_name]
+        else:
+            column_types[col_name] = extract_metadata_helper.get_column_type(
+                data_cursor,
+                col_name,
+                categorical_threshold,
+                schema_name,
+                table_name,
+                data_type,
+            )
+
+    _, column_aggregates, _ = \
+        incremental_metadata_helper.get_column_aggregates(
+            data_cursor,
+            column_types,
+            schema_name,
+            table_name,
+            data_types=data_types,
+            max_memory=max_memory,
+            exact_numeric=exact_numeric,
+        )
+
+    return column_aggregates
+
+
+def get_conflicting_columns(partition_aggregates):
+    """Return the columns whose partitions were aggregated as other types.
+
+    Aggregates of categorical and text columns can be merged, and
+    partitions with only nulls have no type of their own.
+
+    Args:
+        partition_aggregates (dict): Full partition name to column name to
+            ColumnAggregate.
+
+    Returns:
+        (dict): Column name to the type all of its partitions must be
+            aggregated as: 'numeric' or 'date', or 'text' when values of
+            every partition must be aggregated as categorical or text.
+
+    """
+    column_types = {}
+    for column_aggregates in partition_aggregates.values():
+        for col_name, aggregate in column_aggregates.items():
+            types = column_types.setdefault(col_name, set())
+            if aggregate.row_count > aggregate.null_count:
+                types.add(aggregate.type)
+
+    conflicting_columns = {}
+    for col_name, types in column_types.items():
+        if len(types) == 1:
+            target_type = types.pop()
+        elif types <= {'code', 'text'}:
+            continue
+        else:
+            target_type = 'text'
+        if any(column_aggregates[col_name].type != target_type
+               and (target_type != 'text'
+                    or column_aggregates[col_name].type in ('numeric', 'date'))
+               for column_aggregates in partition_aggregates.values()):
+            conflicting_columns[col_name] = target_type
+
+    return conflicting_columns
+
+
+def reaggregate_partition(data_cursor, partition, column_aggregates,
+                          conflicting_columns, data_types,
+                          categorical_threshold, max_memory=None,
+                          exact_numeric=False):
+    """Aggregate again the columns of a partition with conflicting types.
+
+    Columns to be aggregated as 'text' (see `get_conflicting_columns`) are
+    aggregated as categorical if the partition has few enough codes.
+
+    Returns:
+        (dict): Column name to ColumnAggregate, with the columns aggregated
+            again replaced.
+
+    """
+    schema_name, table_name = partition
+    column_types = {}
+    for col_name, target_type in conflicting_columns.items():
+        column_type = column_aggregates[col_name].type
+        if column_type == target_type or (
+                target_type == 'text' and column_type == 'code'):
+            continue
+        if target_type == 'text' and extract_metadata_helper.is_code(
+                data_cursor, col_name, schema_name, table_name,
+                categorical_threshold):
+            target_type = 'code'
+        column_types[col_name] = target_type
+
+    if not column_types:
+        return column_aggregates
+
+    _, new_aggregates, _ = incremental_metadata_helper.get_column_aggregates(
+        data_cursor,
+        column_types,
+        schema_name,
+        table_name,
+        data_types=data_types,
+        max_memory=max_memory,
+        exact_numeric=exact_numeric,
+    )
+    column_aggregates = dict(column_aggregates)
+    column_aggregates.update(new_aggregates)
+
+    return column_aggregates
@@ -0,0 +1,279 @@
+"""Quantile sketches to estimate medians and percentiles of streamed values.
+
+A sketch consumes values one batch at a time and answers quantile queries.
+`ExactQuantiles` keeps every value and is meant for small tables.
+`KLLSketch` keeps a bounded number of values (Karnin, Lang and Liberty,
+"Optimal Quantile Approximation in Streams", 2016): with the default
+`k = 200` it holds at most about 3 * k values whatever the number of values
+streamed, and a returned quantile has a rank within about 0.6% of the
+requested one (see `KLLSketch.rank_error`).
+
+Sketches of the same kind can be merged, so partial sketches computed over
+parts of a table combine into the sketch of the whole table.
+
+New sketches are made available by adding them to `QUANTILE_SKETCHES`.
+"""
+
+import decimal
+import math
+import random
+
+
+class QuantileSketch():
+    """Interface of quantile sketches."""
+
+    def update(self, value):
+        """Add a value to the sketch."""
+        raise NotImplementedError
+
+    def update_batch(self, values):
+        """Add an iterable of values to the sketch."""
+        for value in values:
+            self.update(value)
+
+    def merge(self, other):
+        """Add the values summarized by another sketch of the same kind."""
+        raise NotImplementedError
+
+    def quantile(self, q):
+        """Return the value at quantile q (between 0 and 1).
+
+        Returns None if the sketch is empty.
+
+        """
+        raise NotImplementedError
+
+    def quantiles(self, qs):
+        """Return the values at several quantiles."""
+        return [self.quantile(q) for q in qs]
+
+    def median(self):
+        """Return the median."""
+        return self.quantile(0.5)
+
+
+class ExactQuantiles(QuantileSketch):
+    """Exact quantiles, keeping every value in memory.
+
+    Quantiles are interpolated between values like PostgreSQL's
+    PERCENTILE_CONT, so the median matches the one computed in the database.
+    Quantiles of decimal values are interpolated as decimals.
+
+    """
+
+    def __init__(self):
+        self.values = []
+        self.n = 0
+        self._is_sorted = True
+
+    def update(self, value):
+        self.values.append(value)
+        self.n += 1
+        self._is_sorted = False
+
+    def update_batch(self, values):
+        self.values.extend(values)
+        self.n = len(self.values)
+        self._is_sorted = False
+
+    def merge(self, other):
+        self.update_batch(other.values)
+
+    def quantile(self, q):
+        if not self.values:
+            return None
+        if not self._is_sorted:
+            self.values.sort()
+            self._is_sorted = True
+
+        position = q * (self.n - 1)
+        lower = math.floor(position)
+        upper = math.ceil(position)
+        if lower == upper:
+            return self.values[lower]
+        lower_value = self.values[lower]
+        upper_value = self.values[upper]
+        fraction = position - lower
+        if isinstance(lower_value, decimal.Decimal):
+            fraction = decimal.Decimal(repr(fraction))
+        return lower_value + (upper_value - lower_value) * fraction
+
+
+class KLLSketch(QuantileSketch):
+    """KLL quantile sketch with bounded memory.
+
+    Values are kept in a hierarchy of compactors. When a compactor is full,
+    its values are sorted and every other one is promoted to the next level,
+    where each value stands for twice as many streamed values. Compactor
+    capacities shrink geometrically by `c` going down the hierarchy.
+
+    The returned quantiles are streamed values (no interpolation), so the
+    sketch works with any ordered type.
+
+    Args:
+        k (int): Capacity of the top compactor. Memory grows linearly and
+            the rank error decreases linearly with k.
+        c (float): Capacity ratio between consecutive compactors.
+        seed (int): Seed of the random promotions, for reproducibility.
+
+    """
+
+    def __init__(self, k=200, c=2 / 3, seed=None):
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.compactors = []
+        self.size = 0
+        self.max_size = 0
+        self._random = random.Random(seed)
+        self._grow()
+
+    def _grow(self):
+        """Add a level on top of the hierarchy."""
+        self.compactors.append([])
+        self.max_size = sum(
+            self._capacity(height) for height in range(len(self.compactors))
+        )
+
+    def _capacity(self, height):
+        """Return the capacity of the compactor at a given height."""
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.c ** depth * self.k)) + 1
+
+    def _compress(self):
+        """Compact full compactors until the sketch fits its size."""
+        for height in range(len(self.compactors)):
+            if len(self.compactors[height]) >= self._capacity(height):
+                if height + 1 >= len(self.compactors):
+                    self._grow()
+                self.compactors[height + 1].extend(self._compact(height))
+                self.size = sum(len(items) for items in self.compactors)
+                if self.size < self.max_size:
+                    break
+
+    def _compact(self, height):
+        """Empty a compactor and return every other of its sorted values.
+
+        With an odd number of values the largest one stays in the compactor.
+
+        """
+        items = sorted(self.compactors[height])
+        leftover = [items.pop()] if len(items) % 2 else []
+        self.compactors[height] = leftover
+        return items[self._random.randint(0, 1)::2]
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.n += 1
+        self.size += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def update_batch(self, values):
+        """Add values in chunks filling the sketch up to its size.
+
+        Equivalent to adding them one by one, without a call per value.
+
+        """
+        values = list(values)
+        start = 0
+        while start < len(values):
+            room = max(1, self.max_size - self.size)
+            chunk = values[start:start + room]
+            self.compactors[0].extend(chunk)
+            self.n += len(chunk)
+            self.size += len(chunk)
+            start += len(chunk)
+            if self.size >= self.max_size:
+                self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for height, items in enumerate(other.compactors):
+            self.compactors[height].extend(items)
+        self.n += other.n
+        self.size = sum(len(items) for items in self.compactors)
+        while self.size >= self.max_size:
+            self._compress()
+
+    def weighted_values(self):
+        """Return sorted (value, weight) pairs summarizing the stream."""
+        return sorted(
+            (value, 2 ** height)
+            for height, items in enumerate(self.compactors)
+            for value in items
+        )
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs):
+        weighted_values = self.weighted_values()
+        if not weighted_values:
+            return [None for _ in qs]
+
+        total_weight = sum(weight for _, weight in weighted_values)
+        results = []
+        for q in qs:
+            cumulative_weight = 0
+            for value, weight in weighted_values:
+                cumulative_weight += weight
+                if cumulative_weight >= q * total_weight:
+                    break
+            results.append(value)
+        return results
+
+    def to_dict(self):
+        """Return the state of the sketch as a JSON serializable dict."""
+        return {
+            'k': self.k,
+            'c': self.c,
+            'n': self.n,
+            'compactors': self.compactors,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """Return a sketch from a state returned by `to_dict`."""
+        sketch = cls(k=state['k'], c=state['c'])
+        while len(sketch.compactors) < len(state['compactors']):
+            sketch._grow()
+        sketch.compactors = [list(items) for items in state['compactors']]
+        sketch.n = state['n']
+        sketch.size = sum(len(items) for items in sketch.compactors)
+        return sketch
+
+    @staticmethod
+    def rank_error(k=200):
+        """Return the typical normalized rank error for a given k.
+
+        Measured over shuffled streams of 100,000 values, 99% of the
+        quantiles returned by this implementation are within this fraction of
+        the values from the requested rank.
+
+        """
+        return 1.2 / k
+
+
+# Quantile sketches selectable by name, e.g. with the `quantile_method`
+# argument of `ExtractMetadata.process_table`.
+QUANTILE_SKETCHES = {
+    'exact': ExactQuantiles,
+    'kll': KLLSketch,
+}
+
+
+def get_quantile_sketch(method, **kwargs):
+    """Return a new, empty quantile sketch.
+
+    Args:
+        method (str): Name of the sketch in `QUANTILE_SKETCHES`.
+        **kwargs: Arguments of the sketch class.
+
+    """
+    if method not in QUANTILE_SKETCHES:
+        raise ValueError('Unknown quantile method {}. Choose from {}.'.format(
+            method, ', '.join(sorted(QUANTILE_SKETCHES))))
+
+    return QUANTILE_SKETCHES[method](**kwargs)
@@ -5,3 +5,9 @@ metabase_connection_string = 'postgresql://metaadmin@localhost:5432/postgres'
 
 # Database connection strings for database containing data.
 data_connection_string = 'postgresql://metaadmin@localhost:5432/postgres'
+
+# Max number of connections kept by the pools shared by ExtractMetadata
+# instances, per role (data or metabase) and connection string. The data pool
+# must allow one more connection than the workers of an extraction. Set to 0
+# to connect per instance.
+connection_pool_size = 10
@@ -9,17 +9,36 @@ References:
 
 """
 
+import asyncio
 import collections
+from concurrent import futures
 import datetime
+import decimal
+import json
+import os
 from unittest.mock import MagicMock, patch
 
 import alembic.config
 from alembic.config import Config
+import psycopg2
+import psycopg2.pool
+from psycopg2 import sql
 import pytest
 import sqlalchemy
 import testing.postgresql
 
+from metabase import async_extract_metadata
+from metabase import batch_extract
+from metabase import benchmark_helper
+from metabase import block_range_metadata_helper
+from metabase import checkpoint_helper
+from metabase import connection_pools
+from metabase import estimate_metadata_helper
 from metabase import extract_metadata
+from metabase import extract_metadata_helper
+from metabase import incremental_metadata_helper
+from metabase import instrumentation
+from metabase import partition_metadata_helper
 
 
 # #############################################################################
@@ -60,11 +79,13 @@ def setup_module(request):
     mock_params = MagicMock()
     mock_params.metabase_connection_string = conn_str
     mock_params.data_connection_string = conn_str
+    mock_params.connection_pool_size = 10
 
     def teardown_module():
         """
         Delete the temporary database.
         """
+        connection_pools.close_shared_pools()
         postgresql.stop()
 
     request.addfinalizer(teardown_module)
@@ -174,6 +195,27 @@ def test_get_column_level_metadata_column_info(
     assert 4 == len(results)
 
 
+def test_get_column_level_metadata_number_missing(
+        setup_module,
+        setup_get_column_level_metadata):
+    """Test counting null values into Column Info table."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+
+    extract.process_table(categorical_threshold=2)
+
+    engine = setup_module.engine
+    results = engine.execute("""
+        SELECT column_name, number_missing FROM metabase.column_info
+    """).fetchall()
+
+    assert {('c_num', 1), ('c_text', 1), ('c_code', 1), ('c_date', 1)} == \
+        set((r['column_name'], r['number_missing']) for r in results)
+
+
 def test_get_column_level_metadata_numeric(
         setup_module,
         setup_get_column_level_metadata):
@@ -531,3 +573,1718 @@ def test_get_column_level_metadata_invalid_override(
         extract.process_table(
             categorical_threshold=2,
             type_overrides=type_overrides)
+
+
+def test_get_column_level_metadata_single_scan(
+        setup_module, setup_get_column_level_metadata):
+    """Test single scan profiling matches column by column profiling."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table(categorical_threshold=2, single_scan=True)
+
+    engine = setup_module.engine
+    column_types = dict(engine.execute("""
+        SELECT column_name, data_type FROM metabase.column_info
+    """).fetchall())
+    numeric = engine.execute("""
+        SELECT minimum, maximum, mean, median FROM metabase.numeric_column
+    """).fetchall()[0]
+    text = engine.execute("""
+        SELECT max_length, min_length, median_length FROM metabase.text_column
+    """).fetchall()[0]
+    date = engine.execute("""
+        SELECT min_date, max_date FROM metabase.date_column
+    """).fetchall()[0]
+    codes = engine.execute("""
+        SELECT code, frequency FROM metabase.code_frequency
+    """).fetchall()
+
+    assert {
+        'c_num': 'numeric',
+        'c_text': 'text',
+        'c_code': 'code',
+        'c_date': 'date',
+    } == column_types
+    assert (1, 3, 2, 2) == tuple(numeric)
+    assert (5, 3, 4) == tuple(text)
+    assert (datetime.date(2018, 1, 1), datetime.date(2018, 3, 2)) == \
+        tuple(date)
+    assert set([('M', 1), ('F', 2), (None, 1)]) == set(map(tuple, codes))
+
+
+def test_process_table_skip_unchanged(
+        setup_module, setup_get_column_level_metadata):
+    """Test unchanged tables are skipped and changed ones reprocessed."""
+
+    def process_table():
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        return extract.process_table(categorical_threshold=2,
+                                     skip_unchanged=True)
+
+    engine = setup_module.engine
+
+    assert process_table()
+    assert not process_table()
+
+    engine.execute("""
+        INSERT INTO data.col_level_meta (c_num) VALUES ('4');
+    """)
+    # Wait for the statistics of the insert to be reported.
+    engine.execute('SELECT PG_SLEEP(1.1)')
+    assert process_table()
+
+    n_rows = engine.execute("""
+        SELECT number_rows FROM metabase.data_table
+    """).fetchall()[0][0]
+    n_columns = engine.execute("""
+        SELECT COUNT(*) FROM metabase.column_info
+    """).fetchall()[0][0]
+    assert 5 == n_rows
+    assert 4 == n_columns
+
+
+def test_process_table_skip_unchanged_options(
+        setup_module, setup_get_column_level_metadata):
+    """Test metadata extracted with other options is not kept."""
+
+    def process_table(**kwargs):
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        return extract.process_table(skip_unchanged=True, **kwargs)
+
+    assert process_table(categorical_threshold=2, estimate=True,
+                         analyze=True)
+    assert not process_table(categorical_threshold=2, estimate=True,
+                             analyze=True)
+    assert process_table(categorical_threshold=2)
+    assert not setup_module.engine.execute("""
+        SELECT estimated FROM metabase.column_info
+    """).fetchall()[0][0]
+
+    assert process_table(categorical_threshold=3)
+    assert process_table(categorical_threshold=3,
+                         type_overrides={'c_code': 'text'})
+    assert not process_table(categorical_threshold=3,
+                             type_overrides={'c_code': 'text'})
+
+
+def test_process_table_watermark_column(
+        setup_module, setup_get_column_level_metadata):
+    """Test appended rows are merged into the stored aggregates."""
+
+    def process_table():
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        extract.process_table(categorical_threshold=2,
+                              watermark_column='c_num')
+
+    engine = setup_module.engine
+
+    process_table()
+    assert ('c_num', '3') == tuple(engine.execute("""
+        SELECT watermark_column, watermark_value FROM metabase.data_table
+    """).fetchall()[0])
+
+    engine.execute("""
+        INSERT INTO data.col_level_meta (c_num, c_text, c_code, c_date) VALUES
+            ('4', 'xy', 'M', '2018-04-01'),
+            ('5', 'pqrstu', 'F', '2018-05-01');
+    """)
+    # Wait for the statistics of the insert to be reported.
+    engine.execute('SELECT PG_SLEEP(1.1)')
+    with patch.object(
+            incremental_metadata_helper,
+            'get_column_aggregates',
+            wraps=incremental_metadata_helper.get_column_aggregates,
+            ) as get_column_aggregates:
+        process_table()
+    # Only the appended rows were aggregated.
+    assert 1 == get_column_aggregates.call_count
+    assert '3' == get_column_aggregates.call_args[0][5]
+
+    assert (6, '5') == tuple(engine.execute("""
+        SELECT number_rows, watermark_value FROM metabase.data_table
+    """).fetchall()[0])
+    assert {6} == set(row_count for (row_count,) in engine.execute("""
+        SELECT row_count FROM metabase.column_aggregate
+    """).fetchall())
+
+    numeric_stats = engine.execute("""
+        SELECT minimum, maximum, mean FROM metabase.numeric_column
+    """).fetchall()[0]
+    assert (1, 5, 3) == tuple(numeric_stats)
+
+    text_stats = engine.execute("""
+        SELECT min_length, max_length FROM metabase.text_column
+    """).fetchall()[0]
+    assert (2, 6) == tuple(text_stats)
+
+    date_stats = engine.execute("""
+        SELECT min_date, max_date FROM metabase.date_column
+    """).fetchall()[0]
+    assert (datetime.date(2018, 1, 1), datetime.date(2018, 5, 1)) == \
+        tuple(date_stats)
+
+    codes = engine.execute("""
+        SELECT code, frequency FROM metabase.code_frequency
+    """).fetchall()
+    assert set([('M', 2), ('F', 3), (None, 1)]) == set(map(tuple, codes))
+
+
+def test_process_table_watermark_column_estimate(
+        setup_module, setup_get_column_level_metadata):
+    """Test estimated metadata cannot be extracted incrementally."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+
+    with pytest.raises(ValueError):
+        extract.process_table(estimate=True, watermark_column='c_num')
+
+
+def test_process_table_resume_run(
+        setup_module, setup_get_column_level_metadata):
+    """Test a failed run resumes from its first unfinished column."""
+
+    def process_table():
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        extract.process_table(categorical_threshold=2, run_id='run_1')
+
+    engine = setup_module.engine
+
+    with patch.object(
+            extract_metadata_helper,
+            'get_date_metadata',
+            side_effect=RuntimeError('Interrupted')):
+        with pytest.raises(RuntimeError):
+            process_table()
+
+    assert 0 == engine.execute("""
+        SELECT COUNT(*) FROM metabase.column_info
+    """).fetchall()[0][0]
+    checkpoints = engine.execute("""
+        SELECT column_name, column_type FROM metabase.column_checkpoint
+        WHERE run_id = 'run_1'
+    """).fetchall()
+    assert set([('c_num', 'numeric'), ('c_text', 'text'),
+                ('c_code', 'code')]) == set(map(tuple, checkpoints))
+
+    with patch.object(
+            extract_metadata_helper,
+            'get_numeric_metadata',
+            wraps=extract_metadata_helper.get_numeric_metadata,
+            ) as get_numeric_metadata:
+        process_table()
+    assert not get_numeric_metadata.called
+
+    assert 4 == engine.execute("""
+        SELECT COUNT(*) FROM metabase.column_info
+    """).fetchall()[0][0]
+    numeric_stats = engine.execute("""
+        SELECT minimum, maximum, mean, median FROM metabase.numeric_column
+    """).fetchall()[0]
+    assert (1, 3, 2, 2) == tuple(numeric_stats)
+    codes = engine.execute("""
+        SELECT code, frequency FROM metabase.code_frequency
+    """).fetchall()
+    assert set([('M', 1), ('F', 2), (None, 1)]) == set(map(tuple, codes))
+    assert engine.execute("""
+        SELECT date_completed FROM metabase.extraction_run
+        WHERE run_id = 'run_1'
+    """).fetchall()[0][0] is not None
+    # Checkpoints are deleted once the run completes.
+    assert 0 == engine.execute("""
+        SELECT COUNT(*) FROM metabase.column_checkpoint
+    """).fetchall()[0][0]
+
+
+def test_process_table_resume_run_other_options(
+        setup_module, setup_get_column_level_metadata):
+    """Test a run cannot be resumed with other options."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+
+    extract.process_table(categorical_threshold=2, run_id='run_1')
+    with pytest.raises(ValueError):
+        extract.process_table(categorical_threshold=3, run_id='run_1')
+
+
+def test_process_table_run_options(
+        setup_module, setup_get_column_level_metadata):
+    """Test the options of the caller are stored with the run."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+
+    run_options = {'full_table_name': 'data.col_level_meta',
+                   'gmeta_output': 'col_level_meta.json'}
+    extract.process_table(categorical_threshold=2, run_id='run_1',
+                          run_options=run_options)
+
+    conn = psycopg2.connect(
+        setup_module.mock_params.metabase_connection_string)
+    try:
+        with conn.cursor() as cursor:
+            data_table_id, options = checkpoint_helper.select_run(
+                cursor, 'run_1')
+    finally:
+        conn.close()
+    assert 1 == data_table_id
+    assert run_options == {key: options[key] for key in run_options}
+
+    with pytest.raises(ValueError):
+        extract.process_table(categorical_threshold=2, run_id='run_1')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_process_table_instrument(
+        setup_module, setup_get_column_level_metadata, workers):
+    """Test the steps of an instrumented extraction are stored."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table(categorical_threshold=2, workers=workers,
+                          instrument=True)
+
+    engine = setup_module.engine
+    runs = engine.execute("""
+        SELECT run_id, seconds, date_completed FROM metabase.extraction_run
+    """).fetchall()
+    assert 1 == len(runs)
+    run_id, seconds, date_completed = runs[0]
+    assert seconds > 0
+    assert date_completed is not None
+    assert 0 == engine.execute("""
+        SELECT COUNT(*) FROM metabase.column_checkpoint
+    """).fetchall()[0][0]
+
+    steps = engine.execute("""
+        SELECT
+            column_name,
+            phase,
+            depth,
+            seconds,
+            rows_fetched,
+            bytes_fetched,
+            query_count
+        FROM metabase.extraction_step
+        WHERE run_id = %(run_id)s
+    """, {'run_id': run_id}).fetchall()
+    phases = {(column_name, phase): (depth, *counts)
+              for column_name, phase, depth, *counts in steps}
+
+    for col_name in ['c_num', 'c_text', 'c_code', 'c_date']:
+        depth, seconds, rows_fetched, _, query_count = \
+            phases[(col_name, 'get_column_type')]
+        assert 0 == depth
+        assert seconds >= 0
+        assert rows_fetched >= 1
+        assert query_count >= 1
+    assert 1 == phases[('c_text', 'is_code')][0]
+    assert ('c_num', 'get_numeric_metadata') in phases
+    assert (None, 'update_all_columns') in phases
+
+    _, _, rows_fetched, bytes_fetched, query_count = \
+        phases[(None, 'get_table_level_metadata')]
+    assert 3 == rows_fetched
+    assert bytes_fetched > 0
+    assert 3 == query_count
+
+
+def test_count_distinct_bounded(
+        setup_module, setup_get_column_level_metadata):
+    """Test counting distinct values stops at the bound."""
+
+    conn = setup_module.engine.raw_connection()
+    cursor = conn.cursor()
+
+    assert 2 == extract_metadata_helper.count_distinct_bounded(
+        cursor, 'c_text', 'data', 'col_level_meta', 2)
+    assert 3 == extract_metadata_helper.count_distinct_bounded(
+        cursor, 'c_text', 'data', 'col_level_meta', 10)
+    assert 2 == extract_metadata_helper.count_distinct_bounded(
+        cursor, 'c_code', 'data', 'col_level_meta', 10)
+
+    conn.close()
+
+
+@pytest.fixture
+def setup_native_types(setup_module, request):
+    """
+    Setup function-level fixtures for natively typed columns.
+    """
+
+    engine = setup_module.engine
+
+    engine.execute("""
+        INSERT INTO metabase.data_table (data_table_id, file_table_name) VALUES
+            (1, 'data.native_types');
+
+        CREATE TABLE data.native_types
+            (c_int INT, c_timestamp TIMESTAMP, c_bool BOOLEAN, c_text TEXT);
+
+        INSERT INTO data.native_types VALUES
+            (1, '2018-01-01 10:00', TRUE, '10'),
+            (2, '2018-02-01 11:00', FALSE, '20'),
+            (6, '2018-03-02 12:00', TRUE, '30');
+    """)
+
+    def teardown_native_types():
+        engine.execute("""
+            TRUNCATE TABLE metabase.data_table CASCADE;
+            DROP TABLE data.native_types;
+        """)
+
+    request.addfinalizer(teardown_native_types)
+
+
+def test_native_types_not_cast_probed(setup_module, setup_native_types):
+    """Test natively typed columns skip numeric and date cast probes."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+
+    with patch(
+            'metabase.extract_metadata_helper.count_castable_values',
+            wraps=extract_metadata_helper.count_castable_values
+            ) as mock_count_castable_values:
+        extract.process_table(categorical_threshold=2)
+
+    assert 1 == mock_count_castable_values.call_count
+    assert 'c_text' == mock_count_castable_values.call_args[0][1]
+
+    engine = setup_module.engine
+    column_types = dict(engine.execute("""
+        SELECT column_name, data_type FROM metabase.column_info
+    """).fetchall())
+    mean = engine.execute("""
+        SELECT mean FROM metabase.numeric_column WHERE column_name = 'c_int'
+    """).fetchall()[0][0]
+
+    assert {
+        'c_int': 'numeric',
+        'c_timestamp': 'date',
+        'c_bool': 'code',
+        'c_text': 'numeric',
+    } == column_types
+    assert 3 == mean
+
+
+def test_native_types_single_scan(setup_module, setup_native_types):
+    """Test single scan profiling uses the declared column types."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table(categorical_threshold=2, single_scan=True)
+
+    engine = setup_module.engine
+    column_types = dict(engine.execute("""
+        SELECT column_name, data_type FROM metabase.column_info
+    """).fetchall())
+    dates = engine.execute("""
+        SELECT min_date, max_date FROM metabase.date_column
+    """).fetchall()[0]
+
+    assert {
+        'c_int': 'numeric',
+        'c_timestamp': 'date',
+        'c_bool': 'code',
+        'c_text': 'numeric',
+    } == column_types
+    assert (datetime.date(2018, 1, 1), datetime.date(2018, 3, 2)) == \
+        tuple(dates)
+
+
+def test_count_castable_values(
+        setup_module, setup_get_column_level_metadata):
+    """Test counting values which can be cast to numeric and date."""
+
+    conn = setup_module.engine.raw_connection()
+    cursor = conn.cursor()
+
+    num_counts = extract_metadata_helper.count_castable_values(
+        cursor, 'c_num', 'data', 'col_level_meta')
+    date_counts = extract_metadata_helper.count_castable_values(
+        cursor, 'c_date', 'data', 'col_level_meta')
+
+    assert (3, 0, 1) == num_counts['numeric']
+    assert (0, 3, 1) == num_counts['date']
+    assert (0, 3, 1) == date_counts['numeric']
+    assert (3, 0, 1) == date_counts['date']
+
+    conn.close()
+
+
+def test_get_column_level_metadata_estimate(
+        setup_module, setup_get_column_level_metadata):
+    """Test estimating column level metadata from planner statistics."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table(categorical_threshold=2, estimate=True,
+                          analyze=True)
+
+    engine = setup_module.engine
+    table = engine.execute("""
+        SELECT number_rows, estimated FROM metabase.data_table
+    """).fetchall()[0]
+    column_info = engine.execute("""
+        SELECT column_name, data_type, number_missing, estimated
+        FROM metabase.column_info
+    """).fetchall()
+    numeric = engine.execute("""
+        SELECT minimum, maximum, mean, median, estimated
+        FROM metabase.numeric_column
+    """).fetchall()[0]
+    codes = engine.execute("""
+        SELECT code, frequency, estimated FROM metabase.code_frequency
+    """).fetchall()
+
+    assert (4, True) == tuple(table)
+    assert {
+        ('c_num', 'numeric', 1, True),
+        ('c_text', 'text', 1, True),
+        ('c_code', 'code', 1, True),
+        ('c_date', 'date', 1, True),
+    } == set(map(tuple, column_info))
+    assert (1, 3, 2, 2, True) == tuple(numeric)
+    # Codes seen once are neither common values nor in a histogram.
+    assert {('F', 2, True), (None, 1, True)} == set(map(tuple, codes))
+
+
+@pytest.mark.parametrize('single_scan', [False, True])
+def test_get_column_level_metadata_quantile_method(
+        setup_module, setup_get_column_level_metadata, single_scan):
+    """Test streamed medians match the medians computed by the database."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table(categorical_threshold=2, single_scan=single_scan,
+                          quantile_method='exact')
+
+    engine = setup_module.engine
+    numeric = engine.execute("""
+        SELECT minimum, maximum, mean, median FROM metabase.numeric_column
+    """).fetchall()[0]
+    text = engine.execute("""
+        SELECT max_length, min_length, median_length FROM metabase.text_column
+    """).fetchall()[0]
+
+    assert (1, 3, 2, 2) == tuple(numeric)
+    assert (5, 3, 4) == tuple(text)
+
+
+@pytest.mark.parametrize('single_scan', [False, True])
+def test_get_column_level_metadata_max_memory(
+        setup_module, setup_get_column_level_metadata, single_scan):
+    """Test streaming rows one by one leaves the metadata unchanged."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    # Fits less than a row.
+    extract.process_table(categorical_threshold=2, single_scan=single_scan,
+                          quantile_method='kll', max_memory=1)
+
+    engine = setup_module.engine
+    numeric = engine.execute("""
+        SELECT minimum, maximum, mean, median FROM metabase.numeric_column
+    """).fetchall()[0]
+    text = engine.execute("""
+        SELECT max_length, min_length, median_length FROM metabase.text_column
+    """).fetchall()[0]
+
+    assert (1, 3, 2, 2) == tuple(numeric)
+    assert (5, 3, 4) == tuple(text)
+
+
+@pytest.mark.parametrize('options', [
+    {'quantile_method': 'exact'},
+    {'type_overrides': {'c_text': 'code'}},
+    {'type_overrides': {'c_text': 'code'}, 'max_codes': 2,
+     'watermark_column': 'c_num'},
+    {'type_overrides': {'c_text': 'code'}, 'max_codes': 2,
+     'block_ranges': 2},
+])
+def test_process_table_max_memory_unbounded(
+        setup_module, setup_get_column_level_metadata, options):
+    """Test options holding every value cannot have their memory bounded."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+
+    with pytest.raises(ValueError):
+        extract.process_table(categorical_threshold=2, max_memory=2**20,
+                              **options)
+
+
+def test_iter_row_batches_max_memory(setup_module):
+    """Test batches are sized from the memory taken by the first rows."""
+
+    conn = psycopg2.connect(setup_module.mock_params.data_connection_string)
+    try:
+        with conn.cursor() as cursor:
+            query = sql.SQL("""
+                SELECT i, REPEAT('x', 100) FROM GENERATE_SERIES(1, 1000) i
+            """)
+            batches = list(extract_metadata_helper.iter_row_batches(
+                cursor, query, max_memory=10000))
+    finally:
+        conn.close()
+
+    batch_size = extract_metadata_helper.get_batch_size(batches[0], 10000)
+    assert extract_metadata_helper.SIZING_BATCH_SIZE == len(batches[0])
+    assert batch_size < extract_metadata_helper.SIZING_BATCH_SIZE
+    assert all(len(rows) <= batch_size for rows in batches[1:])
+    assert list(range(1, 1001)) == [
+        row[0] for rows in batches for row in rows]
+
+
+@pytest.fixture
+def setup_amounts_table(setup_module, request):
+    """
+    Setup function-level fixtures for exact numeric statistics.
+    """
+    engine = setup_module.engine
+
+    engine.execute("""
+        CREATE TABLE data.amounts (amount TEXT);
+
+        INSERT INTO data.amounts (amount) VALUES
+            ('0.10'),
+            ('0.20'),
+            ('0.30'),
+            ('12345678901234567.01'),
+            (NULL);
+    """)
+
+    def teardown_amounts_table():
+        engine.execute('DROP TABLE data.amounts;')
+
+    request.addfinalizer(teardown_amounts_table)
+
+
+@pytest.mark.parametrize('quantile_method', [None, 'exact'])
+@pytest.mark.parametrize('single_scan', [False, True])
+def test_get_numeric_metadata_exact_numeric(
+        setup_module, setup_amounts_table, single_scan, quantile_method):
+    """Test exact numeric statistics keep every digit of decimals."""
+
+    conn = psycopg2.connect(setup_module.mock_params.data_connection_string)
+    try:
+        with conn.cursor() as cursor:
+            if single_scan:
+                stats = [
+                    extract_metadata_helper.get_all_columns_metadata(
+                        cursor, ['amount'], 2, {}, 'data', 'amounts',
+                        quantile_method=quantile_method,
+                        exact_numeric=exact_numeric,
+                    )['amount'].stats
+                    for exact_numeric in [False, True]
+                ]
+            else:
+                stats = [
+                    extract_metadata_helper.get_numeric_metadata(
+                        cursor, 'amount', 'data', 'amounts',
+                        quantile_method=quantile_method,
+                        exact_numeric=exact_numeric,
+                    )
+                    for exact_numeric in [False, True]
+                ]
+    finally:
+        conn.close()
+
+    float_stats, exact_stats = stats
+    assert isinstance(float_stats.mean, float)
+    assert decimal.Decimal('12345678901234567.01') == float_stats.max
+    assert (
+        decimal.Decimal('0.10'),
+        decimal.Decimal('12345678901234567.01'),
+        1,
+    ) == (exact_stats.min, exact_stats.max, exact_stats.missing)
+    assert isinstance(exact_stats.mean, decimal.Decimal)
+    # Interpolated between the two middle values.
+    assert 0.25 == float_stats.median
+    if quantile_method == 'exact':
+        assert decimal.Decimal('0.25') == exact_stats.median
+
+
+@pytest.mark.parametrize('type_overrides', [
+    # Overriding a column with no stored aggregate.
+    ({}, {'c_missing': 'code'}),
+    # Removing an override.
+    ({'c_code': 'text'}, {}),
+])
+def test_process_table_watermark_column_type_overrides(
+        setup_module, setup_get_column_level_metadata, type_overrides):
+    """Test changed type overrides fall back to a full extraction."""
+
+    def process_table(type_overrides):
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        with patch.object(
+                incremental_metadata_helper,
+                'get_column_aggregates',
+                wraps=incremental_metadata_helper.get_column_aggregates,
+                ) as get_column_aggregates:
+            extract.process_table(categorical_threshold=2,
+                                  type_overrides=type_overrides,
+                                  watermark_column='c_num')
+        return get_column_aggregates.call_args
+
+    first_overrides, second_overrides = type_overrides
+    process_table(first_overrides)
+    call_args = process_table(second_overrides)
+
+    # All rows were aggregated, not only those past the watermark.
+    assert 5 == len(call_args[0])
+    assert 'code' == setup_module.engine.execute("""
+        SELECT data_type FROM metabase.column_info
+        WHERE column_name = 'c_code'
+    """).fetchall()[0][0]
+
+
+def test_get_column_aggregates_exact_numeric(
+        setup_module, setup_amounts_table):
+    """Test mergeable sums are double precision unless exact numeric."""
+
+    conn = psycopg2.connect(setup_module.mock_params.data_connection_string)
+    try:
+        with conn.cursor() as cursor:
+            float_aggregate, exact_aggregate = [
+                incremental_metadata_helper.get_column_aggregates(
+                    cursor, {'amount': 'numeric'}, 'data', 'amounts',
+                    exact_numeric=exact_numeric,
+                )[1]['amount']
+                for exact_numeric in [False, True]
+            ]
+    finally:
+        conn.close()
+
+    # Kept as decimals, to be merged with the stored sums.
+    assert isinstance(float_aggregate.value_sum, decimal.Decimal)
+    assert decimal.Decimal('12345678901234567.61') != \
+        float_aggregate.value_sum
+    assert decimal.Decimal('12345678901234567.61') == \
+        exact_aggregate.value_sum
+    assert decimal.Decimal('12345678901234567.01') == \
+        float_aggregate.max == exact_aggregate.max
+
+
+def test_process_table_exact_numeric_watermark_column(
+        setup_module, setup_get_column_level_metadata):
+    """Test stored aggregates are only merged into with the same precision.
+    """
+
+    def process_table(exact_numeric):
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        with patch.object(
+                incremental_metadata_helper,
+                'get_column_aggregates',
+                wraps=incremental_metadata_helper.get_column_aggregates,
+                ) as get_column_aggregates:
+            extract.process_table(categorical_threshold=2,
+                                  watermark_column='c_num',
+                                  exact_numeric=exact_numeric)
+        return get_column_aggregates.call_args
+
+    process_table(exact_numeric=True)
+    assert setup_module.engine.execute("""
+        SELECT exact_numeric FROM metabase.data_table
+    """).fetchall()[0][0]
+
+    # Merged into the exact numeric aggregates.
+    call_args = process_table(exact_numeric=True)
+    assert '3' == call_args[0][5]
+    assert call_args[1]['exact_numeric']
+
+    # Aggregated again in double precision.
+    call_args = process_table(exact_numeric=False)
+    assert 5 == len(call_args[0])
+    assert not call_args[1]['exact_numeric']
+    assert not setup_module.engine.execute("""
+        SELECT exact_numeric FROM metabase.data_table
+    """).fetchall()[0][0]
+
+
+def test_get_value_columns():
+    """Test transposing a batch of rows drops nulls."""
+
+    rows = [(1.5, 3), (None, 4), (2.5, None)]
+
+    assert [[1.5, 2.5], [3, 4]] == \
+        extract_metadata_helper.get_value_columns(rows, 2)
+    assert [[1.5, 2.5], [3, 4]] == \
+        extract_metadata_helper.get_value_columns(rows, 2, as_float=False)
+
+
+def test_get_column_level_metadata_workers(
+        setup_module, setup_get_column_level_metadata):
+    """Test profiling columns in parallel matches profiling them in turn."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table(categorical_threshold=2, workers=3)
+
+    engine = setup_module.engine
+    column_types = dict(engine.execute("""
+        SELECT column_name, data_type FROM metabase.column_info
+    """).fetchall())
+    numeric = engine.execute("""
+        SELECT minimum, maximum, mean, median FROM metabase.numeric_column
+    """).fetchall()[0]
+    text = engine.execute("""
+        SELECT max_length, min_length, median_length FROM metabase.text_column
+    """).fetchall()[0]
+    codes = engine.execute("""
+        SELECT code, frequency FROM metabase.code_frequency
+    """).fetchall()
+
+    assert {
+        'c_num': 'numeric',
+        'c_text': 'text',
+        'c_code': 'code',
+        'c_date': 'date',
+    } == column_types
+    assert (1, 3, 2, 2) == tuple(numeric)
+    assert (5, 3, 4) == tuple(text)
+    assert set([('M', 1), ('F', 2), (None, 1)]) == set(map(tuple, codes))
+
+
+def test_import_snapshot(setup_module, setup_get_column_level_metadata):
+    """Test workers importing a snapshot ignore rows inserted after it."""
+
+    engine = setup_module.engine
+    conn_str = setup_module.mock_params.data_connection_string
+    coordinator_conn = psycopg2.connect(conn_str)
+    worker_conn = psycopg2.connect(conn_str)
+
+    extract_metadata_helper.begin_snapshot_transaction(coordinator_conn)
+    snapshot_id = extract_metadata_helper.export_snapshot(
+        coordinator_conn.cursor())
+
+    engine.execute("""
+        INSERT INTO data.col_level_meta (c_num) VALUES ('4');
+    """)
+
+    extract_metadata_helper.begin_snapshot_transaction(
+        worker_conn, snapshot_id)
+    worker_cur = worker_conn.cursor()
+    worker_cur.execute('SELECT COUNT(*) FROM data.col_level_meta')
+
+    assert 4 == worker_cur.fetchone()[0]
+
+    worker_conn.rollback()
+    coordinator_conn.rollback()
+    worker_conn.close()
+    coordinator_conn.close()
+
+
+def test_update_code_bulk(setup_module, setup_get_column_level_metadata):
+    """Test code frequencies are written with a constant number of queries."""
+
+    class CountingCursor(psycopg2.extensions.cursor):
+        n_queries = 0
+
+        def execute(self, query, vars=None):
+            CountingCursor.n_queries += 1
+            return super().execute(query, vars)
+
+    code_stats = extract_metadata_helper.CodeStats(
+        collections.Counter({str(i): i for i in range(1, 1001)}), 0, 0)
+
+    conn = psycopg2.connect(
+        setup_module.mock_params.metabase_connection_string)
+    with conn.cursor(cursor_factory=CountingCursor) as cursor:
+        extract_metadata_helper.update_code(
+            cursor, 'c_code', code_stats, 1)
+    conn.commit()
+    conn.close()
+
+    engine = setup_module.engine
+    n_codes, total_frequency = engine.execute("""
+        SELECT COUNT(*), SUM(frequency) FROM metabase.code_frequency
+    """).fetchall()[0]
+
+    assert 2 == CountingCursor.n_queries
+    assert 1000 == n_codes
+    assert 500500 == total_frequency
+
+
+@pytest.mark.parametrize('single_scan', [False, True])
+def test_get_column_level_metadata_max_codes(
+        setup_module, setup_get_column_level_metadata, single_scan):
+    """Test codes beyond max_codes are stored as one other code."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table(categorical_threshold=2, single_scan=single_scan,
+                          max_codes=1)
+
+    engine = setup_module.engine
+    codes = engine.execute("""
+        SELECT code, frequency, is_other FROM metabase.code_frequency
+    """).fetchall()
+
+    assert {('F', 2, False), (None, 1, False), (None, 1, True)} == \
+        set(map(tuple, codes))
+
+
+def test_cap_code_frequencies():
+    """Test capping code frequencies outside the database."""
+
+    code_stats = extract_metadata_helper.CodeStats(
+        collections.Counter({'a': 5, 'b': 3, 'c': 2, None: 4}), 4, 0)
+
+    capped = extract_metadata_helper.cap_code_frequencies(code_stats, 1)
+
+    assert collections.Counter({'a': 5, None: 4}) == capped.frequencies
+    assert 4 == capped.missing
+    assert 5 == capped.other
+
+
+def test_context_manager_shared_pool(
+        setup_module, setup_get_column_level_metadata):
+    """Test instances used as context managers reuse pooled connections."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        with extract_metadata.ExtractMetadata(data_table_id=1) as extract:
+            assert extract.data_conn is None
+            extract.process_table(categorical_threshold=2)
+            data_conn = extract.data_conn
+            extract.process_table(categorical_threshold=2)
+            assert data_conn is extract.data_conn
+            assert not data_conn.closed
+        assert extract.data_conn is None
+
+        other_extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        assert other_extract.data_pool is connection_pools.get_shared_pool(
+            setup_module.mock_params.data_connection_string, 10, 'data')
+        assert other_extract.metabase_pool is not other_extract.data_pool
+        other_extract.process_table(categorical_threshold=2)
+        assert other_extract.data_conn is None
+        pooled_conn = other_extract.data_pool.getconn()
+        assert data_conn is pooled_conn
+        other_extract.data_pool.putconn(pooled_conn)
+
+
+def test_process_table_many_instances(
+        setup_module, setup_get_column_level_metadata):
+    """Test live instances beyond the pool size do not hold connections."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extracts = [extract_metadata.ExtractMetadata(data_table_id=1)
+                    for _ in range(11)]
+        for extract in extracts:
+            extract.process_table(categorical_threshold=2, workers=2)
+            extract.export_table_metadata(os.devnull)
+
+    assert all(extract.data_conn is None for extract in extracts)
+
+
+def test_blocking_connection_pool(setup_module):
+    """Test the pool waits for a connection instead of failing."""
+
+    pool = connection_pools.BlockingConnectionPool(
+        1, setup_module.mock_params.data_connection_string)
+    conn = pool.getconn()
+
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+        waiting_getconn = executor.submit(pool.getconn)
+        with pytest.raises(futures.TimeoutError):
+            waiting_getconn.result(timeout=0.2)
+        pool.putconn(conn)
+        assert conn is waiting_getconn.result(timeout=5)
+
+    pool.closeall()
+
+
+def test_blocking_connection_pool_timeout(setup_module):
+    """Test the pool raises PoolError when no connection is returned."""
+
+    pool = connection_pools.BlockingConnectionPool(
+        1, setup_module.mock_params.data_connection_string, timeout=0.1)
+    conn = pool.getconn()
+
+    with pytest.raises(psycopg2.pool.PoolError):
+        pool.getconn()
+
+    pool.putconn(conn)
+    pool.closeall()
+
+
+def test_process_table_workers_over_pool_size(
+        setup_module, setup_get_column_level_metadata):
+    """Test workers cannot outnumber the connections of the data pool."""
+
+    pool = connection_pools.BlockingConnectionPool(
+        4, setup_module.mock_params.data_connection_string)
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(
+            data_table_id=1, data_pool=pool)
+
+    try:
+        with pytest.raises(ValueError):
+            extract.process_table(categorical_threshold=2, workers=8)
+        with pytest.raises(ValueError):
+            extract.process_table(categorical_threshold=2, workers=4)
+        extract.process_table(categorical_threshold=2, workers=3)
+    finally:
+        pool.closeall()
+
+
+def test_async_process_table(
+        setup_module, setup_get_column_level_metadata, tmp_path):
+    """Test the asyncio interface stores the same metadata as the class."""
+
+    engine = setup_module.engine
+    engine.execute("""
+        INSERT INTO metabase.data_table (data_table_id, file_table_name)
+        VALUES (2, 'data.col_level_meta');
+    """)
+
+    async def process_and_export():
+        extract = async_extract_metadata.AsyncExtractMetadata(2)
+        assert await extract.process_table(categorical_threshold=1,
+                                           workers=2)
+        assert not await extract.process_table(categorical_threshold=1,
+                                               skip_unchanged=True)
+        await extract.export_table_metadata(str(tmp_path / 'gmeta.json'))
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        extract.process_table(categorical_threshold=1)
+        asyncio.run(process_and_export())
+
+    def select_metadata(data_table_id):
+        return [
+            set(map(tuple, engine.execute(query, [data_table_id])))
+            for query in [
+                """
+                SELECT column_name, data_type, number_missing
+                FROM metabase.column_info WHERE data_table_id = %s
+                """,
+                """
+                SELECT column_name, minimum, maximum, mean, median
+                FROM metabase.numeric_column WHERE data_table_id = %s
+                """,
+                """
+                SELECT column_name, max_length, min_length, median_length
+                FROM metabase.text_column WHERE data_table_id = %s
+                """,
+                """
+                SELECT column_name, min_date, max_date
+                FROM metabase.date_column WHERE data_table_id = %s
+                """,
+                """
+                SELECT column_name, code, frequency, is_other
+                FROM metabase.code_frequency WHERE data_table_id = %s
+                """,
+            ]
+        ]
+
+    assert select_metadata(1) == select_metadata(2)
+    with open(str(tmp_path / 'gmeta.json')) as gmeta_file:
+        assert 'data.col_level_meta' in json.load(gmeta_file)['gmeta'][0]
+
+
+def test_async_context_manager(
+        setup_module, setup_get_column_level_metadata):
+    """Test an async block keeps one data connection for several calls."""
+
+    async def process_twice():
+        async with async_extract_metadata.AsyncExtractMetadata(1) as extract:
+            assert await extract.process_table(categorical_threshold=1)
+            data_conn = extract._extract.data_conn
+            processed = await extract.process_table(categorical_threshold=1,
+                                                    skip_unchanged=True)
+            assert data_conn is extract._extract.data_conn
+        assert extract._extract is None
+        return processed
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        assert asyncio.run(process_twice()) is False
+
+
+def test_async_context_manager_serializes_calls(
+        setup_module, setup_get_column_level_metadata, tmp_path):
+    """Test calls sharing the connection of an async block do not overlap.
+    """
+
+    active_calls = []
+    overlapping_calls = []
+
+    def serialized(method):
+        def call(*args, **kwargs):
+            overlapping_calls.append(len(active_calls))
+            active_calls.append(method)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                active_calls.remove(method)
+        return call
+
+    async def process_and_export():
+        async with async_extract_metadata.AsyncExtractMetadata(1) as extract:
+            for method_name in ['process_table', 'export_table_metadata']:
+                setattr(extract._extract, method_name, serialized(
+                    getattr(extract._extract, method_name)))
+            await asyncio.gather(
+                extract.process_table(categorical_threshold=1),
+                extract.export_table_metadata(
+                    str(tmp_path / 'gmeta.json')),
+            )
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        asyncio.run(process_and_export())
+
+    assert [0, 0] == overlapping_calls
+
+
+#   Tests for partitioned tables
+# =========================================================================
+
+@pytest.fixture
+def setup_partitioned_table(setup_module, request):
+    """
+    Setup function-level fixtures for partitioned tables.
+    """
+
+    engine = setup_module.engine
+
+    engine.execute("""
+        INSERT INTO metabase.data_table (data_table_id, file_table_name) VALUES
+            (1, 'data.partitioned'),
+            (2, 'data.unpartitioned');
+
+        CREATE TABLE data.partitioned
+            (c_month DATE, c_num TEXT, c_code TEXT, c_mixed TEXT)
+            PARTITION BY RANGE (c_month);
+        CREATE TABLE data.partitioned_01 PARTITION OF data.partitioned
+            FOR VALUES FROM ('2018-01-01') TO ('2018-02-01');
+        CREATE TABLE data.partitioned_02 PARTITION OF data.partitioned
+            FOR VALUES FROM ('2018-02-01') TO ('2018-03-01');
+
+        INSERT INTO data.partitioned (c_month, c_num, c_code, c_mixed) VALUES
+            ('2018-01-01', '1', 'M', '1'),
+            ('2018-01-02', '2', 'F', '2'),
+            ('2018-02-01', '3', 'F', 'a'),
+            ('2018-02-02', NULL, NULL, NULL);
+
+        CREATE TABLE data.unpartitioned AS SELECT * FROM data.partitioned;
+    """)
+
+    def teardown_partitioned_table():
+        engine.execute("""
+            TRUNCATE TABLE metabase.data_table CASCADE;
+            DROP TABLE data.partitioned;
+            DROP TABLE data.unpartitioned;
+        """)
+
+    request.addfinalizer(teardown_partitioned_table)
+
+
+def select_column_metadata(engine, data_table_id):
+    """Return the column level metadata of a table, without medians."""
+
+    return [
+        sorted(map(tuple, engine.execute(query, data_table_id).fetchall()),
+               key=str)
+        for query in [
+            """
+            SELECT column_name, data_type FROM metabase.column_info
+            WHERE data_table_id = %s
+            """,
+            """
+            SELECT column_name, minimum, maximum, mean
+            FROM metabase.numeric_column WHERE data_table_id = %s
+            """,
+            """
+            SELECT column_name, min_date, max_date
+            FROM metabase.date_column WHERE data_table_id = %s
+            """,
+            """
+            SELECT column_name, code, frequency
+            FROM metabase.code_frequency WHERE data_table_id = %s
+            """,
+        ]
+    ]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_process_table_partitioned(
+        setup_module, setup_partitioned_table, workers):
+    """Test partitions are profiled separately and merged."""
+
+    engine = setup_module.engine
+    for data_table_id in [1, 2]:
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id)
+        extract.process_table(categorical_threshold=5, workers=workers)
+
+    assert select_column_metadata(engine, 2) == \
+        select_column_metadata(engine, 1)
+    assert ('c_mixed', 'code') in select_column_metadata(engine, 1)[0]
+
+    number_rows, size = engine.execute("""
+        SELECT number_rows, size FROM metabase.data_table
+        WHERE data_table_id = 1
+    """).fetchall()[0]
+    assert 4 == number_rows
+    assert 0 < size
+
+    partition_names = engine.execute("""
+        SELECT partition_name FROM metabase.data_partition
+        ORDER BY partition_name
+    """).fetchall()
+    assert [('data.partitioned_01',), ('data.partitioned_02',)] == \
+        partition_names
+
+
+def test_process_table_partitioned_max_memory(
+        setup_module, setup_partitioned_table):
+    """Test partition aggregates of code overrides cannot be bounded."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(1)
+
+    with pytest.raises(ValueError, match='Partition aggregates'):
+        extract.process_table(categorical_threshold=5,
+                              type_overrides={'c_mixed': 'code'},
+                              max_codes=2, max_memory=2**20)
+
+
+def test_process_table_partitioned_cache(
+        setup_module, setup_partitioned_table):
+    """Test only changed partitions are aggregated again."""
+
+    def process_table():
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id=1)
+        extract.process_table(categorical_threshold=5)
+
+    engine = setup_module.engine
+    # Wait for the statistics of the fixture to be reported.
+    engine.execute('SELECT PG_SLEEP(1.1)')
+    process_table()
+
+    engine.execute("""
+        INSERT INTO data.partitioned (c_month, c_num, c_code, c_mixed) VALUES
+            ('2018-02-03', '7', 'M', 'b');
+    """)
+    # Wait for the statistics of the insert to be reported.
+    engine.execute('SELECT PG_SLEEP(1.1)')
+    with patch.object(
+            partition_metadata_helper,
+            'get_partition_aggregates',
+            wraps=partition_metadata_helper.get_partition_aggregates,
+            ) as get_partition_aggregates:
+        process_table()
+
+    assert 1 == get_partition_aggregates.call_count
+    assert ('data', 'partitioned_02') == \
+        get_partition_aggregates.call_args[0][1]
+
+    assert 5 == engine.execute("""
+        SELECT number_rows FROM metabase.data_table WHERE data_table_id = 1
+    """).fetchall()[0][0]
+    numeric_stats = engine.execute("""
+        SELECT minimum, maximum FROM metabase.numeric_column
+    """).fetchall()
+    assert [(1, 7)] == list(map(tuple, numeric_stats))
+    codes = engine.execute("""
+        SELECT code, frequency FROM metabase.code_frequency
+        WHERE column_id = (
+            SELECT column_id FROM metabase.column_info
+            WHERE column_name = 'c_code'
+        )
+    """).fetchall()
+    assert set([('M', 2), ('F', 2), (None, 1)]) == set(map(tuple, codes))
+
+
+def test_list_partitions(setup_module, setup_partitioned_table):
+    """Test listing the leaf partitions of a table."""
+
+    conn = psycopg2.connect(setup_module.mock_params.data_connection_string)
+    try:
+        with conn.cursor() as cursor:
+            assert [('data', 'partitioned_01'), ('data', 'partitioned_02')] \
+                == partition_metadata_helper.list_partitions(
+                    cursor, 'data', 'partitioned')
+            assert [] == partition_metadata_helper.list_partitions(
+                cursor, 'data', 'unpartitioned')
+    finally:
+        conn.close()
+
+
+#   Tests for block range profiling
+# =========================================================================
+
+@pytest.fixture
+def setup_block_range_table(setup_module, request):
+    """
+    Setup function-level fixtures for block range profiling.
+    """
+
+    engine = setup_module.engine
+
+    engine.execute("""
+        INSERT INTO metabase.data_table (data_table_id, file_table_name) VALUES
+            (1, 'data.block_ranges'),
+            (2, 'data.block_ranges');
+
+        CREATE TABLE data.block_ranges AS
+        SELECT
+            i::TEXT AS c_num,
+            MD5(i::TEXT) AS c_text,
+            CHR(65 + i %% 3) AS c_code,
+            ('2018-01-01'::DATE + i %% 300)::TEXT AS c_date,
+            CASE WHEN i > 1500 THEN CHR(65 + i %% 2) ELSE '1' END AS c_mixed
+        FROM GENERATE_SERIES(1, 2000) AS i;
+    """)
+
+    def teardown_block_range_table():
+        engine.execute("""
+            TRUNCATE TABLE metabase.data_table CASCADE;
+            DROP TABLE data.block_ranges;
+        """)
+
+    request.addfinalizer(teardown_block_range_table)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_process_table_block_ranges(
+        setup_module, setup_block_range_table, workers):
+    """Test merged block range aggregates match a column by column scan."""
+
+    engine = setup_module.engine
+    for data_table_id, block_ranges in [(1, None), (2, 4)]:
+        with patch(
+                'metabase.extract_metadata.settings',
+                setup_module.mock_params):
+            extract = extract_metadata.ExtractMetadata(data_table_id)
+        extract.process_table(categorical_threshold=5, workers=workers,
+                              block_ranges=block_ranges)
+
+    assert select_column_metadata(engine, 1) == \
+        select_column_metadata(engine, 2)
+    assert [
+        ('c_code', 'code'),
+        ('c_date', 'date'),
+        ('c_mixed', 'code'),
+        ('c_num', 'numeric'),
+        ('c_text', 'text'),
+    ] == select_column_metadata(engine, 2)[0]
+
+    text_stats = engine.execute("""
+        SELECT data_table_id, min_length, max_length
+        FROM metabase.text_column ORDER BY data_table_id
+    """).fetchall()
+    assert [(1, 32, 32), (2, 32, 32)] == list(map(tuple, text_stats))
+
+
+def test_get_block_ranges(setup_module, setup_block_range_table):
+    """Test block ranges cover every row of a table once."""
+
+    conn = psycopg2.connect(setup_module.mock_params.data_connection_string)
+    try:
+        with conn.cursor() as cursor:
+            block_ranges = block_range_metadata_helper.get_block_ranges(
+                cursor, 'data', 'block_ranges', 4)
+            assert 4 == len(block_ranges)
+            assert block_ranges[0][0] is None
+            assert block_ranges[-1][1] is None
+
+            n_rows = 0
+            for block_range in block_ranges:
+                cursor.execute(
+                    sql.SQL('SELECT COUNT(*) FROM data.block_ranges WHERE {}')
+                    .format(block_range_metadata_helper.
+                            get_block_range_condition(block_range))
+                )
+                n_rows += cursor.fetchone()[0]
+            assert 2000 == n_rows
+    finally:
+        conn.close()
+
+
+def test_get_distinct_values_bounded(
+        setup_module, setup_get_column_level_metadata):
+    """Test distinct values of several columns are bounded per column."""
+
+    conn = psycopg2.connect(setup_module.mock_params.data_connection_string)
+    try:
+        with conn.cursor() as cursor:
+            distinct_values = \
+                block_range_metadata_helper.get_distinct_values_bounded(
+                    cursor, ['c_text', 'c_code'], 'data', 'col_level_meta',
+                    2)
+    finally:
+        conn.close()
+
+    assert {'abc', 'efgh'} == distinct_values['c_text']
+    assert {'M', 'F'} == distinct_values['c_code']
+
+
+def test_process_table_block_ranges_estimate(
+        setup_module, setup_block_range_table):
+    """Test estimated metadata cannot be extracted by block ranges."""
+
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+
+    with pytest.raises(ValueError):
+        extract.process_table(estimate=True, block_ranges=2)
+
+
+#   Tests for `batch_extract`
+# =========================================================================
+
+@pytest.fixture
+def setup_batch_tables(setup_module, request):
+    """
+    Setup function-level fixtures for batch extraction.
+    """
+
+    engine = setup_module.engine
+
+    engine.execute("""
+        CREATE TABLE data.batch_full (c_num INT, c_text TEXT);
+        INSERT INTO data.batch_full (c_num, c_text) VALUES
+            (1, 'a'),
+            (2, 'b');
+
+        CREATE TABLE data.batch_empty (c_num INT);
+    """)
+
+    def teardown_batch_tables():
+        engine.execute("""
+            TRUNCATE TABLE metabase.data_table CASCADE;
+            DROP TABLE data.batch_full;
+            DROP TABLE data.batch_empty;
+        """)
+
+    request.addfinalizer(teardown_batch_tables)
+
+
+def test_extract_tables(setup_module, setup_batch_tables):
+    """Test batch extraction registers and processes every table."""
+
+    engine = setup_module.engine
+
+    with patch(
+            'metabase.batch_extract.settings',
+            setup_module.mock_params), \
+        patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        data_pool, metabase_pool = batch_extract.create_connection_pools(2)
+
+        data_conn = data_pool.getconn()
+        full_table_names = batch_extract.list_schema_tables(
+            data_conn.cursor(), 'data')
+        data_pool.putconn(data_conn)
+
+        metabase_conn = metabase_pool.getconn()
+        with metabase_conn:
+            data_table_ids = batch_extract.register_tables(
+                metabase_conn.cursor(), full_table_names)
+        metabase_pool.putconn(metabase_conn)
+
+        table_results = batch_extract.extract_tables(
+            data_table_ids,
+            table_workers=2,
+            data_pool=data_pool,
+            metabase_pool=metabase_pool,
+            categorical_threshold=1,
+        )
+
+    data_pool.closeall()
+    metabase_pool.closeall()
+
+    assert ['data.batch_empty', 'data.batch_full'] == full_table_names
+    assert {'data.batch_empty': 1, 'data.batch_full': 2} == data_table_ids
+
+    results = {result.full_table_name: result for result in table_results}
+    assert 'ValueError' in results['data.batch_empty'].error
+    assert results['data.batch_full'].error is None
+
+    n_rows = engine.execute("""
+        SELECT number_rows FROM metabase.data_table WHERE data_table_id = 2
+    """).fetchall()[0][0]
+    assert 2 == n_rows
+
+    summary = batch_extract.format_summary(table_results)
+    assert '1 succeeded, 0 skipped as unchanged, 1 failed' in summary
+
+
+def test_get_table_costs(setup_module, setup_batch_tables):
+    """Test tables and columns are ordered by their estimated cost."""
+
+    engine = setup_module.engine
+    engine.execute("""
+        INSERT INTO data.batch_full (c_num, c_text)
+            SELECT i, REPEAT('x', 100) FROM GENERATE_SERIES(1, 1000) AS i;
+        ANALYZE data.batch_full;
+        ANALYZE data.batch_empty;
+    """)
+
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+    table_costs = estimate_metadata_helper.get_table_costs(
+        cursor, ['data.batch_empty', 'data.batch_full'])
+    column_costs = estimate_metadata_helper.get_column_costs(
+        cursor, 'data', 'batch_full', ['c_num', 'c_text'])
+    conn.close()
+
+    assert 0 == table_costs['data.batch_empty']
+    assert ['data.batch_full', 'data.batch_empty'] == \
+        estimate_metadata_helper.order_by_cost(
+            ['data.batch_empty', 'data.batch_full'], table_costs)
+    assert ['c_text', 'c_num'] == estimate_metadata_helper.order_by_cost(
+        ['c_num', 'c_text'], column_costs)
+
+
+def test_register_tables_reuse_existing(setup_module, setup_batch_tables):
+    """Test registering tables again reuses their IDs."""
+
+    conn = psycopg2.connect(
+        setup_module.mock_params.metabase_connection_string)
+    with conn:
+        first_ids = batch_extract.register_tables(
+            conn.cursor(), ['data.batch_full'])
+        second_ids = batch_extract.register_tables(
+            conn.cursor(), ['data.batch_empty', 'data.batch_full'],
+            reuse_existing=True)
+    conn.close()
+
+    assert {'data.batch_full': 1} == first_ids
+    assert {'data.batch_empty': 2, 'data.batch_full': 1} == second_ids
+
+
+def test_create_synthetic_table(setup_module):
+    """Test synthetic tables follow their case and do not vary."""
+
+    engine = setup_module.engine
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+
+    values = []
+    for table_name in ['synthetic_1', 'synthetic_2']:
+        benchmark_helper.create_synthetic_table(
+            cursor, 'data', table_name, 1000, 5, 'mixed', 0.2, 7)
+        cursor.execute(
+            sql.SQL('SELECT * FROM data.{}').format(
+                sql.Identifier(table_name)))
+        values.append(cursor.fetchall())
+    conn.commit()
+
+    assert values[0] == values[1]
+    assert 1000 == len(values[0])
+    assert ['c_0_numeric', 'c_1_date', 'c_2_code', 'c_3_text',
+            'c_4_numeric'] == [column.name for column in cursor.description]
+    for column in zip(*values[0]):
+        assert 100 < column.count(None) < 300
+        assert 7 == len(set(column) - {None})
+
+    cursor.execute('DROP TABLE data.synthetic_1, data.synthetic_2')
+    conn.commit()
+    conn.close()
+
+
+#   Query budgets
+# =========================================================================
+
+@pytest.fixture
+def query_log(setup_module):
+    """
+    Log the statements of the data and metabase cursors of the test.
+    """
+
+    recorder = instrumentation.StepRecorder(log_statements=True)
+    with instrumentation.recording(recorder):
+        yield recorder
+
+
+@pytest.fixture
+def setup_synthetic_table(setup_module, request):
+    """
+    Setup function-level fixtures for a synthetic table of
+    `request.param` columns.
+    """
+
+    engine = setup_module.engine
+    conn = engine.raw_connection()
+    with conn.cursor() as cursor:
+        benchmark_helper.create_synthetic_table(
+            cursor, 'data', 'synthetic', 100, request.param, 'mixed', 0.1, 5)
+    conn.commit()
+    conn.close()
+    engine.execute("""
+        INSERT INTO metabase.data_table (data_table_id, file_table_name)
+        VALUES (1, 'data.synthetic');
+    """)
+
+    def teardown_synthetic_table():
+        engine.execute("""
+            TRUNCATE TABLE metabase.data_table CASCADE;
+            DROP TABLE data.synthetic;
+        """)
+
+    request.addfinalizer(teardown_synthetic_table)
+
+    return request.param
+
+
+def get_statements(query_log, database, writes=False):
+    """Return the statements logged for a database, or only its writes."""
+
+    statements = [
+        statement
+        for statement_database, statement in query_log.statements
+        if statement_database == database
+    ]
+    if writes:
+        statements = [
+            statement for statement in statements
+            if statement.split()[0].upper() in ('INSERT', 'UPDATE', 'DELETE')
+        ]
+
+    return statements
+
+
+def assert_within_budget(statements, n_columns, per_column, per_table):
+    """Assert statements are within budget.
+
+    The budget is `per_column` statements per column and `per_table` more.
+
+    """
+
+    budget = per_column * n_columns + per_table
+    assert len(statements) <= budget, \
+        '{} statements over a budget of {}:\n{}'.format(
+            len(statements), budget, '\n'.join(statements))
+
+
+def count_table_seq_scans(setup_module, statements, table_name):
+    """Count the sequential scans of a table in the plans of statements."""
+
+    conn = setup_module.engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            return sum(
+                instrumentation.count_seq_scans(
+                    cursor, statement, table_name) or 0
+                for statement in statements
+            )
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('setup_synthetic_table', [4, 12], indirect=True)
+def test_query_budget(setup_module, setup_synthetic_table, query_log):
+    """Test profiling columns one by one stays within its query budget."""
+
+    n_columns = setup_synthetic_table
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table()
+
+    data_statements = get_statements(query_log, 'data')
+    assert_within_budget(data_statements, n_columns, 3, 6)
+    assert_within_budget(
+        get_statements(query_log, 'metabase', writes=True),
+        n_columns, 0, 12)
+    # Type inference and statistics, bounded counts of distinct values of
+    # the code and text half of the columns, and counting rows.
+    assert count_table_seq_scans(
+        setup_module, data_statements, 'synthetic') <= \
+        2 * n_columns + n_columns // 2 + 1
+
+
+@pytest.mark.parametrize('setup_synthetic_table', [4, 12], indirect=True)
+def test_query_budget_single_scan(setup_module, setup_synthetic_table,
+                                  query_log):
+    """Test profiling columns in one scan stays within its query budget."""
+
+    n_columns = setup_synthetic_table
+    with patch(
+            'metabase.extract_metadata.settings',
+            setup_module.mock_params):
+        extract = extract_metadata.ExtractMetadata(data_table_id=1)
+    extract.process_table(single_scan=True)
+
+    data_statements = get_statements(query_log, 'data')
+    # Bounded counts of distinct values of text columns.
+    assert_within_budget(data_statements, n_columns, 1, 8)
+    assert_within_budget(
+        get_statements(query_log, 'metabase', writes=True),
+        n_columns, 0, 12)
+    # Aggregates, codes, and counting rows, and bounded counts of distinct
+    # values of the code and text half of the columns.
+    assert count_table_seq_scans(
+        setup_module, data_statements, 'synthetic') <= n_columns // 2 + 3
@@ -44,6 +44,188 @@ def test_parse_command_line_args_table_file():
     assert 'my_file' == parsed_args.input_file
 
 
+def test_parse_command_line_args_single_scan():
+    """Test parsing command line flag single_scan."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--single_scan']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert parsed_args.single_scan
+
+
+def test_parse_command_line_args_estimate():
+    """Test parsing command line flags estimate and analyze."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--estimate', '--analyze']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert parsed_args.estimate
+    assert parsed_args.analyze
+
+
+def test_parse_command_line_args_quantile_method():
+    """Test parsing command line argument quantile_method."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--quantile_method', 'kll']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert 'kll' == parsed_args.quantile_method
+
+    with pytest.raises(SystemExit):
+        parse_input.parse_command_line_args(
+            ['-s', 'schema_1', '-t', 'table_1',
+             '--quantile_method', 'tdigest'])
+
+
+def test_parse_command_line_args_workers():
+    """Test parsing command line argument workers."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '-w', '4']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert 4 == parsed_args.workers
+
+
+def test_parse_command_line_args_max_codes():
+    """Test parsing command line argument max_codes."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--max_codes', '20']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert 20 == parsed_args.max_codes
+
+
+def test_parse_command_line_args_skip_unchanged():
+    """Test parsing command line flag skip_unchanged."""
+
+    args = ['--schema_all', 'schema_1', '--skip_unchanged']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert parsed_args.skip_unchanged
+
+
+def test_parse_command_line_args_watermark_column():
+    """Test parsing command line argument watermark_column."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--watermark_column', 'id']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert 'id' == parsed_args.watermark_column
+
+
+def test_parse_command_line_args_block_ranges():
+    """Test parsing command line argument block_ranges."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--block_ranges', '8']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert 8 == parsed_args.block_ranges
+
+
+def test_parse_command_line_args_checkpoint():
+    """Test parsing command line argument checkpoint."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--checkpoint']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert parsed_args.checkpoint
+
+
+def test_parse_command_line_args_resume():
+    """Test parsing command line argument resume."""
+
+    args = ['--resume', 'run_1']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert 'run_1' == parsed_args.resume
+
+
+def test_parse_command_line_args_resume_with_table():
+    """Test a run to resume cannot be given with a table."""
+
+    args = ['--resume', 'run_1', '-s', 'schema_1', '-t', 'table_1']
+
+    with pytest.raises(ValueError):
+        parse_input.parse_command_line_args(args)
+
+
+def test_parse_command_line_args_timing():
+    """Test parsing command line argument timing."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--timing']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert parsed_args.timing
+
+
+def test_parse_command_line_args_max_memory():
+    """Test parsing command line argument max memory."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--max_memory_mb', '64']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert 64 * 2**20 == parse_input.get_max_memory(parsed_args)
+
+
+def test_parse_command_line_args_exact_numeric():
+    """Test parsing command line argument exact numeric."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--exact_numeric']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert parsed_args.exact_numeric
+
+
+def test_parse_command_line_args_max_memory_positive():
+    """Test max memory must be positive."""
+
+    args = ['-s', 'schema_1', '-t', 'table_1', '--max_memory_mb', '0']
+
+    with pytest.raises(ValueError):
+        parse_input.parse_command_line_args(args)
+
+
+def test_parse_command_line_args_schema_all():
+    """Test parsing command line arguments for batch mode."""
+
+    args = ['--schema-all', 'schema_1', '--table_workers', '8']
+
+    parsed_args = parse_input.parse_command_line_args(args)
+
+    assert 'schema_1' == parsed_args.schema_all
+    assert 8 == parsed_args.table_workers
+
+
+def test_parse_command_line_args_schema_all_and_table():
+    """Test parsing invalid command line argugments."""
+
+    args = ['--schema_all', 'schema_1', '-s', 'schema_1', '-t', 'table_1']
+
+    with pytest.raises(ValueError):
+        parse_input.parse_command_line_args(args)
+
+
+def test_parse_manifest():
+    """Test parsing a manifest of tables."""
+
+    full_table_names = parse_input.parse_manifest('tests/manifest_1.txt')
+
+    assert ['schema_1.table_1', 'schema_1.table_2'] == full_table_names
+
+
 def test_parse_command_line_args_no_schema():
     """Test parsing invalid command line argugments."""
 
@@ -80,6 +262,28 @@ def test_parse_command_line_args_table_and_file():
         parse_input.parse_command_line_args(args)
 
 
+def test_parse_benchmark_args():
+    """Test parsing benchmark command line arguments."""
+
+    args = ['--rows', '1000', '1000000', '--mixes', 'text', 'native',
+            '--null_ratios', '0.5', '--repeat', '3']
+
+    parsed_args = parse_input.parse_benchmark_args(args)
+
+    assert [1000, 1000000] == parsed_args.rows
+    assert [8] == parsed_args.columns
+    assert ['text', 'native'] == parsed_args.mixes
+    assert [0.5] == parsed_args.null_ratios
+    assert 3 == parsed_args.repeat
+
+
+def test_parse_benchmark_args_null_ratio():
+    """Test a null ratio must be a probability."""
+
+    with pytest.raises(ValueError):
+        parse_input.parse_benchmark_args(['--null_ratios', '1.5'])
+
+
 def test_derive_full_table_name_command_line():
     """Test derive full table name from command line style arguments."""
 
@@ -0,0 +1,112 @@
+"""
+Tests for quantile_sketch.py
+
+"""
+
+import decimal
+import json
+import random
+
+import pytest
+
+from metabase import quantile_sketch
+
+
+def test_exact_quantiles():
+    """Test exact quantiles interpolate like PERCENTILE_CONT."""
+
+    sketch = quantile_sketch.get_quantile_sketch('exact')
+    assert sketch.median() is None
+
+    sketch.update_batch([4, 1, 3, 2])
+
+    assert 2.5 == sketch.median()
+    assert [1, 4] == sketch.quantiles([0, 1])
+
+
+def test_exact_quantiles_decimal():
+    """Test exact quantiles of decimals are interpolated as decimals."""
+
+    sketch = quantile_sketch.get_quantile_sketch('exact')
+    sketch.update_batch([decimal.Decimal('0.10'), decimal.Decimal('0.25')])
+
+    assert decimal.Decimal('0.175') == sketch.median()
+
+
+def test_kll_sketch_rank_error():
+    """Test KLL quantiles are within the rank error with bounded memory."""
+
+    n = 100000
+    values = list(range(n))
+    random.Random(0).shuffle(values)
+
+    sketch = quantile_sketch.KLLSketch(seed=0)
+    sketch.update_batch(values)
+
+    assert n == sketch.n
+    assert sketch.size <= 3 * sketch.k
+    max_error = 2 * quantile_sketch.KLLSketch.rank_error(sketch.k) * n
+    for q, value in zip([0.1, 0.5, 0.9], sketch.quantiles([0.1, 0.5, 0.9])):
+        assert abs(value - q * n) <= max_error
+
+
+def test_kll_sketch_update_batch():
+    """Test adding a batch of values is adding them one by one."""
+
+    values = list(range(20000))
+    random.Random(4).shuffle(values)
+
+    sketch = quantile_sketch.KLLSketch(seed=4)
+    sketch.update_batch(values)
+    other_sketch = quantile_sketch.KLLSketch(seed=4)
+    for value in values:
+        other_sketch.update(value)
+
+    assert other_sketch.n == sketch.n
+    assert other_sketch.compactors == sketch.compactors
+
+
+def test_kll_sketch_merge():
+    """Test merging KLL sketches of parts of a stream."""
+
+    n = 50000
+    values = list(range(n))
+    random.Random(1).shuffle(values)
+
+    sketch = quantile_sketch.KLLSketch(seed=1)
+    sketch.update_batch(values[:n // 2])
+    other_sketch = quantile_sketch.KLLSketch(seed=2)
+    other_sketch.update_batch(values[n // 2:])
+    sketch.merge(other_sketch)
+
+    assert n == sketch.n
+    max_error = 2 * quantile_sketch.KLLSketch.rank_error(sketch.k) * n
+    assert abs(sketch.median() - n / 2) <= max_error
+
+
+def test_kll_sketch_to_dict():
+    """Test a KLL sketch restored from its state keeps quantiles and grows."""
+
+    values = list(range(20000))
+    random.Random(3).shuffle(values)
+
+    sketch = quantile_sketch.KLLSketch(seed=3)
+    sketch.update_batch(values[:10000])
+    restored_sketch = quantile_sketch.KLLSketch.from_dict(
+        json.loads(json.dumps(sketch.to_dict())))
+
+    assert sketch.n == restored_sketch.n
+    assert sketch.quantiles([0.1, 0.5, 0.9]) == \
+        restored_sketch.quantiles([0.1, 0.5, 0.9])
+
+    restored_sketch.update_batch(values[10000:])
+    assert 20000 == restored_sketch.n
+    max_error = 2 * quantile_sketch.KLLSketch.rank_error(sketch.k) * 20000
+    assert abs(restored_sketch.median() - 10000) <= max_error
+
+
+def test_get_quantile_sketch_unknown():
+    """Test an unknown quantile method is rejected."""
+
+    with pytest.raises(ValueError):
+        quantile_sketch.get_quantile_sketch('tdigest')